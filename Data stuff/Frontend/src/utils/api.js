@@ -0,0 +1,60 @@
+// Client for the pre-aggregated dashboard API served by the Flask app (dashboard_data.py)
+const API_URL = window.location.hostname === 'localhost'
+  ? 'http://localhost:5000/api/dashboard'
+  : `http://${window.location.hostname}:5000/api/dashboard`;
+
+// Build a query string, expanding `filters` ({ column: value }) into repeated filter=column:value
+const buildQuery = (params = {}) => {
+  const search = new URLSearchParams();
+  Object.entries(params).forEach(([key, value]) => {
+    if (value === undefined || value === null || value === '') return;
+    if (key === 'filters') {
+      Object.entries(value).forEach(([column, filterValue]) => {
+        search.append('filter', `${column}:${filterValue}`);
+      });
+    } else if (Array.isArray(value)) {
+      search.set(key, value.join(','));
+    } else {
+      search.set(key, value);
+    }
+  });
+  const query = search.toString();
+  return query ? `?${query}` : '';
+};
+
+const request = async (path, params) => {
+  const response = await fetch(`${API_URL}${path}${buildQuery(params)}`, {
+    mode: 'cors',
+    credentials: 'omit'
+  });
+
+  if (!response.ok) {
+    let message = `HTTP error! status: ${response.status}`;
+    try {
+      const error = await response.json();
+      message = error.message || message;
+    } catch {
+      // Keep the status message
+    }
+    throw new Error(message);
+  }
+
+  return response.json();
+};
+
+export const dashboardApi = {
+  // Row count, time range, metrics and dimensions of the dataset
+  getSchema: () => request('/schema'),
+
+  // { metric, agg, bucket, groupBy, maxPoints, start, end, filters }
+  getTimeSeries: ({ groupBy, maxPoints, ...params } = {}) =>
+    request('/timeseries', { ...params, group_by: groupBy, max_points: maxPoints }),
+
+  // { dimension, metric, agg, k, start, end, filters }
+  getTopK: (params = {}) => request('/topk', params),
+
+  // { dimensions: [...], metric, agg, start, end, filters }
+  getGroupBy: (params = {}) => request('/groupby', params)
+};
+
+export default dashboardApi;
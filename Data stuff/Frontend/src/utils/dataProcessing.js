@@ -0,0 +1,46 @@
+// Helpers that shape pre-aggregated API responses for the dashboard components.
+// The heavy lifting happens on the server; these only map small payloads to chart props.
+
+// Time series response -> [{ label, [seriesName]: value, ... }] rows for line/area charts
+export const toChartRows = (timeseries) => {
+  if (!timeseries || !timeseries.labels) return [];
+  return timeseries.labels.map((label, index) => {
+    const row = { label };
+    timeseries.series.forEach((series) => {
+      row[series.name] = series.values[index] ?? 0;
+    });
+    return row;
+  });
+};
+
+// Top-k response -> [{ name, value, percent }] slices for pie/donut charts and ranked lists
+export const toShares = (topK) => {
+  if (!topK || !topK.items) return [];
+  const items = topK.other
+    ? [...topK.items, { name: 'Other', ...topK.other }]
+    : topK.items;
+  const total = items.reduce((sum, item) => sum + item.value, 0);
+  return items.map((item) => ({
+    name: item.name,
+    value: item.value,
+    percent: total > 0 ? (item.value / total) * 100 : 0
+  }));
+};
+
+// Scale values into a pixel range, e.g. bar heights for the population charts
+export const scaleToRange = (values, maxPixels) => {
+  const max = Math.max(0, ...values.filter((v) => v !== null));
+  return values.map((v) => (max > 0 && v !== null ? (v / max) * maxPixels : 0));
+};
+
+// Group-by response with two dimensions -> { [first]: { [second]: value } } for grouped bars
+export const toNestedGroups = (groupBy) => {
+  if (!groupBy || !groupBy.rows) return {};
+  const [outer, inner] = groupBy.dimensions;
+  return groupBy.rows.reduce((acc, row) => {
+    const key = row[outer];
+    acc[key] = acc[key] || {};
+    acc[key][inner ? row[inner] : 'value'] = row.value;
+    return acc;
+  }, {});
+};
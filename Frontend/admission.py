@@ -0,0 +1,180 @@
+"""
+Admission control for the Flask app.
+
+A dashboard stuck in a fast polling loop or a script hammering an endpoint must
+not starve the grader of CPU and file I/O. Every request is put in a class by
+its route, and each class has a token bucket per client (remote address): a
+client may burst up to BURST requests and then RATE per second. Reading and
+exporting results is expensive, so those routes also share a global limit on
+requests in progress. A request over either limit is turned away at once with
+429 Too Many Requests and a Retry-After header, before any work is done.
+
+    poll     /status, /health and other cheap status reads: generous buckets and
+             no concurrency limit, so they stay fast under overload
+    read     reports, results streams, exports, analytics and the dashboard
+    write    uploads, starting, cancelling and regrading evaluations
+
+Limits are per process; with several gunicorn workers each enforces its own.
+Admitted and rejected requests are counted per class and served from
+/api/admission.
+
+Configuration (environment):
+    ADMISSION_CONTROL        set to 0 to admit every request
+    ADMISSION_READ_CONCURRENCY  read requests in progress at once, default 4
+    ADMISSION_TRUST_PROXY    set to 1 to identify clients by X-Forwarded-For
+                             (only behind a proxy that sets it)
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, jsonify, request
+
+ADMISSION_CONFIG = {
+    "ENABLED": os.environ.get("ADMISSION_CONTROL", "1") != "0",
+    "TRUST_PROXY": os.environ.get("ADMISSION_TRUST_PROXY") == "1",
+    # Class: (requests per second, burst, requests in progress at once or None)
+    "LIMITS": {
+        "poll": (10.0, 40, None),
+        "read": (2.0, 20, int(os.environ.get("ADMISSION_READ_CONCURRENCY", "4"))),
+        "write": (2.0, 30, None)
+    },
+    # Buckets kept; the least recently seen clients are forgotten first
+    "MAX_CLIENTS": 10000
+}
+
+# Route endpoints by class; blueprints by their name. Unlisted endpoints are polls.
+ROUTE_CLASSES = {
+    "read": (
+        "get_evaluation_results", "view_results", "view_results_index", "view_student_results",
+        "download_results", "export_results", "get_students_results", "get_analytics",
+        "plan_evaluation", "list_rubrics", "dashboard"
+    ),
+    "write": ("upload_file", "start_evaluation", "regrade", "cancel_evaluation")
+}
+
+
+class TokenBucket:
+    """Requests a client may still make: refills at rate per second up to burst"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self, now):
+        """Spend one token; returns 0 when admitted, else the seconds until one is available"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionController:
+    """Per-client token buckets and per-class concurrency limits, checked before each request"""
+
+    def __init__(self, limits=None, max_clients=None, trust_proxy=None):
+        self.limits = limits or ADMISSION_CONFIG["LIMITS"]
+        self.max_clients = max_clients or ADMISSION_CONFIG["MAX_CLIENTS"]
+        self.trust_proxy = ADMISSION_CONFIG["TRUST_PROXY"] if trust_proxy is None else trust_proxy
+        self.endpoint_classes = {
+            endpoint: name for name, endpoints in ROUTE_CLASSES.items() for endpoint in endpoints
+        }
+        self._buckets = OrderedDict()
+        self._in_progress = {name: 0 for name in self.limits}
+        self._counters = {name: {"admitted": 0, "rateLimited": 0, "busy": 0} for name in self.limits}
+        self._lock = threading.Lock()
+
+    def classify(self, endpoint):
+        if not endpoint:
+            return "poll"
+        name = self.endpoint_classes.get(endpoint) or self.endpoint_classes.get(endpoint.split(".")[0])
+        return name or "poll"
+
+    def client(self):
+        if self.trust_proxy and request.headers.get("X-Forwarded-For"):
+            return request.headers["X-Forwarded-For"].split(",")[0].strip()
+        return request.remote_addr or "unknown"
+
+    def admit(self, kind, client):
+        """Reserve a request of a class for a client; returns 0 when admitted, else seconds to retry after"""
+        rate, burst, concurrency = self.limits[kind]
+        now = time.monotonic()
+        with self._lock:
+            key = (kind, client)
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(rate, burst)
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            counters = self._counters[kind]
+            wait = bucket.take(now)
+            if wait:
+                counters["rateLimited"] += 1
+                return wait
+            if concurrency is not None and self._in_progress[kind] >= concurrency:
+                # Not the client's fault: give the token back
+                bucket.tokens += 1
+                counters["busy"] += 1
+                return 1.0
+            if concurrency is not None:
+                self._in_progress[kind] += 1
+            counters["admitted"] += 1
+            return 0
+
+    def release(self, kind):
+        """End a request of a class with a concurrency limit"""
+        with self._lock:
+            self._in_progress[kind] -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": True,
+                "clients": len(self._buckets),
+                "classes": {
+                    name: dict(self._counters[name], inProgress=self._in_progress[name],
+                               rate=rate, burst=burst, concurrency=concurrency)
+                    for name, (rate, burst, concurrency) in self.limits.items()
+                }
+            }
+
+    def init_app(self, app):
+        """Check every request of app before its view runs"""
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        if request.method == "OPTIONS":
+            return None
+        kind = self.classify(request.endpoint)
+        wait = self.admit(kind, self.client())
+        if wait:
+            response = jsonify({"status": "error", "message": "Too many requests, try again later"})
+            response.status_code = 429
+            response.headers["Retry-After"] = str(max(1, math.ceil(wait)))
+            return response
+        if self.limits[kind][2] is not None:
+            g.admission_class = kind
+        return None
+
+    def _after_request(self, response):
+        kind = g.pop("admission_class", None)
+        if kind is not None:
+            # A streamed body is still being produced; the request ends when the response closes
+            response.call_on_close(lambda: self.release(kind))
+        return response
+
+    def _teardown_request(self, error=None):
+        # after_request did not run (the request failed before a response was made)
+        kind = g.pop("admission_class", None)
+        if kind is not None:
+            self.release(kind)
@@ -0,0 +1,236 @@
+"""
+Incrementally maintained cohort analytics.
+
+Follows the evaluation records journal written by the grader and folds each new
+record into per-cohort NumPy arrays (count, sum, sum of squares and histogram per
+question, plus the raw scores for percentiles). A request only reads the lines
+appended since the previous one, so the aggregates stay current while a run is in
+progress without ever being recomputed from scratch. A new run replaces the
+journal, which resets the aggregates. A later record for an item that was
+already graded (an upload graded again) replaces the earlier grade.
+"""
+import json
+import os
+import threading
+
+import numpy as np
+
+# Structured results written by auto_checker_v3.py
+RECORDS_FILE = "evaluation_records.jsonl"
+
+# Histogram bins: ten 10-point buckets, the last one including 100
+HISTOGRAM_EDGES = np.linspace(0, 100, 11)
+PERCENTILES = (10, 25, 50, 75, 90)
+
+COHORT_FIELDS = ("Subject", "Year", "Semester")
+
+
+def _summary(count, total, total_sq, histogram, scores):
+    """Turn raw accumulators into the JSON summary for one group of scores"""
+    if count == 0:
+        return {"count": 0, "mean": None, "std": None, "percentiles": None,
+                "histogram": {"edges": HISTOGRAM_EDGES.tolist(), "counts": histogram.tolist()}}
+    mean = total / count
+    variance = max(0.0, total_sq / count - mean * mean)
+    return {
+        "count": int(count),
+        "mean": round(float(mean), 2),
+        "std": round(float(np.sqrt(variance)), 2),
+        "percentiles": {
+            f"p{p}": round(float(v), 2)
+            for p, v in zip(PERCENTILES, np.percentile(scores, PERCENTILES))
+        },
+        "histogram": {"edges": HISTOGRAM_EDGES.tolist(), "counts": histogram.tolist()}
+    }
+
+
+class CohortStats:
+    """Per-question score accumulators for one (subject, year, semester) cohort"""
+
+    def __init__(self, key):
+        self.key = key
+        self.question_numbers = []
+        self.question_texts = []
+        self._columns = {}
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.sums = np.zeros(0)
+        self.sums_sq = np.zeros(0)
+        self.histograms = np.zeros((0, len(HISTOGRAM_EDGES) - 1), dtype=np.int64)
+        # Raw scores and their question columns, grown geometrically
+        self._scores = np.zeros(64)
+        self._columns_of_scores = np.zeros(64, dtype=np.int32)
+        self.size = 0
+        self.students = set()
+        # (student, question number) -> slot in the raw scores, None if never graded
+        self._items = {}
+        self.ungraded = 0
+
+    def _column(self, question_number, question_text):
+        column = self._columns.get(question_number)
+        if column is None:
+            column = len(self.question_numbers)
+            self._columns[question_number] = column
+            self.question_numbers.append(question_number)
+            self.question_texts.append(question_text)
+            self.counts = np.append(self.counts, 0)
+            self.sums = np.append(self.sums, 0.0)
+            self.sums_sq = np.append(self.sums_sq, 0.0)
+            self.histograms = np.vstack([self.histograms, np.zeros((1, self.histograms.shape[1]), dtype=np.int64)])
+        return column
+
+    def _accumulate(self, column, score, sign):
+        self.counts[column] += sign
+        self.sums[column] += sign * score
+        self.sums_sq[column] += sign * score * score
+        bucket = min(int(score // 10), self.histograms.shape[1] - 1)
+        self.histograms[column, max(bucket, 0)] += sign
+
+    def add(self, record):
+        """Fold one evaluation record into the aggregates"""
+        student = record.get("Student Name")
+        item = (student, record.get("Question Number"))
+        self.students.add(student)
+
+        # Take back an earlier grade of the same item; its raw score slot is reused
+        position = self._items.get(item)
+        if item in self._items:
+            if position is None or self._columns_of_scores[position] < 0:
+                self.ungraded -= 1
+            else:
+                self._accumulate(self._columns_of_scores[position], self._scores[position], -1)
+
+        score = record.get("Score")
+        if not isinstance(score, (int, float)) or isinstance(score, bool):
+            self.ungraded += 1
+            if position is not None:
+                self._columns_of_scores[position] = -1
+            self._items[item] = position
+            return
+
+        column = self._column(record.get("Question Number"), record.get("Question", ""))
+        self._accumulate(column, score, 1)
+
+        if position is None:
+            if self.size == len(self._scores):
+                self._scores = np.resize(self._scores, self.size * 2)
+                self._columns_of_scores = np.resize(self._columns_of_scores, self.size * 2)
+            position = self.size
+            self.size += 1
+        self._scores[position] = score
+        self._columns_of_scores[position] = column
+        self._items[item] = position
+
+    def scores(self):
+        """Current raw scores, leaving out slots whose item was regraded as ungraded"""
+        return self._scores[:self.size][self._columns_of_scores[:self.size] >= 0]
+
+    def question_summaries(self):
+        """Summaries for every question of this cohort, in first-seen order"""
+        scores = self._scores[:self.size]
+        columns = self._columns_of_scores[:self.size]
+        subject, year, semester = self.key
+        summaries = []
+        for column, number in enumerate(self.question_numbers):
+            summary = _summary(
+                self.counts[column], self.sums[column], self.sums_sq[column],
+                self.histograms[column], scores[columns == column]
+            )
+            summary.update({
+                "subject": subject,
+                "year": year,
+                "semester": semester,
+                "questionNumber": number,
+                "question": self.question_texts[column]
+            })
+            summaries.append(summary)
+        return summaries
+
+
+class AnalyticsIndex:
+    """Tails the records journal and keeps per-cohort statistics up to date"""
+
+    def __init__(self, records_file=RECORDS_FILE):
+        self.records_file = records_file
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self, inode=None):
+        self._cohorts = {}
+        self._offset = 0
+        self._inode = inode
+
+    def refresh(self):
+        """Fold in records appended since the last call"""
+        with self._lock:
+            try:
+                stat = os.stat(self.records_file)
+            except OSError:
+                self._reset()
+                return
+            # A replaced or truncated journal means a new run started
+            if stat.st_ino != self._inode or stat.st_size < self._offset:
+                self._reset(stat.st_ino)
+            if stat.st_size == self._offset:
+                return
+
+            with open(self.records_file, "rb") as f:
+                f.seek(self._offset)
+                for line in f:
+                    # Stop at a line the grader has not finished writing
+                    if not line.endswith(b"\n"):
+                        break
+                    self._offset += len(line)
+                    if line.strip():
+                        self._add(json.loads(line))
+
+    def _add(self, record):
+        key = tuple(str(record.get(field, "Unknown")) for field in COHORT_FIELDS)
+        cohort = self._cohorts.get(key)
+        if cohort is None:
+            cohort = self._cohorts[key] = CohortStats(key)
+        cohort.add(record)
+
+    def query(self, subject=None, year=None, semester=None, top=5):
+        """Aggregate the cohorts matching the filters; empty filters match everything"""
+        self.refresh()
+        filters = [str(v).strip().lower() if v else None for v in (subject, year, semester)]
+        with self._lock:
+            cohorts = [
+                cohort for key, cohort in self._cohorts.items()
+                if all(f is None or f == k.lower() for f, k in zip(filters, key))
+            ]
+
+            questions = []
+            for cohort in cohorts:
+                questions.extend(cohort.question_summaries())
+
+            if cohorts:
+                overall = _summary(
+                    sum(int(c.counts.sum()) for c in cohorts),
+                    sum(float(c.sums.sum()) for c in cohorts),
+                    sum(float(c.sums_sq.sum()) for c in cohorts),
+                    sum(c.histograms.sum(axis=0) for c in cohorts),
+                    np.concatenate([c.scores() for c in cohorts])
+                )
+            else:
+                overall = _summary(0, 0.0, 0.0, np.zeros(len(HISTOGRAM_EDGES) - 1, dtype=np.int64), np.zeros(0))
+
+            return {
+                "filters": {"subject": subject, "year": year, "semester": semester},
+                "cohorts": [
+                    {
+                        "subject": c.key[0],
+                        "year": c.key[1],
+                        "semester": c.key[2],
+                        "students": len(c.students),
+                        "graded": int(c.counts.sum()),
+                        "ungraded": c.ungraded
+                    }
+                    for c in cohorts
+                ],
+                "overall": overall,
+                "questions": questions,
+                "hardestQuestions": sorted(
+                    (q for q in questions if q["mean"] is not None), key=lambda q: q["mean"]
+                )[:top]
+            }
@@ -1,16 +1,30 @@
 import os
+import re
 import json
+import hashlib
 import subprocess
 import threading
 import logging
+import math
 import socket
 import time
 from datetime import datetime  # Add this import at the top level
-from flask import Flask, render_template, jsonify, request, send_file, make_response
+from flask import Flask, render_template, jsonify, request, send_file, make_response, Response, stream_with_context
 from flask_cors import CORS
 import copy
-from bs4 import BeautifulSoup
-
+from serialization import dump_json_bytes
+from job_store import HEARTBEAT_SECONDS, create_job_store
+from rubrics import registry as rubric_registry, rubric_key, RubricError
+from report_pages import ReportRenderer
+from dashboard_routes import dashboard_bp
+from model_warmup import model_keeper, OLLAMA_CONFIG
+from upload_pipeline import UploadPipeline
+from cohort_input import COHORT_EXTENSIONS
+from report_writer import PARTIAL_EXIT_CODE, append_record, write_report_file
+from priority_lane import PriorityLane
+from results_export import ResultsExporter, ExportError, FORMATS as EXPORT_FORMATS, TABLES as EXPORT_TABLES
+from admission import ADMISSION_CONFIG, AdmissionController
+from retention import RETENTION_CONFIG, RetentionTask, UploadStore
 
 # Configure logging
 logging.basicConfig(
@@ -20,17 +34,73 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def parse_deadline(value):
+    """Seconds of a whole-job deadline; raises ValueError unless it is a positive finite number"""
+    deadline = float(value)
+    if not math.isfinite(deadline) or deadline <= 0:
+        raise ValueError("deadline must be a positive number of seconds")
+    return deadline
+
+
 # Application configuration
 APP_CONFIG = {
     "AUTO_CHECKER_SCRIPT": "auto_checker_v3.py",
     "RESULTS_FILE": "evaluation_results.html",
     "JSON_RESULTS_FILE": "evaluation_results.json",
-    "UPLOAD_FOLDER": "student_answers"
+    "RECORDS_FILE": "evaluation_records.jsonl",
+    "UPLOAD_FOLDER": "student_answers",
+    # Set EVALUATION_STATE_DB to share job state between gunicorn workers
+    "STATE_DB": os.environ.get("EVALUATION_STATE_DB"),
+    # "thread" runs jobs inside the web process, "queue" hands them to evaluation_worker.py
+    "JOB_MODE": os.environ.get("EVALUATION_JOB_MODE", "thread"),
+    # Set EVALUATION_PIPELINE=1 to grade each upload as soon as it arrives
+    "PIPELINE": os.environ.get("EVALUATION_PIPELINE") == "1",
+    # Default whole-job deadline in seconds (EVALUATION_JOB_DEADLINE); unset means no deadline
+    "JOB_DEADLINE": parse_deadline(os.environ["EVALUATION_JOB_DEADLINE"]) if os.environ.get("EVALUATION_JOB_DEADLINE") else None,
+    # Grading order of the auto checker (EVALUATION_SCHEDULE): "student" or "question", which
+    # shares the prompt prefix between consecutive calls so Ollama can reuse its prompt cache
+    "SCHEDULE": os.environ.get("EVALUATION_SCHEDULE", "student"),
+    # Set EVALUATION_SEMANTIC_CACHE=1 to reuse the grades of near-identical earlier answers
+    "SEMANTIC_CACHE": os.environ.get("EVALUATION_SEMANTIC_CACHE") == "1",
+    # Seconds between checks for a cancel request while the grader runs
+    "CANCEL_POLL_SECONDS": 1.0,
+    # Seconds a stopped grader gets to write its partial report before it is killed
+    "STOP_GRACE_SECONDS": 30,
+    # Latency target of a single-answer regrade in seconds (EVALUATION_REGRADE_TIMEOUT)
+    "REGRADE_TIMEOUT": float(os.environ.get("EVALUATION_REGRADE_TIMEOUT", "120")),
+    # Regrades graded at the same time; more wait for a slot within the latency target
+    "REGRADE_CONCURRENCY": 2
 }
 
+
 # Initialize Flask app
 app = Flask(__name__, template_folder='templates', static_folder='static')
 
+# Pre-aggregated series for the "Data stuff" dashboard
+app.register_blueprint(dashboard_bp)
+
+# Per-client rate limits and a cap on expensive reads in progress, answered with 429 (see admission.py)
+admission = AdmissionController() if ADMISSION_CONFIG["ENABLED"] else None
+if admission:
+    admission.init_app(app)
+
+# Load the grading model in the background so the first job skips the cold start. The
+# warm-up starts with the first request, like the upload pipeline below, so evaluation
+# workers and the reloader parent, which import this module but serve nothing, do not
+# load and pin the model.
+if OLLAMA_CONFIG["WARMUP_ON_START"]:
+    warm_up_lock = threading.Lock()
+    warm_up_started = False
+
+    @app.before_request
+    def start_model_warm_up():
+        global warm_up_started
+        with warm_up_lock:
+            if warm_up_started:
+                return
+            warm_up_started = True
+        model_keeper.start_warm_up()
+
 # Determine if we're in development or production
 is_dev = socket.gethostname() == socket.gethostname()  # This will always be true, making CORS more permissive for development
 
@@ -56,76 +126,250 @@ def after_request(response):
         response.headers.set('Access-Control-Allow-Methods', 'GET,POST,PUT,DELETE,OPTIONS')
     return response
 
-# Global variable to track evaluation status
-evaluation_status = {
-    "running": False,
-    "complete": False,
-    "progress": 0,
-    "message": "",
-    "error": None
-}
+# Paginated report pages rendered from the structured records, cached per student
+report_renderer = ReportRenderer(APP_CONFIG["RECORDS_FILE"])
 
-def run_auto_checker():
-    """Run the auto checker script in a separate thread"""
-    global evaluation_status
-    
+# Cohort statistics, updated incrementally from the same records; NumPy loads with the first query
+_analytics_index = None
+_analytics_lock = threading.Lock()
+
+
+def get_analytics_index():
+    global _analytics_index
+    with _analytics_lock:
+        if _analytics_index is None:
+            from analytics import AnalyticsIndex
+            _analytics_index = AnalyticsIndex(APP_CONFIG["RECORDS_FILE"])
+        return _analytics_index
+
+# Normalized Parquet/Arrow tables of the same records for analysts
+results_exporter = ResultsExporter(APP_CONFIG["RECORDS_FILE"])
+
+# Single-answer regrades run in the web process, ahead of bulk grading (see priority_lane.py)
+priority_lane = PriorityLane()
+regrade_slots = threading.BoundedSemaphore(APP_CONFIG["REGRADE_CONCURRENCY"])
+
+# Evaluation job state, shared across processes when a state database is configured
+job_store = create_job_store(APP_CONFIG["STATE_DB"])
+
+if APP_CONFIG["JOB_MODE"] == "queue" and not APP_CONFIG["STATE_DB"]:
+    logger.warning("EVALUATION_JOB_MODE=queue needs EVALUATION_STATE_DB; running jobs in-process instead")
+    APP_CONFIG["JOB_MODE"] = "thread"
+
+def auto_checker_command(exam=None, files=None, deadline=None):
+    """Build the auto checker command line, selecting the exam's rubric when one is given
+
+    With files, only those uploads are graded and added to the current records.
+    """
+    command = ["python", APP_CONFIG["AUTO_CHECKER_SCRIPT"]]
+    for field in ("subject", "year", "semester"):
+        if exam and exam.get(field):
+            command += [f"--{field}", str(exam[field])]
+    if deadline:
+        command += ["--deadline", str(deadline)]
+    if APP_CONFIG["SCHEDULE"] != "student":
+        command += ["--schedule", APP_CONFIG["SCHEDULE"]]
+    if APP_CONFIG["SEMANTIC_CACHE"]:
+        command.append("--semantic-cache")
+    # Every grading call renews the model's expiry, so the calls carry the keeper's pin
+    command.append(f"--keep-alive={model_keeper.current_keep_alive()}")
+    if files:
+        command += ["--append", "--files"] + list(files)
+    return command
+
+
+def deadline_from_request():
+    """Read the optional whole-job deadline in seconds, falling back to the configured default"""
+    data = request.get_json(silent=True) or {}
+    value = data.get("deadline") or request.args.get("deadline")
+    if not value:
+        return APP_CONFIG["JOB_DEADLINE"]
+    return parse_deadline(value)
+
+
+def wait_for_grader(job_id, process, deadline=None):
+    """Wait for the grader while honouring cancel requests and the job deadline
+
+    A cancel request or the deadline sends SIGTERM; the grader then marks the
+    remaining items as not graded and exits. It is killed if it has not exited
+    STOP_GRACE_SECONDS later. The job gets a heartbeat every HEARTBEAT_SECONDS
+    while the grader runs, so long runs are not taken for abandoned ones.
+    Returns (stdout, stderr, cancelled).
+    """
+    started = time.monotonic()
+    heartbeat_at = started + HEARTBEAT_SECONDS
+    cancelled = False
+    kill_at = started + deadline + APP_CONFIG["STOP_GRACE_SECONDS"] if deadline else None
+    while True:
+        try:
+            stdout, stderr = process.communicate(timeout=APP_CONFIG["CANCEL_POLL_SECONDS"])
+            return stdout, stderr, cancelled
+        except subprocess.TimeoutExpired:
+            pass
+        now = time.monotonic()
+        if now >= heartbeat_at:
+            job_store.touch(job_id)
+            heartbeat_at = now + HEARTBEAT_SECONDS
+        if not cancelled and job_store.status(job_id)["cancelled"]:
+            logger.info(f"Cancelling evaluation job {job_id}")
+            cancelled = True
+            process.terminate()
+            kill_at = min(kill_at or float("inf"), now + APP_CONFIG["STOP_GRACE_SECONDS"])
+        if kill_at is not None and now >= kill_at:
+            logger.warning(f"Evaluation job {job_id} did not stop in time; killing the grader")
+            process.kill()
+            kill_at = None
+
+
+def exam_from_request():
+    """Read the optional subject/year/semester of an evaluation request"""
+    data = request.get_json(silent=True) or {}
+    exam = {field: data.get(field) or request.args.get(field) for field in ("subject", "year", "semester")}
+    if rubric_key(**exam) is None:
+        return None
+    return exam
+
+
+def run_auto_checker(job_id=None, exam=None, files=None, deadline=None):
+    """Run the auto checker script for a job that has already been started or claimed"""
+    # Keep the model loaded for as long as the job runs
+    model_keeper.job_started()
     try:
         # Update status
-        evaluation_status.update({
-            "running": True,
-            "complete": False,
-            "progress": 0,
-            "message": "Starting evaluation...",
-            "error": None
-        })
+        job_store.update(
+            job_id,
+            running=True,
+            complete=False,
+            progress=0,
+            message="Starting evaluation...",
+            error=None
+        )
         
         logger.info("Starting evaluation process...")
         
         # Simulate progress updates
         def update_progress():
             for i in range(1, 11):
-                if not evaluation_status["running"]:
+                if not job_store.status(job_id)["running"]:
                     break
-                evaluation_status["progress"] = i * 10
-                evaluation_status["message"] = f"Processing answers... ({i*10}% complete)"
+                job_store.update(
+                    job_id,
+                    progress=i * 10,
+                    message=f"Processing answers... ({i*10}% complete)"
+                )
                 time.sleep(2)
                 
         progress_thread = threading.Thread(target=update_progress)
         progress_thread.daemon = True
         progress_thread.start()
         
-        # Run the auto_checker script
-        result = subprocess.run(
-            ["python", APP_CONFIG["AUTO_CHECKER_SCRIPT"]], 
-            capture_output=True, 
-            text=True, 
-            check=True
-        )
+        # Run the auto_checker script; it can be cancelled and stops at the deadline
+        command = auto_checker_command(exam, files, deadline)
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        stdout, stderr, cancelled = wait_for_grader(job_id, process, deadline)
         
+        if process.returncode not in (0, PARTIAL_EXIT_CODE):
+            if cancelled:
+                job_store.update(job_id, message="Evaluation cancelled")
+                logger.info("Evaluation cancelled before the grader wrote its report")
+                return
+            raise subprocess.CalledProcessError(process.returncode, command, stdout, stderr)
+        
+        # The grader stopped early: ungraded items are marked as such in the report
+        if process.returncode == PARTIAL_EXIT_CODE:
+            reason = "cancelled" if cancelled else "stopped at its deadline"
+            message = f"Evaluation {reason}; partial results saved, remaining items marked as not graded"
+        else:
+            message = "Evaluation completed successfully!"
+        
+        # Uploads graded by the pipeline only add to the records journal
+        if files:
+            job_store.update(
+                job_id,
+                complete=True,
+                progress=100,
+                message=f"Graded {len(files)} uploaded file(s)" if process.returncode == 0 else message
+            )
+            logger.info(f"Pipeline graded {', '.join(files)}")
         # Check if results file exists
-        if os.path.exists(APP_CONFIG["RESULTS_FILE"]):
+        elif os.path.exists(APP_CONFIG["RESULTS_FILE"]):
             # Generate JSON from the HTML results
             generate_json_results()
             
-            evaluation_status["complete"] = True
-            evaluation_status["progress"] = 100
-            evaluation_status["message"] = "Evaluation completed successfully!"
-            logger.info("Evaluation completed successfully")
+            job_store.update(
+                job_id,
+                complete=True,
+                progress=100,
+                message=message
+            )
+            logger.info(message)
         else:
             error_msg = "Evaluation completed but results file not found."
-            evaluation_status["error"] = error_msg
+            job_store.update(job_id, error=error_msg)
             logger.error(error_msg)
             
     except subprocess.CalledProcessError as e:
         error_msg = f"Error running evaluation: {e.stderr}"
-        evaluation_status["error"] = error_msg
+        job_store.update(job_id, error=error_msg)
         logger.error(error_msg)
     except Exception as e:
         error_msg = f"Unexpected error: {str(e)}"
-        evaluation_status["error"] = error_msg
+        job_store.update(job_id, error=error_msg)
         logger.error(error_msg, exc_info=True)
     finally:
-        evaluation_status["running"] = False
+        job_store.update(job_id, running=False)
+        model_keeper.job_finished()
+
+
+def run_pipeline_batch(exam, files):
+    """Grade a batch of uploads as a job; returns its id, or None while another job is active"""
+    params = {"exam": exam, "files": files, "deadline": APP_CONFIG["JOB_DEADLINE"]}
+    if APP_CONFIG["JOB_MODE"] == "queue":
+        job_id = job_store.enqueue(params=params)
+        if job_id is not None:
+            model_keeper.start_warm_up()
+        return job_id
+    
+    job_id = job_store.begin(message=f"Grading {len(files)} uploaded file(s)...", params=params)
+    if job_id is None:
+        return None
+    run_auto_checker(job_id, exam, files, APP_CONFIG["JOB_DEADLINE"])
+    return job_id
+
+
+# Grade uploads as they arrive instead of waiting for /start_evaluation. The watcher
+# starts with the first request so the reloader parent and evaluation workers, which
+# import this module but serve nothing, do not grade the same files.
+upload_pipeline = None
+if APP_CONFIG["PIPELINE"]:
+    os.makedirs(APP_CONFIG["UPLOAD_FOLDER"], exist_ok=True)
+    upload_pipeline = UploadPipeline(APP_CONFIG["UPLOAD_FOLDER"], run_pipeline_batch, job_status=job_store.status)
+
+    @app.before_request
+    def start_upload_pipeline():
+        upload_pipeline.start()
+
+
+# Uploads of inactive cohorts move to per-cohort archives and are read from there on demand;
+# the records journal is compacted in the same rounds (see retention.py)
+upload_store = UploadStore(APP_CONFIG["UPLOAD_FOLDER"])
+retention_task = None
+if RETENTION_CONFIG["ENABLED"]:
+    def uploads_in_pipeline():
+        if upload_pipeline is None:
+            return ()
+        status = upload_pipeline.status()
+        return status["pending"] + status["grading"]
+
+    retention_task = RetentionTask(
+        upload_store, APP_CONFIG["RECORDS_FILE"],
+        is_busy=lambda: job_store.status()["running"], pending=uploads_in_pipeline
+    )
+
+    # Started with the first request, like the upload pipeline, so only serving processes run it
+    @app.before_request
+    def start_retention():
+        retention_task.start()
 
 
 def generate_json_results():
@@ -140,7 +384,8 @@ def generate_json_results():
         with open(APP_CONFIG["RESULTS_FILE"], 'r', encoding='utf-8') as f:
             html_content = f.read()
             
-        # Use BeautifulSoup to parse HTML
+        # Use BeautifulSoup to parse HTML; imported here since only the legacy HTML paths need it
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(html_content, 'html.parser')
         
         # Extract metadata with better error handling
@@ -174,7 +419,6 @@ def generate_json_results():
         if score_element:
             try:
                 score_text = score_element.text.strip()
-                import re
                 
                 # Try different score patterns
                 # Look for "85/100" format first
@@ -218,7 +462,6 @@ def generate_json_results():
         # If no sections found with CSS selectors, try looking for patterns in the HTML
         if not question_sections:
             # Try to find sections with question numbers
-            import re
             question_pattern = re.compile(r'Question\s+\d+|Q\d+:|Q\.\s*\d+', re.IGNORECASE)
             potential_sections = []
             
@@ -253,7 +496,6 @@ def generate_json_results():
                 # Extract question number with improved patterns
                 question_number = i + 1
                 if question_text:
-                    import re
                     patterns = [
                         r'Question\s*(\d+)',
                         r'Q\.?\s*(\d+)',
@@ -482,7 +724,8 @@ def parse_html_results(html_file_path=None):
         with open(file_path, 'r', encoding='utf-8') as f:
             html_content = f.read()
             
-        # Use BeautifulSoup to parse HTML
+        # Use BeautifulSoup to parse HTML; imported here since only the legacy HTML paths need it
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(html_content, 'html.parser')
         
         # Extract metadata
@@ -516,8 +759,6 @@ def parse_html_results(html_file_path=None):
         if score_element:
             score_text = score_element.text.strip()
             # Try to extract score directly from text
-            import re
-            
             # Look for specific patterns in the score text
             score_patterns = [
                 r'(\d+)\s*\/\s*(\d+)',  # Matches "85/100"
@@ -562,7 +803,6 @@ def parse_html_results(html_file_path=None):
             
             # Extract question number from text if possible
             q_data["questionNumber"] = i + 1
-            import re
             if q_text_elem:
                 q_num_match = re.search(r'question\s*(\d+)|q\.?\s*(\d+)|#\s*(\d+)|^(\d+)[\.:]', 
                                       q_text_elem.text, re.IGNORECASE)
@@ -680,8 +920,11 @@ def upload_file():
         year = request.form.get('year', 'Unknown')
         semester = request.form.get('semester', 'Unknown')
         
-        # Save the file
-        filename = f"{subject}_{year}_{semester}_{int(time.time())}.txt"
+        # Save the file; a .jsonl/.csv upload holds a whole cohort, one row per answer
+        extension = os.path.splitext(file.filename)[1].lower()
+        if extension not in COHORT_EXTENSIONS:
+            extension = ".txt"
+        filename = f"{subject}_{year}_{semester}_{int(time.time())}{extension}"
         filepath = os.path.join(APP_CONFIG["UPLOAD_FOLDER"], filename)
         file.save(filepath)
         
@@ -690,10 +933,23 @@ def upload_file():
         
         logger.info(f"File uploaded successfully: {filename}, evaluation ID: {eval_id}")
         
+        # In pipeline mode the upload is graded as soon as it settles
+        if upload_pipeline:
+            upload_pipeline.notify(filepath)
+        
+        # Tell the client which rubric this exam will be graded against
+        try:
+            rubric = rubric_registry.get(subject, year, semester).to_summary()
+        except RubricError as e:
+            logger.warning(f"No usable rubric for upload {filename}: {str(e)}")
+            rubric = None
+        
         return jsonify({
             'status': 'success', 
             'message': 'File uploaded successfully',
-            'evaluationId': eval_id
+            'evaluationId': eval_id,
+            'rubric': rubric,
+            'queued': upload_pipeline is not None
         })
         
     except Exception as e:
@@ -708,10 +964,38 @@ def start_evaluation():
     if request.method == 'OPTIONS':
         return '', 204
         
-    global evaluation_status
+    # Optional exam identifiers select the rubric to grade against
+    exam = exam_from_request()
+    if exam:
+        try:
+            rubric_registry.get(exam["subject"], exam["year"], exam["semester"])
+        except RubricError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+    
+    # Optional whole-job deadline in seconds; the run then ends with partial results
+    try:
+        deadline = deadline_from_request()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"Invalid deadline: {str(e)}"}), 400
+    
+    # Queue mode: a separate evaluation worker process picks the job up
+    if APP_CONFIG["JOB_MODE"] == "queue":
+        job_id = job_store.enqueue(params={"exam": exam, "deadline": deadline})
+        if job_id is None:
+            logger.warning("Attempted to queue evaluation while one is already active")
+            return jsonify({
+                "status": "error", 
+                "message": "Evaluation already in progress"
+            })
+        
+        # Start loading the model now so the worker does not pay the cold start
+        model_keeper.start_warm_up()
+        logger.info(f"Evaluation job {job_id} queued for an evaluation worker")
+        return jsonify({"status": "started", "jobId": job_id})
     
     # Don't start if already running
-    if evaluation_status["running"]:
+    job_id = job_store.begin(params={"exam": exam, "deadline": deadline})
+    if job_id is None:
         logger.warning("Attempted to start evaluation while already running")
         return jsonify({
             "status": "error", 
@@ -719,18 +1003,248 @@ def start_evaluation():
         })
     
     # Start evaluation in a separate thread
-    thread = threading.Thread(target=run_auto_checker)
+    thread = threading.Thread(target=run_auto_checker, args=(job_id, exam, None, deadline))
     thread.daemon = True
     thread.start()
     
     logger.info("Evaluation process started in background thread")
-    return jsonify({"status": "started"})
+    return jsonify({"status": "started", "jobId": job_id})
+
+
+def regrade_item(student_name, question_number, student_answer=None, timeout=None):
+    """Grade one student's answer to one question again and store the result; returns the new record
+
+    Uses the stored answer unless a corrected one is given, and the exam's current rubric. Bulk
+    grading pauses between items while this runs. The record is appended to the records journal,
+    where it replaces the earlier one for the same (student, question), and to the completion
+    archive, and the HTML and JSON results are rewritten from the journal so every results
+    endpoint shows it. Raises LookupError when there is nothing to regrade.
+    """
+    # The grader's code is only needed here; importing it lazily keeps startup lean
+    from auto_checker_v3 import OllamaLLM, RetryingLLM, grade_item, parse_args as grader_args
+    from completion_archive import GRADING_SETTINGS, CompletionArchive, CompletionRecorder
+    
+    record = report_renderer.record(student_name, question_number)
+    if record is None and student_answer is None:
+        raise LookupError(f"No graded answer of {student_name} to question {question_number}; send the answer to grade it")
+    record = record or {"Student Name": student_name, "Question Number": question_number}
+    
+    question, answer_key, prompt_prefix = record.get("Question"), record.get("Answer Key"), None
+    try:
+        rubric = rubric_registry.get(record.get("Subject"), record.get("Year"), record.get("Semester"))
+        for i, rubric_question, rubric_answer_key, rubric_prefix in rubric.items():
+            if i == question_number:
+                question, answer_key, prompt_prefix = rubric_question, rubric_answer_key, rubric_prefix
+                break
+    except RubricError as e:
+        logger.warning(f"Regrading with the stored question and answer key: {str(e)}")
+    if question is None:
+        raise LookupError(f"Question {question_number} is not in the rubric")
+    student_answer = student_answer if student_answer is not None else record.get("Student Answer", "")
+    
+    # Plain grading with one attempt: a regrade has to come back within its latency target
+    args = grader_args([])
+    client = OllamaLLM(model_keeper.pool, OLLAMA_CONFIG["MODEL"], timeout=timeout or APP_CONFIG["REGRADE_TIMEOUT"],
+                       options=model_keeper.options, keep_alive=model_keeper.current_keep_alive())
+    recorder = CompletionRecorder(RetryingLLM(client, retries=0))
+    with priority_lane.hold():
+        evaluation, _ = grade_item(args, recorder, question, answer_key, student_answer or "No answer provided.", prompt_prefix)
+    
+    score, feedback, strengths, improvements, model_thoughts = evaluation
+    regraded = {
+        "Student Name": student_name,
+        "Subject": record.get("Subject", "Unknown"),
+        "Year": record.get("Year", "Unknown"),
+        "Semester": record.get("Semester", "Unknown"),
+        "Question Number": question_number,
+        "Question": question,
+        "Answer Key": answer_key,
+        "Student Answer": student_answer,
+        "Score": score,
+        "Feedback": feedback,
+        "Strengths": strengths,
+        "Areas for Improvement": improvements,
+        "Model_Thoughts": model_thoughts,
+        "Regraded At": datetime.now().isoformat()
+    }
+    append_record(APP_CONFIG["RECORDS_FILE"], regraded)
+    
+    archive = CompletionArchive()
+    try:
+        archive.start_run(append=True)
+        archive.store(regraded, list(recorder.completions), {name: getattr(args, name) for name in GRADING_SETTINGS})
+    finally:
+        archive.close()
+    refresh_results_files()
+    return regraded
+
+
+# Regrades finishing together rewrite the results files one at a time
+results_refresh_lock = threading.Lock()
+
+
+def refresh_results_files():
+    """Rewrite the HTML report and its JSON version from the records journal, e.g. after a regrade"""
+    with results_refresh_lock:
+        write_report_file(APP_CONFIG["RESULTS_FILE"], report_renderer.records())
+        generate_json_results()
+
+
+@app.route('/api/regrade', methods=['POST', 'OPTIONS'])
+def regrade():
+    """Regrade one (student, question) synchronously, ahead of any running bulk evaluation
+
+    JSON body: {"student": name, "question": number, "answer": optional corrected answer}
+    """
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    data = request.get_json(silent=True) or {}
+    student_name = str(data.get("student") or "").strip()
+    try:
+        question_number = int(data.get("question"))
+    except (TypeError, ValueError):
+        question_number = None
+    if not student_name or question_number is None or question_number < 1:
+        return jsonify({"status": "error", "message": "student and a question number are required"}), 400
+    
+    started = time.monotonic()
+    if not regrade_slots.acquire(timeout=APP_CONFIG["REGRADE_TIMEOUT"]):
+        return jsonify({"status": "error", "message": "Too many regrades in progress, try again shortly"}), 503
+    try:
+        from auto_checker_v3 import ModelCallFailed
+        # Whatever was spent waiting for a slot comes out of the latency target
+        remaining = max(1.0, APP_CONFIG["REGRADE_TIMEOUT"] - (time.monotonic() - started))
+        record = regrade_item(student_name, question_number, data.get("answer"), timeout=remaining)
+    except LookupError as e:
+        return jsonify({"status": "error", "message": str(e)}), 404
+    except ModelCallFailed as e:
+        logger.warning(f"Regrade of {student_name} - Question {question_number} failed: {str(e)}")
+        return jsonify({"status": "error", "message": f"Regrade did not finish: {str(e)}"}), 504
+    finally:
+        regrade_slots.release()
+    
+    latency_ms = round((time.monotonic() - started) * 1000)
+    logger.info(f"Regraded {student_name} - Question {question_number} in {latency_ms} ms")
+    return jsonify({"status": "ok", "record": record, "latencyMs": latency_ms})
+
+
+@app.route('/cancel_evaluation', methods=['POST', 'OPTIONS'])
+def cancel_evaluation():
+    """Cancel the active evaluation; results graded so far are kept"""
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    if not job_store.cancel():
+        return jsonify({"status": "error", "message": "No evaluation in progress"}), 409
+    
+    logger.info("Evaluation cancel requested")
+    return jsonify({"status": "cancelling", "jobId": job_store.status()["jobId"]})
+
+
+@app.route('/api/rubrics')
+def list_rubrics():
+    """List the registered exam rubrics, loading and validating each one"""
+    rubrics = []
+    for key in [None] + rubric_registry.available():
+        try:
+            rubric = rubric_registry.get(*(key or ()), fallback=False)
+            rubrics.append(dict(rubric.to_summary(), valid=True))
+        except RubricError as e:
+            subject, year, semester = key or ("default", "", "")
+            rubrics.append({
+                "subject": subject,
+                "year": year,
+                "semester": semester,
+                "valid": False,
+                "error": str(e)
+            })
+    return jsonify({"rubrics": rubrics})
+
+
+@app.route('/api/plan')
+def plan_evaluation():
+    """Estimate an evaluation of the uploaded answers without grading anything
+
+    Query: subject, year, semester select the rubric, as for /start_evaluation. Returns the
+    model calls, prompt/completion tokens and wall time the run would take, per student, with
+    outlier answers flagged.
+    """
+    # Only needed here; importing lazily keeps startup lean
+    from auto_checker_v3 import STUDENT_FILE_EXTENSIONS, open_semantic_cache, parse_args as grader_args
+    from cohort_input import CohortError, iter_student_answers
+    from completion_archive import ARCHIVE_FILE, CompletionArchive
+    from run_planner import plan_run
+
+    exam = {field: request.args.get(field) for field in ("subject", "year", "semester")}
+    # The same options the evaluation would be started with
+    args = grader_args(auto_checker_command(exam)[2:])
+    try:
+        rubric = rubric_registry.get(args.subject, args.year, args.semester)
+    except RubricError as e:
+        return jsonify({"status": "error", "message": str(e)}), 404
+
+    folder = APP_CONFIG["UPLOAD_FOLDER"]
+    student_files = sorted(
+        os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(STUDENT_FILE_EXTENSIONS)
+    )
+    if not student_files:
+        return jsonify({"status": "error", "message": "No student answer files uploaded"}), 404
+
+    archive = CompletionArchive(ARCHIVE_FILE) if os.path.exists(ARCHIVE_FILE) else None
+    semantic = open_semantic_cache(args)
+    try:
+        plan = plan_run(args, rubric, iter_student_answers(student_files), archive, semantic)
+    except CohortError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    finally:
+        if archive:
+            archive.close()
+        if semantic:
+            semantic.close()
+    return jsonify(dict(plan, status="ok"))
+
+
+@app.route('/health')
+def health():
+    """Report whether Ollama is reachable and the grading model is loaded"""
+    report = model_keeper.health()
+    return jsonify(report), (200 if report["reachable"] else 503)
+
+
+@app.route('/api/admission')
+def admission_status():
+    """Report requests admitted and turned away (rate limited or busy) per route class"""
+    if admission is None:
+        return jsonify({"enabled": False})
+    return jsonify(admission.stats())
+
+
+@app.route('/api/retention')
+def retention_status():
+    """Report the archived uploads and the last retention round"""
+    archived = upload_store.archived()
+    return jsonify({
+        "enabled": retention_task is not None,
+        "inactiveDays": retention_task.inactive_days if retention_task else None,
+        "archivedFiles": len(archived),
+        "archives": len(set(archived.values())),
+        "lastRun": retention_task.last_run if retention_task else None
+    })
+
+
+@app.route('/api/pipeline')
+def pipeline_status():
+    """Report the uploads waiting for, in, and recently through the grading pipeline"""
+    if upload_pipeline is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(upload_pipeline.status(), enabled=True))
 
 
 @app.route('/status')
 def check_status():
     """Check the status of the evaluation process"""
-    return jsonify(evaluation_status)
+    return jsonify(job_store.status())
 
 
 @app.route('/api/results/<evaluation_id>')
@@ -759,27 +1273,61 @@ def get_evaluation_results(evaluation_id):
         }), 500
 
 
+def html_response(html):
+    """Wrap rendered HTML in a response with an explicit content type"""
+    response = make_response(html)
+    response.headers["Content-Type"] = "text/html"
+    return response
+
+
 @app.route('/results')
 def view_results():
-    """Display the evaluation results"""
+    """Display the evaluation results.
+
+    With ``?page=N`` (and optional ``per_page``) only that page of students is
+    rendered from the structured records instead of the full report file.
+    """
+    if 'page' in request.args and report_renderer.available():
+        try:
+            page = request.args.get('page', 1, type=int)
+            per_page = request.args.get('per_page', None, type=int)
+            return html_response(report_renderer.render_page(page, per_page))
+        except Exception as e:
+            logger.error(f"Error rendering results page: {str(e)}", exc_info=True)
+            return {"error": f"Error rendering results: {str(e)}"}, 500
+    
     if not os.path.exists(APP_CONFIG["RESULTS_FILE"]):
         logger.warning("Results file not found when attempting to view results")
         return {"error": "No evaluation results found."}, 404
     
-    # Just return the HTML content directly
+    # Serve the file directly; conditional requests let browsers reuse their cached copy
     try:
-        with open(APP_CONFIG["RESULTS_FILE"], "r", encoding="utf-8") as file:
-            results_html = file.read()
-        
-        # Set content type to text/html explicitly
-        response = make_response(results_html)
-        response.headers["Content-Type"] = "text/html"
-        return response
+        return send_file(APP_CONFIG["RESULTS_FILE"], mimetype="text/html", conditional=True)
     except Exception as e:
         logger.error(f"Error reading results file: {str(e)}", exc_info=True)
         return {"error": f"Error reading results: {str(e)}"}, 500
 
 
+@app.route('/results/students')
+def view_results_index():
+    """Display a paginated summary row per student"""
+    if not report_renderer.available():
+        return {"error": "No evaluation results found."}, 404
+    
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', None, type=int)
+    return html_response(report_renderer.render_index(page, per_page, base_url=request.path))
+
+
+@app.route('/results/students/<path:student_name>')
+def view_student_results(student_name):
+    """Display the report for a single student"""
+    html = report_renderer.render_student(student_name)
+    if html is None:
+        return {"error": f"No evaluation results found for {student_name}."}, 404
+    return html_response(html)
+
+
 @app.route('/download_results')
 def download_results():
     """Download the results file"""
@@ -794,6 +1342,30 @@ def download_results():
         })
 
 
+@app.route('/api/export')
+def export_results():
+    """Download the results as columnar tables: ?format=parquet|arrow, optional &table=
+
+    Without a table, all three tables are sent together as a zip file.
+    """
+    fmt = request.args.get('format', 'parquet')
+    table = request.args.get('table')
+    if table and table not in EXPORT_TABLES:
+        return jsonify({
+            "status": "error",
+            "message": f"Unknown table '{table}', expected one of {', '.join(EXPORT_TABLES)}"
+        }), 400
+    
+    try:
+        paths = results_exporter.export(fmt)
+    except ExportError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    
+    if table:
+        return send_file(paths[table], mimetype=EXPORT_FORMATS[fmt]["mimetype"], as_attachment=True, conditional=True)
+    return send_file(results_exporter.bundle_path(fmt), mimetype="application/zip", as_attachment=True, conditional=True)
+
+
 @app.route('/check_results_exist')
 def check_results_exist():
     """Check if evaluation results file exists"""
@@ -801,312 +1373,371 @@ def check_results_exist():
     return jsonify({"exists": results_exist})
 
 
-@app.route('/api/students_results')
-def get_students_results():
-    """Get all students' evaluation results in JSON format"""
-    try:
-        # First, ensure we have the latest JSON data from HTML by regenerating it
-        base_data = generate_json_results()
-        
-        # If generation failed, try to load existing JSON file
-        if not base_data:
-            if os.path.exists(APP_CONFIG["JSON_RESULTS_FILE"]):
-                logger.info("Loading JSON data from existing file")
-                try:
-                    with open(APP_CONFIG["JSON_RESULTS_FILE"], 'r', encoding='utf-8') as f:
-                        base_data = json.load(f)
-                except json.JSONDecodeError as e:
-                    logger.error(f"JSON file is corrupted: {str(e)}")
-                    return jsonify({"status": "error", "message": "Results file is corrupted"}), 500
-            else:
-                logger.error("No results found - both generate_json_results() failed and no JSON file exists")
-                return jsonify({"status": "error", "message": "Results not found"}), 404
-        
-        # Get student files from student_answers directory
-        student_folder = APP_CONFIG["UPLOAD_FOLDER"]
-        student_files = []
-        
-        if os.path.exists(student_folder):
-            for filename in os.listdir(student_folder):
-                if filename.endswith('.txt'):
-                    student_files.append(filename)
-            
-            logger.info(f"Found {len(student_files)} student files in {student_folder}")
-        else:
-            logger.warning(f"Student folder {student_folder} does not exist")
-            # Create the folder for future uploads
+def load_base_results():
+    """Load the base evaluation data, regenerating it from the HTML results first.
+
+    Returns a (data, error_response) tuple where exactly one side is None.
+    """
+    # First, ensure we have the latest JSON data from HTML by regenerating it
+    base_data = generate_json_results()
+    
+    # If generation failed, try to load existing JSON file
+    if not base_data:
+        if os.path.exists(APP_CONFIG["JSON_RESULTS_FILE"]):
+            logger.info("Loading JSON data from existing file")
             try:
-                os.makedirs(student_folder)
-                logger.info(f"Created student folder: {student_folder}")
-            except Exception as e:
-                logger.error(f"Failed to create student folder: {str(e)}")
-        
-        # Extract student names and answer content from files
-        student_data_map = {}
-        
-        # Process base student first if available to preserve original data
-        if base_data and base_data.get("studentName"):
-            original_name = base_data.get("studentName")
-            student_data_map[original_name] = {
-                "name": original_name,
-                "content": "",
-                "filename": "original_data.txt"
-            }
+                with open(APP_CONFIG["JSON_RESULTS_FILE"], 'r', encoding='utf-8') as f:
+                    base_data = json.load(f)
+            except json.JSONDecodeError as e:
+                logger.error(f"JSON file is corrupted: {str(e)}")
+                return None, (jsonify({"status": "error", "message": "Results file is corrupted"}), 500)
+        else:
+            logger.error("No results found - both generate_json_results() failed and no JSON file exists")
+            return None, (jsonify({"status": "error", "message": "Results not found"}), 404)
+    
+    return base_data, None
+
+
+def read_student_content(filename):
+    """Read one student's answer file from the upload folder, or from its cohort's archive"""
+    return upload_store.read(filename)
+
+
+def collect_student_files(base_data, include_archived=False):
+    """Map student names to their answer files.
+
+    File contents are only scanned for a name here and are read again when the
+    student is built, so the map stays small however large the cohort is.
+    With include_archived, uploads of archived cohorts are included too.
+    """
+    # Get student files from student_answers directory
+    student_folder = APP_CONFIG["UPLOAD_FOLDER"]
+    student_files = []
+    
+    if os.path.exists(student_folder):
+        for filename in os.listdir(student_folder):
+            if filename.endswith('.txt'):
+                student_files.append(filename)
         
-        # Then process actual student files
-        for filename in student_files:
-            try:
-                file_path = os.path.join(student_folder, filename)
-                with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-                    content = f.read()
-                
-                # Extract student name using multiple strategies
-                student_name = None
-                
-                # Try to extract name from file content first
-                import re
-                name_patterns = [
-                    r"Name:\s*(.+?)[\n\r]",
-                    r"Student name:\s*(.+?)[\n\r]",
-                    r"Student:\s*(.+?)[\n\r]",
-                    r"Name is\s*(.+?)[\n\r]",
-                ]
-                
-                for pattern in name_patterns:
-                    match = re.search(pattern, content, re.IGNORECASE)
-                    if match:
-                        extracted_name = match.group(1).strip()
-                        if extracted_name and len(extracted_name) < 100:  # Sanity check
-                            student_name = extracted_name
-                            break
+        if include_archived:
+            hot = set(student_files)
+            student_files += [f for f in upload_store.archived() if f.endswith('.txt') and f not in hot]
+        logger.info(f"Found {len(student_files)} student files in {student_folder}")
+    else:
+        logger.warning(f"Student folder {student_folder} does not exist")
+        # Create the folder for future uploads
+        try:
+            os.makedirs(student_folder)
+            logger.info(f"Created student folder: {student_folder}")
+        except Exception as e:
+            logger.error(f"Failed to create student folder: {str(e)}")
+    
+    # Extract student names from files
+    student_data_map = {}
+    
+    # Process base student first if available to preserve original data
+    if base_data and base_data.get("studentName"):
+        original_name = base_data.get("studentName")
+        student_data_map[original_name] = {
+            "name": original_name,
+            "content": "",
+            "filename": "original_data.txt"
+        }
+    
+    # Then process actual student files
+    for filename in student_files:
+        try:
+            content = read_student_content(filename)
+            
+            # Extract student name using multiple strategies
+            student_name = None
+            
+            # Try to extract name from file content first
+            name_patterns = [
+                r"Name:\s*(.+?)[\n\r]",
+                r"Student name:\s*(.+?)[\n\r]",
+                r"Student:\s*(.+?)[\n\r]",
+                r"Name is\s*(.+?)[\n\r]",
+            ]
+            
+            for pattern in name_patterns:
+                match = re.search(pattern, content, re.IGNORECASE)
+                if match:
+                    extracted_name = match.group(1).strip()
+                    if extracted_name and len(extracted_name) < 100:  # Sanity check
+                        student_name = extracted_name
+                        break
+            
+            # If no name found in content, try from filename
+            if not student_name:
+                # Remove file extension
+                name_from_file = filename.replace('.txt', '')
                 
-                # If no name found in content, try from filename
-                if not student_name:
-                    # Remove file extension
-                    name_from_file = filename.replace('.txt', '')
-                    
-                    # If filename has structure like "subject_year_semester_timestamp.txt"
-                    # or contains underscores, use first part
-                    if '_' in name_from_file:
-                        parts = name_from_file.split('_')
-                        # Try to detect if first part is a subject, not a name
-                        if parts[0].lower() not in ['math', 'science', 'english', 'history', 'physics', 'chemistry']:
-                            student_name = parts[0]
-                        else:
-                            # If first part is subject, use a combination of parts
-                            student_name = f"Student-{parts[1]}-{parts[2]}"
+                # If filename has structure like "subject_year_semester_timestamp.txt"
+                # or contains underscores, use first part
+                if '_' in name_from_file:
+                    parts = name_from_file.split('_')
+                    # Try to detect if first part is a subject, not a name
+                    if parts[0].lower() not in ['math', 'science', 'english', 'history', 'physics', 'chemistry']:
+                        student_name = parts[0]
                     else:
-                        student_name = name_from_file
-                
-                # Final fallback
-                if not student_name or len(student_name) < 2:
-                    student_name = f"Student_{len(student_data_map) + 1}"
-                
-                # Store the name and content
-                student_data_map[student_name] = {
-                    "name": student_name,
-                    "content": content,
-                    "filename": filename
-                }
-                logger.info(f"Extracted student name '{student_name}' from file {filename}")
-                
-            except Exception as e:
-                logger.warning(f"Error processing student file {filename}: {str(e)}")
-                # Still add a placeholder entry
-                placeholder_name = f"Student_{len(student_data_map) + 1}"
-                student_data_map[placeholder_name] = {
-                    "name": placeholder_name,
-                    "content": "",
-                    "filename": filename
-                }
-        
-        # If still no students, add a few generic ones
-        if not student_data_map:
-            for i in range(1, 4):
-                student_name = f"Student {i}"
-                student_data_map[student_name] = {
-                    "name": student_name,
-                    "content": "",
-                    "filename": ""
-                }
-            logger.warning("No student data found, using generic student names")
+                        # If first part is subject, use a combination of parts
+                        student_name = f"Student-{parts[1]}-{parts[2]}"
+                else:
+                    student_name = name_from_file
+            
+            # Final fallback
+            if not student_name or len(student_name) < 2:
+                student_name = f"Student_{len(student_data_map) + 1}"
+            
+            # Store the name and file; content is loaded again when the student is built
+            student_data_map[student_name] = {
+                "name": student_name,
+                "content": None,
+                "filename": filename
+            }
+            logger.info(f"Extracted student name '{student_name}' from file {filename}")
+            
+        except Exception as e:
+            logger.warning(f"Error processing student file {filename}: {str(e)}")
+            # Still add a placeholder entry
+            placeholder_name = f"Student_{len(student_data_map) + 1}"
+            student_data_map[placeholder_name] = {
+                "name": placeholder_name,
+                "content": "",
+                "filename": filename
+            }
+    
+    # If still no students, add a few generic ones
+    if not student_data_map:
+        for i in range(1, 4):
+            student_name = f"Student {i}"
+            student_data_map[student_name] = {
+                "name": student_name,
+                "content": "",
+                "filename": ""
+            }
+        logger.warning("No student data found, using generic student names")
+    
+    return student_data_map
+
+
+def build_student_result(i, name, student_info, base_data):
+    """Build the result payload for a single student from the base evaluation data"""
+    # Deep copy to avoid modifying original
+    student_data = copy.deepcopy(base_data)
+    
+    # Set student-specific data
+    student_data["id"] = f"eval-{int(time.time())}-{i}"
+    student_data["studentName"] = name
+    
+    # Ensure overallScore exists and is numeric
+    if not isinstance(student_data.get("overallScore"), (int, float)):
+        student_data["overallScore"] = 75  # Default score if missing
+    
+    # Normalize scores to 100-point scale if needed, but prevent double scaling
+    max_score = student_data.get("maxScore", 100) 
+    if max_score != 100 and max_score > 0:
+        # Check if score is already reasonably within 0-100 range
+        if student_data["overallScore"] <= 100:
+            # Score is already in correct range, don't scale
+            student_data["maxScore"] = 100
+        else:
+            # Score needs scaling
+            student_data["overallScore"] = int((student_data["overallScore"] / max_score) * 100)
+            student_data["maxScore"] = 100
+    
+    # Add variation for each student except the first one (preserve original data)
+    if i > 0:
+        # Create a deterministic but unique variation based on student name
+        name_hash = int(hashlib.md5(name.encode()).hexdigest(), 16)
+        # Smaller variation range (-5 to +4)
+        variation = (-5 + (name_hash % 10))
         
-        # Generate results for all students
-        students = []
+        # Apply variation to overall score
+        student_data["overallScore"] = max(0, min(100, student_data["overallScore"] + variation))
         
-        # Process each student
-        for i, (name, student_info) in enumerate(student_data_map.items()):
-            try:
-                # Deep copy to avoid modifying original
-                student_data = copy.deepcopy(base_data)
-                
-                # Set student-specific data
-                student_data["id"] = f"eval-{int(time.time())}-{i}"
-                student_data["studentName"] = name
-                
-                # Ensure overallScore exists and is numeric
-                if not isinstance(student_data.get("overallScore"), (int, float)):
-                    student_data["overallScore"] = 75  # Default score if missing
-                
-                # Normalize scores to 100-point scale if needed, but prevent double scaling
-                max_score = student_data.get("maxScore", 100) 
-                if max_score != 100 and max_score > 0:
-                    # Check if score is already reasonably within 0-100 range
-                    if student_data["overallScore"] <= 100:
-                        # Score is already in correct range, don't scale
-                        student_data["maxScore"] = 100
-                    else:
-                        # Score needs scaling
-                        student_data["overallScore"] = int((student_data["overallScore"] / max_score) * 100)
-                        student_data["maxScore"] = 100
-                
-                # Add variation for each student except the first one (preserve original data)
-                if i > 0:
-                    import hashlib
-                    
-                    # Create a deterministic but unique variation based on student name
-                    name_hash = int(hashlib.md5(name.encode()).hexdigest(), 16)
-                    # Smaller variation range (-5 to +4)
-                    variation = (-5 + (name_hash % 10))
-                    
-                    # Apply variation to overall score
-                    student_data["overallScore"] = max(0, min(100, student_data["overallScore"] + variation))
+        # Process each question with student-specific data
+        for q_idx, q in enumerate(student_data.get("questions", [])):
+            # Ensure score exists and is numeric
+            if not isinstance(q.get("score"), (int, float)):
+                q["score"] = 7  # Default question score if missing or invalid
+            
+            # Create deterministic variation per question and student
+            q_hash = int(hashlib.md5(f"{name}_{q.get('id', q_idx)}".encode()).hexdigest(), 16)
+            q_variation = (-2 + (q_hash % 5))  # Smaller range of variation (-2 to +2)
+            
+            # Apply variation to question score
+            q_max = q.get("maxScore", 10)
+            if q_max > 0:
+                # Check if score is already on a 0-100 scale
+                if q["score"] <= q_max:
+                    q["score"] = max(0, min(q_max, q["score"] + q_variation))
                     
-                    # Process each question with student-specific data
-                    for q_idx, q in enumerate(student_data.get("questions", [])):
-                        # Ensure score exists and is numeric
-                        if not isinstance(q.get("score"), (int, float)):
-                            q["score"] = 7  # Default question score if missing or invalid
-                        
-                        # Create deterministic variation per question and student
-                        q_hash = int(hashlib.md5(f"{name}_{q.get('id', q_idx)}".encode()).hexdigest(), 16)
-                        q_variation = (-2 + (q_hash % 5))  # Smaller range of variation (-2 to +2)
-                        
-                        # Apply variation to question score
-                        q_max = q.get("maxScore", 10)
-                        if q_max > 0:
-                            # Check if score is already on a 0-100 scale
-                            if q["score"] <= q_max:
-                                q["score"] = max(0, min(q_max, q["score"] + q_variation))
-                                
-                                # Normalize to 100-point scale if needed
-                                if q_max != 100:
-                                    q["score"] = int((q["score"] / q_max) * 100)
-                                    q["maxScore"] = 100
-                            else:
-                                # Score is already scaled improperly, fix it
-                                q["score"] = int((q["score"] / 10))  # Assuming it was multiplied by 10
-                                q["score"] = max(0, min(100, q["score"] + q_variation))
-                                q["maxScore"] = 100
+                    # Normalize to 100-point scale if needed
+                    if q_max != 100:
+                        q["score"] = int((q["score"] / q_max) * 100)
+                        q["maxScore"] = 100
+                else:
+                    # Score is already scaled improperly, fix it
+                    q["score"] = int((q["score"] / 10))  # Assuming it was multiplied by 10
+                    q["score"] = max(0, min(100, q["score"] + q_variation))
+                    q["maxScore"] = 100
+            
+            # Try to extract answer from student content for this specific question
+            if student_info["content"]:
+                processed_answer = False
+                
+                # Method 1: Try to find question text match
+                q_text = q.get("questionText", "").strip()
+                if q_text and len(q_text) > 5 and q_text in student_info["content"]:
+                    # Find the part after the question text
+                    parts = student_info["content"].split(q_text, 1)
+                    if len(parts) > 1:
+                        # Get text until next question or end
+                        answer_text = parts[1].strip()
+                        # Try to find end of answer (next question or section)
+                        end_markers = ["Question", "QUESTION", "Q:", "Problem", "Exercise"]
+                        for marker in answer_text:
+                            if marker in answer_text:
+                                answer_text = answer_text.split(marker, 1)[0].strip()
                         
-                        # Try to extract answer from student content for this specific question
-                        if student_info["content"]:
-                            processed_answer = False
+                        # Limit length to reasonable amount
+                        if answer_text and len(answer_text) < 1000:
+                            q["studentAnswer"] = answer_text
+                            processed_answer = True
                             
-                            # Method 1: Try to find question text match
-                            q_text = q.get("questionText", "").strip()
-                            if q_text and len(q_text) > 5 and q_text in student_info["content"]:
-                                # Find the part after the question text
-                                parts = student_info["content"].split(q_text, 1)
-                                if len(parts) > 1:
-                                    # Get text until next question or end
-                                    answer_text = parts[1].strip()
-                                    # Try to find end of answer (next question or section)
-                                    end_markers = ["Question", "QUESTION", "Q:", "Problem", "Exercise"]
-                                    for marker in answer_text:
-                                        if marker in answer_text:
-                                            answer_text = answer_text.split(marker, 1)[0].strip()
-                                    
-                                    # Limit length to reasonable amount
-                                    if answer_text and len(answer_text) < 1000:
-                                        q["studentAnswer"] = answer_text
-                                        processed_answer = True
-                                        
-                            # Method 2: Try to find by question number
-                            if not processed_answer:
-                                q_num = q.get("questionNumber")
-                                patterns = [
-                                    f"Question {q_num}[.:](.*?)(?=Question {q_num+1}|$)",
-                                    f"Q{q_num}[.:](.*?)(?=Q{q_num+1}|$)",
-                                    f"{q_num}\\)(.*?)(?={q_num+1}\\)|$)"
-                                ]
-                                
-                                for pattern in patterns:
-                                    match = re.search(pattern, student_info["content"], re.DOTALL | re.IGNORECASE)
-                                    if match:
-                                        answer_text = match.group(1).strip()
-                                        if answer_text and len(answer_text) < 1000:
-                                            q["studentAnswer"] = answer_text
-                                            processed_answer = True
-                                            break
-                        
-                        # Personalize feedback for each student
-                        original_feedback = q.get("feedback", "")
-                        if not original_feedback or i > 0:  # Keep original feedback for first student
-                            q["feedback"] = f"Feedback for {name}'s answer to question {q['questionNumber']}."
-                        
-                        # Personalize strengths and improvements while keeping their structure
-                        original_strengths = q.get("strengths", [])
-                        if i > 0:  # Keep original strengths for first student
-                            if original_strengths:
-                                q["strengths"] = [
-                                    f"{name}'s strength: {s.replace('Sample Student', name)}" 
-                                    for s in original_strengths
-                                ]
-                        
-                        original_improvements = q.get("improvements", [])
-                        if i > 0:  # Keep original improvements for first student
-                            if original_improvements:
-                                q["improvements"] = [
-                                    f"Area for {name} to improve: {imp.replace('Sample Student', name)}" 
-                                    for imp in original_improvements
-                                ]
-                
-                # Ensure every student has exactly 5 questions
-                questions = student_data.get("questions", [])
-                if len(questions) > 5:
-                    # Keep only the first 5 questions
-                    student_data["questions"] = questions[:5]
-                elif len(questions) < 5:
-                    # Add additional questions if needed
-                    existing_count = len(questions)
-                    for i in range(existing_count, 5):
-                        student_data["questions"].append({
-                            "id": i + 1,
-                            "questionNumber": i + 1,
-                            "questionText": f"Question {i+1}",
-                            "studentAnswer": "No answer provided",
-                            "score": 70,  # Default reasonable score
-                            "maxScore": 100,
-                            "feedback": "This question was automatically generated to maintain consistency.",
-                            "strengths": ["Consistent format maintained"],
-                            "improvements": ["Provide an actual answer to this question"]
-                        })
-                
-                # Calculate the average score from questions to ensure consistency
-                total_score = 0
-                valid_questions = 0
-                
-                for q in student_data["questions"]:
-                    if isinstance(q.get("score"), (int, float)) and q["score"] > 0:
-                        # Ensure all scores are within 0-100 range
-                        q["score"] = min(100, q["score"])
-                        total_score += q["score"]
-                        valid_questions += 1
-                
-                if valid_questions > 0:
-                    recalculated_score = total_score / valid_questions
-                    # Only update if significantly different from current score
-                    if abs(recalculated_score - student_data["overallScore"]) > 20:
-                        student_data["overallScore"] = int(recalculated_score)
-                
-                students.append(student_data)
-                logger.info(f"Successfully processed data for student: {name}")
-                
-            except Exception as e:
-                logger.error(f"Error processing results for student {name}: {str(e)}", exc_info=True)
+                # Method 2: Try to find by question number
+                if not processed_answer:
+                    q_num = q.get("questionNumber")
+                    patterns = [
+                        f"Question {q_num}[.:](.*?)(?=Question {q_num+1}|$)",
+                        f"Q{q_num}[.:](.*?)(?=Q{q_num+1}|$)",
+                        f"{q_num}\\)(.*?)(?={q_num+1}\\)|$)"
+                    ]
+                    
+                    for pattern in patterns:
+                        match = re.search(pattern, student_info["content"], re.DOTALL | re.IGNORECASE)
+                        if match:
+                            answer_text = match.group(1).strip()
+                            if answer_text and len(answer_text) < 1000:
+                                q["studentAnswer"] = answer_text
+                                processed_answer = True
+                                break
+            
+            # Personalize feedback for each student
+            original_feedback = q.get("feedback", "")
+            if not original_feedback or i > 0:  # Keep original feedback for first student
+                q["feedback"] = f"Feedback for {name}'s answer to question {q['questionNumber']}."
+            
+            # Personalize strengths and improvements while keeping their structure
+            original_strengths = q.get("strengths", [])
+            if i > 0:  # Keep original strengths for first student
+                if original_strengths:
+                    q["strengths"] = [
+                        f"{name}'s strength: {s.replace('Sample Student', name)}" 
+                        for s in original_strengths
+                    ]
+            
+            original_improvements = q.get("improvements", [])
+            if i > 0:  # Keep original improvements for first student
+                if original_improvements:
+                    q["improvements"] = [
+                        f"Area for {name} to improve: {imp.replace('Sample Student', name)}" 
+                        for imp in original_improvements
+                    ]
+    
+    # Ensure every student has exactly 5 questions
+    questions = student_data.get("questions", [])
+    if len(questions) > 5:
+        # Keep only the first 5 questions
+        student_data["questions"] = questions[:5]
+    elif len(questions) < 5:
+        # Add additional questions if needed
+        existing_count = len(questions)
+        for i in range(existing_count, 5):
+            student_data["questions"].append({
+                "id": i + 1,
+                "questionNumber": i + 1,
+                "questionText": f"Question {i+1}",
+                "studentAnswer": "No answer provided",
+                "score": 70,  # Default reasonable score
+                "maxScore": 100,
+                "feedback": "This question was automatically generated to maintain consistency.",
+                "strengths": ["Consistent format maintained"],
+                "improvements": ["Provide an actual answer to this question"]
+            })
+    
+    # Calculate the average score from questions to ensure consistency
+    total_score = 0
+    valid_questions = 0
+    
+    for q in student_data["questions"]:
+        if isinstance(q.get("score"), (int, float)) and q["score"] > 0:
+            # Ensure all scores are within 0-100 range
+            q["score"] = min(100, q["score"])
+            total_score += q["score"]
+            valid_questions += 1
+    
+    if valid_questions > 0:
+        recalculated_score = total_score / valid_questions
+        # Only update if significantly different from current score
+        if abs(recalculated_score - student_data["overallScore"]) > 20:
+            student_data["overallScore"] = int(recalculated_score)
+    
+    return student_data
+
+
+def iter_students_results(base_data, student_data_map):
+    """Yield one student's results at a time so callers never hold the whole cohort"""
+    for i, (name, student_info) in enumerate(student_data_map.items()):
+        try:
+            # Answer content is only held while this student is being built
+            if student_info["content"] is None:
+                student_info = dict(student_info, content=read_student_content(student_info["filename"]))
+            
+            student_data = build_student_result(i, name, student_info, base_data)
+            logger.info(f"Successfully processed data for student: {name}")
+            yield student_data
+            
+        except Exception as e:
+            logger.error(f"Error processing results for student {name}: {str(e)}", exc_info=True)
+
+
+def wants_ndjson():
+    """Check whether the client asked for a streamed NDJSON response"""
+    if request.args.get('format', '').lower() == 'ndjson':
+        return True
+    return 'application/x-ndjson' in request.headers.get('Accept', '')
+
+
+@app.route('/api/students_results')
+def get_students_results():
+    """Get all students' evaluation results in JSON format.
+
+    With ``?format=ndjson`` (or ``Accept: application/x-ndjson``) the response is
+    streamed one student per line instead of being built as a single document.
+    With ``?archived=1`` the uploads of archived cohorts are included.
+    """
+    try:
+        base_data, error_response = load_base_results()
+        if error_response:
+            return error_response
+        
+        student_data_map = collect_student_files(base_data, include_archived=request.args.get('archived') == '1')
+        
+        if wants_ndjson():
+            def generate():
+                for student_data in iter_students_results(base_data, student_data_map):
+                    yield dump_json_bytes(student_data) + b"\n"
+            
+            response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+            # Stop reverse proxies from buffering the stream
+            response.headers["X-Accel-Buffering"] = "no"
+            return response
         
-        return jsonify({"students": students})
+        students = list(iter_students_results(base_data, student_data_map))
+        return Response(dump_json_bytes({"students": students}), mimetype='application/json')
         
     except Exception as e:
         logger.error(f"Error retrieving student results: {str(e)}", exc_info=True)
@@ -1116,10 +1747,28 @@ def get_students_results():
         }), 500
 
 
+@app.route('/api/analytics')
+def get_analytics():
+    """Get cohort and per-question score statistics, optionally filtered by exam"""
+    try:
+        top = request.args.get('top', 5, type=int)
+        result = get_analytics_index().query(
+            subject=request.args.get('subject'),
+            year=request.args.get('year'),
+            semester=request.args.get('semester'),
+            top=max(0, top)
+        )
+        return Response(dump_json_bytes(result), mimetype='application/json')
+    except Exception as e:
+        logger.error(f"Error computing analytics: {str(e)}", exc_info=True)
+        return jsonify({
+            "status": "error", 
+            "message": f"Error computing analytics: {str(e)}"
+        }), 500
+
+
 # ----- Application entry point -----
 
 if __name__ == '__main__':
-    import time
-    from datetime import datetime
     logger.info("Starting Flask application")
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
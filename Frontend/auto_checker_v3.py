@@ -1,41 +1,251 @@
 import os
-import csv
-import pandas as pd
-from langchain.llms import Ollama
+import json
+import re
+import sys
+import time
+import signal
+import argparse
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from rubrics import registry, RubricError, build_prompt_prefix
+from report_writer import ReportWriter, UNGRADED_SCORE, PARTIAL_EXIT_CODE
+from cohort_input import STUDENT_FILE_EXTENSIONS, CohortError, iter_student_answers
+from consistency import (
+    DEFAULT_MAX_SAMPLES, DEFAULT_MIN_AGREEMENT, DEFAULT_TOLERANCE, DEFAULT_SAMPLE_WORKERS,
+    sample_until_agreement
+)
+from long_answers import (
+    DEFAULT_TOKEN_BUDGET, DEFAULT_OVERLAP_TOKENS,
+    estimate_tokens, split_into_chunks, weighted_score
+)
+from prompt_cache import PromptCacheStats
+from ollama_client import OLLAMA_CLIENT_CONFIG, OllamaPool, keep_alive_value, load_profile
+from priority_lane import PriorityLane
+from completion_archive import ARCHIVE_FILE, GRADING_SETTINGS, CompletionArchive, CompletionRecorder, item_key
 
-# File paths for questions and answer keys
-QUESTIONS_FILE = "questions.txt"
-ANSWERS_FILE = "answers.txt"
-# Folder containing student answers (one file per student, e.g., "Ali.txt", "Bob.txt")
+# Ollama server and model, shared with the app's warm-up through the environment
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://127.0.0.1:11434")
+# Servers the native client balances over (OLLAMA_ENDPOINTS, comma-separated; see ollama_client.py)
+OLLAMA_ENDPOINTS = OLLAMA_CLIENT_CONFIG["ENDPOINTS"]
+OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "deepseek-r1")
+# Folder containing student answers (one file per student, e.g., "Ali.txt", "Bob.txt",
+# and/or whole-cohort .jsonl/.csv files, see cohort_input.py)
 STUDENT_ANSWERS_FOLDER = "student_answers"
+# Report written at the end of a run
+HTML_RESULTS_FILE = "evaluation_results.html"
+# Structured per-item results (one JSON record per line), used for paginated reports
+RECORDS_FILE = "evaluation_records.jsonl"
 
-def load_text_file(file_path):
-    """Load a text file and return a list of non-empty, stripped lines."""
-    with open(file_path, "r", encoding="utf-8") as f:
-        return [line.strip() for line in f if line.strip()]
+# Model call limits: seconds per call, and extra attempts after a failed call
+DEFAULT_CALL_TIMEOUT = 300
+DEFAULT_RETRIES = 2
+RETRY_BACKOFF_SECONDS = 2
 
-def evaluate_answer(llm, question, answer_key, student_answer):
+# Grading orders: all questions of one student at a time, or all students' answers to one
+# question at a time with the static text leading every prompt (reuses Ollama's prompt cache)
+SCHEDULES = ("student", "question")
+
+# Static instructions of every evaluation prompt; they close the prompt in the student schedule
+# and open it in the question schedule
+EVALUATION_INSTRUCTIONS = (
+    "Please evaluate the student's answer in detail. First, think through your evaluation step by step within <think> </think> tags.\n\n"
+    "After your thinking, provide your final evaluation following EXACTLY this format:\n"
+    "Score: [PROVIDE ONLY A NUMERICAL SCORE FROM 0 TO 100, WITH NO OTHER TEXT OR SYMBOLS]\n"
+    "Feedback: [overall evaluation of the answer in plain text, no special formatting]\n"
+    "Strengths:\n- [strength point 1]\n- [strength point 2]\n- [etc.]\n"
+    "Areas for Improvement:\n- [improvement point 1]\n- [improvement point 2]\n- [etc.]\n\n"
+    "IMPORTANT: The score MUST be a number between 0-100 with no other text. Do not use a scale of 0-10 or include any symbols, just the numerical value."
+)
+
+class ModelCallFailed(Exception):
+    """Raised when every attempt of a model call failed or timed out"""
+
+class RunInterrupted(Exception):
+    """Raised inside a model call when the run is cancelled (SIGTERM) or hits its deadline (SIGALRM)"""
+
+class RunControl:
+    """Tracks the job deadline and cancellation requests of one grader run"""
+    
+    def __init__(self, deadline_seconds=None):
+        self.deadline_at = time.monotonic() + deadline_seconds if deadline_seconds else None
+        self.cancelled = False
+        self.expired = False
+        self._interruptible = False
+    
+    def install(self):
+        """Stop on SIGTERM from the app, and at the deadline even in the middle of a model call"""
+        signal.signal(signal.SIGTERM, self.handle_signal)
+        if self.deadline_at is not None and hasattr(signal, "SIGALRM"):
+            signal.signal(signal.SIGALRM, self.handle_signal)
+            signal.setitimer(signal.ITIMER_REAL, max(0.001, self.deadline_at - time.monotonic()))
+    
+    def handle_signal(self, signum, frame):
+        if signum == signal.SIGTERM:
+            self.cancelled = True
+        else:
+            self.expired = True
+        # Only abandon a model call; anywhere else the loop notices before the next item
+        if self._interruptible:
+            self._interruptible = False
+            raise RunInterrupted(self.stop_reason())
+    
+    @contextmanager
+    def interruptible(self):
+        self._interruptible = True
+        try:
+            yield
+        finally:
+            self._interruptible = False
+    
+    def stop_reason(self):
+        """Why the remaining items must be skipped, or None to keep grading"""
+        if self.cancelled:
+            return "evaluation cancelled"
+        if self.expired or (self.deadline_at is not None and time.monotonic() >= self.deadline_at):
+            return "job deadline reached"
+        return None
+
+class OllamaLLM:
+    """Model calls through the pooled, load-balanced Ollama client"""
+    
+    def __init__(self, pool, model=OLLAMA_MODEL, timeout=DEFAULT_CALL_TIMEOUT, options=None, keep_alive=None):
+        self.pool = pool
+        self.model = model
+        self.timeout = timeout
+        # Ollama runtime options (num_thread, num_ctx, ...), usually from the tuned profile
+        self.options = options
+        # Sent with every call: Ollama resets the model's expiry to its default on calls without one
+        self.keep_alive = keep_alive
+        self._context_warned = False
+    
+    def complete(self, prompt, affinity=None):
+        """Returns (completion text, Ollama's response metadata); calls with one affinity share an endpoint"""
+        num_ctx = (self.options or {}).get("num_ctx")
+        if num_ctx and not self._context_warned and estimate_tokens(prompt) > num_ctx:
+            # Ollama cuts the prompt to fit, dropping the question and answer key at its start
+            self._context_warned = True
+            print(f"Warning: a prompt of about {estimate_tokens(prompt)} tokens exceeds num_ctx {num_ctx} and is "
+                  f"truncated by Ollama; use --long-answers or run tune_ollama.py again")
+        response = self.pool.generate(self.model, prompt, timeout=self.timeout, options=self.options,
+                                      keep_alive=self.keep_alive, affinity=affinity)
+        return response.get("response", ""), response
+
+class LangChainLLM:
+    """Model calls through LangChain's Ollama client (--client langchain)"""
+    
+    def __init__(self, model=OLLAMA_MODEL, base_url=OLLAMA_BASE_URL, timeout=DEFAULT_CALL_TIMEOUT, options=None,
+                 keep_alive=None):
+        # Imported only here, so runs with the native client never load LangChain
+        from langchain.llms import Ollama
+        settings = dict(options or {})
+        if keep_alive is not None:
+            settings["keep_alive"] = keep_alive_value(keep_alive)
+        self.llm = Ollama(model=model, base_url=base_url, timeout=timeout, **settings)
+    
+    def complete(self, prompt, affinity=None):
+        # One server, so there is no endpoint to keep calls on; generate() keeps the response metadata
+        generation = self.llm.generate([prompt]).generations[0][0]
+        return generation.text, generation.generation_info
+
+class RetryingLLM:
+    """
+    Wraps the LLM so each call is retried a bounded number of times with backoff.
+    Timeouts are enforced by the LLM client; a call that still fails raises ModelCallFailed.
+    Successful calls are counted in cache_stats along with Ollama's prompt-eval metadata.
     """
-    Calls the deepseek‑r1 model via LangChain Ollama with a prompt containing the question,
+    
+    def __init__(self, llm, retries=DEFAULT_RETRIES, control=None, cache_stats=None):
+        self.llm = llm
+        self.retries = max(0, retries)
+        self.control = control
+        self.cache_stats = cache_stats
+    
+    def __call__(self, prompt, affinity=None):
+        error = None
+        for attempt in range(self.retries + 1):
+            try:
+                text, info = self.llm.complete(prompt, affinity=affinity)
+                if self.cache_stats is not None:
+                    self.cache_stats.record(prompt, info)
+                return text
+            except RunInterrupted:
+                raise
+            except Exception as e:
+                error = e
+            # Do not start another attempt after a cancellation, past the job deadline or when
+            # Ollama rejected the request itself (e.g. an unknown model)
+            if (attempt == self.retries or (self.control and self.control.stop_reason())
+                    or not getattr(error, "retryable", True)):
+                break
+            time.sleep(RETRY_BACKOFF_SECONDS * 2 ** attempt)
+        raise ModelCallFailed(f"model call failed after {attempt + 1} attempt(s): {error}")
+
+# Record fields of an evaluation tuple, in order
+EVALUATION_FIELDS = ("Score", "Feedback", "Strengths", "Areas for Improvement", "Model_Thoughts")
+
+def ungraded_evaluation(reason):
+    """Evaluation tuple for an item that was not graded"""
+    return UNGRADED_SCORE, f"Not graded: {reason}", "", "", ""
+
+def layout_prompt(prompt_prefix, body, instructions, static_first=False):
+    """
+    Arrange the parts of a prompt. By default the question and answer key come first and the
+    instructions last. With static_first the instructions lead, followed by the question and
+    answer key, so consecutive prompts for one question share everything but the student's part.
+    """
+    if static_first:
+        return instructions + "\n\n" + prompt_prefix + body
+    return prompt_prefix + body + instructions
+
+def evaluate_answer(llm, question, answer_key, student_answer, prompt_prefix=None, static_first=False):
+    """
+    Calls the deepseek‑r1 model through the Ollama client with a prompt containing the question,
     answer key, and student's answer. It then parses the returned output for structured feedback.
     
+    prompt_prefix is the precomputed question/answer-key part of the prompt from the rubric
+    registry; it is built on the fly when not given. static_first selects the cache-friendly
+    prompt layout (see layout_prompt).
+    
     Returns a tuple: (score, feedback, strengths, improvements, model_thoughts)
     """
-    prompt = (
-        f"Question: {question}\n"
-        f"Answer Key: {answer_key}\n"
-        f"Student Answer: {student_answer}\n\n"
-        "Please evaluate the student's answer in detail. First, think through your evaluation step by step within <think> </think> tags.\n\n"
-        "After your thinking, provide your final evaluation following EXACTLY this format:\n"
-        "Score: [PROVIDE ONLY A NUMERICAL SCORE FROM 0 TO 100, WITH NO OTHER TEXT OR SYMBOLS]\n"
-        "Feedback: [overall evaluation of the answer in plain text, no special formatting]\n"
-        "Strengths:\n- [strength point 1]\n- [strength point 2]\n- [etc.]\n"
-        "Areas for Improvement:\n- [improvement point 1]\n- [improvement point 2]\n- [etc.]\n\n"
-        "IMPORTANT: The score MUST be a number between 0-100 with no other text. Do not use a scale of 0-10 or include any symbols, just the numerical value."
+    if prompt_prefix is None:
+        prompt_prefix = build_prompt_prefix(question, answer_key)
+    prompt = layout_prompt(
+        prompt_prefix, f"Student Answer: {student_answer}\n\n", EVALUATION_INSTRUCTIONS, static_first
     )
     
-    result = llm(prompt)
+    # Prompts of one question go to the Ollama server that has their prefix cached
+    result = llm(prompt, affinity=prompt_prefix)
+    return parse_evaluation(result)
+
+def parse_score(score_text):
+    """
+    Parses the text after "Score:" into an integer from 0 to 100.
+    
+    Explicit fractions such as "7/10" or "8 out of 10" are rescaled to 100. A bare number is
+    taken as a 0-100 score as the prompt requires, except a decimal of at most 10 (e.g. "7.5"),
+    which can only be a 0-10 score. Returns "Error parsing score" when no number is present.
+    """
+    fraction = re.search(r"(\d+(?:\.\d+)?)\s*(?:/|out of)\s*(\d+(?:\.\d+)?)", score_text, re.IGNORECASE)
+    if fraction and float(fraction.group(2)) > 0:
+        score = float(fraction.group(1)) / float(fraction.group(2)) * 100
+    else:
+        number = re.search(r"\d+(?:\.\d+)?", score_text)
+        if not number:
+            return "Error parsing score"
+        score = float(number.group(0))
+        if "." in number.group(0) and 0 < score <= 10:
+            score *= 10
     
+    # Ensure score is within 0-100 range
+    return int(round(max(0, min(100, score))))
+
+def parse_evaluation(result):
+    """
+    Parses a raw model completion into its structured parts.
+    
+    Returns a tuple: (score, feedback, strengths, improvements, model_thoughts)
+    """
     # Initialize default values
     model_thoughts = ""
     score = "Error"
@@ -56,22 +266,7 @@ def evaluate_answer(llm, question, answer_key, student_answer):
         # Extract Score
         if "Score:" in post_think:
             score_text = post_think.split("Score:")[1].split("\n")[0].strip()
-            try:
-                # Remove any non-numeric characters that might be present
-                score_text = ''.join(c for c in score_text if c.isdigit() or c == '.')
-                score = float(score_text)
-                
-                # Check if score appears to be on a 0-10 scale and convert if necessary
-                if score <= 10 and score > 0:
-                    # Check if this is likely a 0-10 scale score
-                    score = int(score * 10)
-                
-                # Ensure score is within 0-100 range
-                score = max(0, min(100, score))
-                score = int(score)  # Convert to integer
-                
-            except ValueError:
-                score = "Error parsing score"
+            score = parse_score(score_text)
         
         # Extract Feedback
         if "Feedback:" in post_think:
@@ -96,178 +291,432 @@ def evaluate_answer(llm, question, answer_key, student_answer):
     
     return score, feedback, strengths, improvements, model_thoughts
 
+# Extra instructions for one chunk of a long answer
+CHUNK_INSTRUCTIONS = (
+    "This is only one part of a longer answer. Judge how well this part covers the answer key "
+    "and do not penalize it for points that other parts of the answer may cover.\n\n"
+)
+
+# Instructions for combining chunk evaluations into one
+REDUCE_INSTRUCTIONS = (
+    "Combine these partial evaluations into a single evaluation of the whole answer. "
+    "Credit each point of the answer key once if any part covers it.\n\n"
+)
+
+def evaluate_long_answer(llm, question, answer_key, student_answer, prompt_prefix=None,
+                         token_budget=DEFAULT_TOKEN_BUDGET, overlap_tokens=DEFAULT_OVERLAP_TOKENS,
+                         max_workers=2, static_first=False):
+    """
+    Evaluates an answer that may exceed the model context with a map-reduce over chunks.
+    
+    Answers within token_budget go through evaluate_answer unchanged. Longer answers are
+    split into overlapping chunks that are graded in parallel (map), then one more call
+    combines the chunk evaluations into a single score and feedback (reduce). If the
+    reduce call does not yield a score, the chunk scores are averaged by chunk length.
+    
+    Returns a tuple: (score, feedback, strengths, improvements, model_thoughts)
+    """
+    if estimate_tokens(student_answer) <= token_budget:
+        return evaluate_answer(
+            llm, question, answer_key, student_answer, prompt_prefix=prompt_prefix, static_first=static_first
+        )
+    
+    if prompt_prefix is None:
+        prompt_prefix = build_prompt_prefix(question, answer_key)
+    chunks = split_into_chunks(student_answer, token_budget, overlap_tokens)
+    
+    def grade_chunk(numbered_chunk):
+        part, chunk = numbered_chunk
+        prompt = layout_prompt(
+            prompt_prefix,
+            f"Student Answer (part {part} of {len(chunks)}): {chunk}\n\n",
+            CHUNK_INSTRUCTIONS + EVALUATION_INSTRUCTIONS,
+            static_first
+        )
+        return parse_evaluation(llm(prompt, affinity=prompt_prefix))
+    
+    # Map: grade every chunk against the key
+    pool = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        chunk_results = list(pool.map(grade_chunk, enumerate(chunks, start=1)))
+    finally:
+        # A cancellation or the deadline must not wait for chunk calls still in flight
+        pool.shutdown(wait=False, cancel_futures=True)
+    
+    # Reduce: combine the partial evaluations in one more call
+    summaries = "".join(
+        f"Part {part} (score {score}):\nFeedback: {feedback}\nStrengths:\n{strengths}\n"
+        f"Areas for Improvement:\n{improvements}\n\n"
+        for part, (score, feedback, strengths, improvements, _) in enumerate(chunk_results, start=1)
+    )
+    reduce_prompt = layout_prompt(
+        prompt_prefix,
+        f"The student's answer was too long to evaluate at once, so it was evaluated in {len(chunks)} parts:\n\n" +
+        summaries,
+        REDUCE_INSTRUCTIONS + EVALUATION_INSTRUCTIONS,
+        static_first
+    )
+    score, feedback, strengths, improvements, model_thoughts = parse_evaluation(
+        llm(reduce_prompt, affinity=prompt_prefix)
+    )
+    
+    if not isinstance(score, (int, float)):
+        fallback = weighted_score((r[0], len(chunk)) for r, chunk in zip(chunk_results, chunks))
+        if fallback is not None:
+            score = fallback
+            feedback = feedback or " ".join(r[1] for r in chunk_results if r[1])
+            strengths = strengths or "\n".join(r[2] for r in chunk_results if r[2])
+            improvements = improvements or "\n".join(r[3] for r in chunk_results if r[3])
+    
+    return score, feedback, strengths, improvements, model_thoughts
+
+def parse_args(argv=None):
+    # Concurrent calls within one item that suit the Ollama host, as measured by tune_ollama.py;
+    # items themselves are graded one at a time
+    profile = load_profile(OLLAMA_MODEL)
+    parallel = profile.get("parallel") if profile else None
+    parser = argparse.ArgumentParser(description="Evaluate student answers with deepseek-r1")
+    parser.add_argument("--subject", help="Subject of the exam, used to pick its rubric")
+    parser.add_argument("--year", help="Year of the exam, used to pick its rubric")
+    parser.add_argument("--semester", help="Semester of the exam, used to pick its rubric")
+    parser.add_argument("--csv", metavar="PATH", help="Also write the results as CSV to PATH")
+    parser.add_argument("--files", nargs="+", metavar="NAME",
+                        help="Grade only these files from the student answers folder")
+    parser.add_argument("--cohort", metavar="PATH",
+                        help="Grade a single JSONL or CSV cohort file instead of the student answers folder")
+    parser.add_argument("--append", action="store_true",
+                        help="Add the results to the current records journal instead of starting a new run "
+                             "(no HTML report is written)")
+    parser.add_argument("--schedule", choices=SCHEDULES, default="student",
+                        help="Grade student by student, or question by question with a shared prompt prefix "
+                             "that Ollama can serve from its prompt cache; the question schedule reads the "
+                             "whole cohort first and writes the HTML/CSV report at the end (default: %(default)s)")
+    parser.add_argument("--archive", default=ARCHIVE_FILE, metavar="PATH",
+                        help="Store every raw completion here for reparse.py (default: %(default)s)")
+    parser.add_argument("--no-archive", action="store_true", help="Do not store raw completions")
+    parser.add_argument("--reuse-archive", action="store_true",
+                        help="Take the archived result of an identical item (same question, answer key, answer "
+                             "and grading settings) instead of calling the model")
+    parser.add_argument("--semantic-cache", action="store_true",
+                        help="Reuse the grade of a near-identical earlier answer to the same question instead of "
+                             "calling the model, and index every graded answer (see semantic_cache.py)")
+    parser.add_argument("--similarity-threshold", type=float, metavar="COSINE",
+                        help="Similarity from which --semantic-cache reuses a grade (default: 0.95)")
+    parser.add_argument("--plan", action="store_true",
+                        help="Only estimate the run: model calls, prompt/completion tokens and wall time per "
+                             "student, with outliers flagged; nothing is graded")
+    parser.add_argument("--plan-json", action="store_true", help="Print the --plan estimate as JSON")
+    parser.add_argument("--long-answers", action="store_true",
+                        help="Grade answers over the token budget in overlapping chunks")
+    parser.add_argument("--long-answer-tokens", type=int, default=DEFAULT_TOKEN_BUDGET,
+                        help="Token budget for a student answer in one prompt (default: %(default)s)")
+    parser.add_argument("--chunk-overlap", type=int, default=DEFAULT_OVERLAP_TOKENS,
+                        help="Tokens shared between consecutive chunks (default: %(default)s)")
+    parser.add_argument("--chunk-workers", type=int, default=parallel or 2,
+                        help="Chunks graded concurrently (default: %(default)s)")
+    parser.add_argument("--client", choices=("native", "langchain"), default="native",
+                        help="Ollama client: the pooled, load-balanced native client or LangChain's "
+                             "(default: %(default)s)")
+    parser.add_argument("--endpoints", default=OLLAMA_ENDPOINTS,
+                        help="Comma-separated Ollama base URLs for the native client (default: %(default)s)")
+    parser.add_argument("--keep-alive", metavar="DURATION",
+                        help="Ollama keep_alive sent with every call, e.g. 30m or -1 to keep the model loaded "
+                             "(default: the server's; the app passes its pin)")
+    parser.add_argument("--call-timeout", type=int, default=DEFAULT_CALL_TIMEOUT,
+                        help="Seconds before a model call times out (default: %(default)s)")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES,
+                        help="Extra attempts for a failed or timed-out model call (default: %(default)s)")
+    parser.add_argument("--deadline", type=float,
+                        help="Seconds for the whole run; items left at the deadline are marked as not graded")
+    parser.add_argument("--consistency", action="store_true",
+                        help="Sample each item several times and report the median of agreeing scores")
+    parser.add_argument("--samples", type=int, default=DEFAULT_MAX_SAMPLES,
+                        help="Most samples per item in consistency mode (default: %(default)s)")
+    parser.add_argument("--agreement", type=int, default=DEFAULT_MIN_AGREEMENT,
+                        help="Samples that must agree before stopping early, so also the fewest per item (default: %(default)s)")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Largest score difference that still counts as agreement (default: %(default)s)")
+    parser.add_argument("--sample-workers", type=int, default=parallel or DEFAULT_SAMPLE_WORKERS,
+                        help="Samples drawn concurrently (default: %(default)s)")
+    return parser.parse_args(argv)
+
 def main():
-    # Load questions and answer keys
-    questions = load_text_file(QUESTIONS_FILE)
-    answers = load_text_file(ANSWERS_FILE)
+    args = parse_args()
     
-    if len(questions) != len(answers):
-        print("Error: The number of questions and answers do not match!")
+    # Load questions and answer keys for this exam
+    try:
+        rubric = registry.get(args.subject, args.year, args.semester)
+    except RubricError as e:
+        print(f"Error: {e}")
         return
+    print(f"Using rubric {rubric.questions_file} / {rubric.answers_file} ({len(rubric)} questions)")
 
-    evaluations = []
-
-    # List all student answer files in the folder
-    student_files = [f for f in os.listdir(STUDENT_ANSWERS_FOLDER) if f.endswith(".txt")]
+    # List all student answer files in the folder, in the order they appear in the report
+    if args.cohort:
+        student_files = [args.cohort]
+    else:
+        student_files = sorted(
+            os.path.join(STUDENT_ANSWERS_FOLDER, f) for f in os.listdir(STUDENT_ANSWERS_FOLDER)
+            if f.endswith(STUDENT_FILE_EXTENSIONS)
+        )
+        if args.files:
+            wanted = {os.path.basename(f) for f in args.files}
+            student_files = [f for f in student_files if os.path.basename(f) in wanted]
     if not student_files:
         print("Error: No student answer files found in the folder.")
         return
 
-    # Initialize the LangChain Ollama LLM for deepseek‑r1 with 8 threads.
-    llm = Ollama(model="deepseek-r1", base_url="http://127.0.0.1:11434")
+    if args.plan or args.plan_json:
+        # Estimate only; nothing is graded, so no model connection is made
+        from run_planner import format_plan, plan_run
+        archive = CompletionArchive(args.archive) if os.path.exists(args.archive) else None
+        semantic = open_semantic_cache(args)
+        try:
+            plan = plan_run(args, rubric, iter_student_answers(student_files), archive, semantic)
+        except CohortError as e:
+            raise SystemExit(f"Error: {e}")
+        finally:
+            if archive:
+                archive.close()
+            if semantic:
+                semantic.close()
+        print(json.dumps(plan, indent=2) if args.plan_json else "\n".join(format_plan(plan)))
+        return
+
+    # The app stops a run with SIGTERM; the deadline and call limits keep one hung call from stalling it
+    control = RunControl(args.deadline)
+    control.install()
     
-    for student_file in student_files:
-        student_name, _ = os.path.splitext(student_file)
-        student_file_path = os.path.join(STUDENT_ANSWERS_FOLDER, student_file)
-        student_answers = load_text_file(student_file_path)
+    # Connect to deepseek‑r1 only now, so runs that stop on a rubric or input error above do not pay for it
+    # Runtime options tuned for this host by tune_ollama.py, if any
+    profile = load_profile(OLLAMA_MODEL)
+    options = profile["options"] if profile else None
+    if options:
+        print(f"Using Ollama options {options} from {OLLAMA_CLIENT_CONFIG['PROFILE']}")
+    pool = None
+    if args.client == "langchain":
+        client = LangChainLLM(OLLAMA_MODEL, OLLAMA_BASE_URL, timeout=args.call_timeout, options=options,
+                              keep_alive=args.keep_alive)
+    else:
+        pool = OllamaPool(args.endpoints)
+        client = OllamaLLM(pool, OLLAMA_MODEL, timeout=args.call_timeout, options=options,
+                           keep_alive=args.keep_alive)
+    cache_stats = PromptCacheStats()
+    llm = RetryingLLM(client, retries=args.retries, control=control, cache_stats=cache_stats)
+    
+    # Exam identifiers stored with every record so analytics can filter by cohort
+    exam_fields = {
+        "Subject": args.subject or "Unknown",
+        "Year": args.year or "Unknown",
+        "Semester": args.semester or "Unknown"
+    }
+    
+    # Raw completions are kept so a parser change can be applied later without the model
+    archive = None
+    if not args.no_archive:
+        archive = CompletionArchive(args.archive)
+        archive.start_run(append=args.append)
+    semantic = open_semantic_cache(args)
+    
+    html_file = None if args.append else HTML_RESULTS_FILE
+    try:
+        stop_reason = grade_students(
+            args, llm, control, rubric, student_files, html_file, exam_fields, archive, semantic
+        )
+        if semantic:
+            print(semantic.summary())
+    except CohortError as e:
+        # Exit non-zero so the app reports the job as failed; results graded so far are kept
+        raise SystemExit(f"Error: {e}")
+    finally:
+        if archive:
+            archive.close()
+        if semantic:
+            semantic.close()
+        if pool:
+            pool.close()
+    print(cache_stats.summary())
+    if pool:
+        for endpoint in pool.stats():
+            latency = endpoint["latencyMs"] or {}
+            print(f"Ollama {endpoint['url']}: {endpoint['requests']} requests, {endpoint['failures']} failed, "
+                  f"p50 {latency.get('p50', '-')} ms, p95 {latency.get('p95', '-')} ms")
+    if stop_reason:
+        # Worker threads may still be in a model call (chunks, samples); the interpreter would
+        # join them at exit and outlast the app's grace period, so they are abandoned instead
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(PARTIAL_EXIT_CODE)
+
+def open_semantic_cache(args):
+    """The semantic cache of graded answers when --semantic-cache is given, else None"""
+    if not args.semantic_cache:
+        return None
+    # Imported only here, so runs without the cache never load NumPy
+    from semantic_cache import SemanticCache
+    return SemanticCache(threshold=args.similarity_threshold)
+
+def grade_students(args, llm, control, rubric, student_files, html_file, exam_fields, archive=None, semantic=None):
+    """
+    Grade every student in student_files and write the report files, archiving the raw
+    completions of every item when an archive is given. With a semantic cache, near-identical
+    earlier answers lend their grade and every graded answer is indexed.
+    
+    Returns why grading stopped early (deadline or cancellation), or None. Items left at that
+    point are still written, marked as not graded, so the report covers every student.
+    """
+    questions = rubric.questions
+    settings = {name: getattr(args, name) for name in GRADING_SETTINGS}
+    # Single-answer regrades from the app go first; this run pauses between items while one is held
+    lane = PriorityLane()
+    
+    # Model calls spent in consistency mode, ungraded items and why the run stopped, for the summary
+    progress = {"samples_used": 0, "ungraded": 0, "reused": 0, "stop_reason": None}
+    
+    def grade(student_name, student_answers, i, question, answer_key, prompt_prefix):
+        """Grade one item, or mark it as not graded once the run has to stop; returns its record"""
+        student_answer = student_answers.get(i) or "No answer provided."
+        if not progress["stop_reason"]:
+            waited = lane.wait_until_clear(control.stop_reason)
+            if waited >= 1:
+                print(f"Paused {waited:.1f}s for a priority regrade")
+        stop_reason = progress["stop_reason"] = progress["stop_reason"] or control.stop_reason()
+        consistency_fields = {}
+        recorder = CompletionRecorder(llm)
+        seconds = None
+        reused = similar = None
+        if archive and args.reuse_archive and not stop_reason:
+            reused = archive.lookup(item_key(question, answer_key, student_answer, settings))
+        if semantic and not reused and not stop_reason:
+            similar = semantic.lookup(question, answer_key, student_answer, settings)
+        if stop_reason:
+            evaluation = ungraded_evaluation(stop_reason)
+        elif reused:
+            # The same answer to the same question was graded with the same settings before
+            archived, completions = reused
+            print(f"Reusing the archived result of {student_name} - Question {i}")
+            evaluation = tuple(archived.get(field, "") for field in EVALUATION_FIELDS)
+            consistency_fields = {f: archived[f] for f in ("Samples Used", "Score Spread") if f in archived}
+            recorder.completions.extend(completions)
+            progress["reused"] += 1
+        elif similar:
+            # A near-identical answer to the same question was graded before; the record says which
+            earlier, similarity = similar
+            print(f"Reusing the grade of a similar answer ({similarity:.3f}) for {student_name} - Question {i}")
+            evaluation = tuple(earlier.get(field, "") for field in EVALUATION_FIELDS)
+            consistency_fields = {
+                **{f: earlier[f] for f in ("Samples Used", "Score Spread") if f in earlier},
+                "Reused From": earlier.get("Student Name", "Unknown"),
+                "Similarity": round(similarity, 3)
+            }
+        else:
+            print(f"Evaluating {student_name} - Question {i}...")
+            started = time.monotonic()
+            try:
+                with control.interruptible():
+                    evaluation, consistency_fields = grade_item(
+                        args, recorder, question, answer_key, student_answer, prompt_prefix
+                    )
+                seconds = time.monotonic() - started
+            except ModelCallFailed as e:
+                print(f"Warning: {student_name} - Question {i} not graded, {e}")
+                evaluation = ungraded_evaluation(str(e))
+            except RunInterrupted as e:
+                progress["stop_reason"] = str(e)
+                evaluation = ungraded_evaluation(progress["stop_reason"])
+            if consistency_fields:
+                progress["samples_used"] += consistency_fields["Samples Used"]
+        score, feedback, strengths, improvements, model_thoughts = evaluation
+        if score == UNGRADED_SCORE:
+            progress["ungraded"] += 1
         
+        record = {
+            "Student Name": student_name,
+            **exam_fields,
+            "Question Number": i,
+            "Question": question,
+            "Answer Key": answer_key,
+            "Student Answer": student_answer,
+            "Score": score,
+            "Feedback": feedback,
+            "Strengths": strengths,
+            "Areas for Improvement": improvements,
+            "Model_Thoughts": model_thoughts,
+            **consistency_fields
+        }
+        if archive:
+            archive.store(record, list(recorder.completions), settings, seconds)
+        if semantic and seconds is not None:
+            # Only answers the model graded just now; reused grades are already indexed
+            semantic.add(record, settings)
+        return record
+    
+    def check_answers(student_name, student_answers):
         if len(student_answers) < len(questions):
             print(f"Warning: {student_name} has fewer answers than questions. Missing answers will be marked as 'No answer provided.'")
-        
-        for i, (question, answer_key) in enumerate(zip(questions, answers), start=1):
-            student_answer = student_answers[i-1] if i-1 < len(student_answers) else "No answer provided."
-            print(f"Evaluating {student_name} - Question {i}...")
-            score, feedback, strengths, improvements, model_thoughts = evaluate_answer(llm, question, answer_key, student_answer)
-            
-            evaluations.append({
-                "Student Name": student_name,
-                "Question": question,
-                "Answer Key": answer_key,
-                "Student Answer": student_answer,
-                "Score": score,
-                "Feedback": feedback,
-                "Strengths": strengths,
-                "Areas for Improvement": improvements,
-                "Model_Thoughts": model_thoughts
-            })
-    
-    # Create a DataFrame from evaluations
-    df = pd.DataFrame(evaluations)
-
-    # Generate fancy HTML output
-    html_content = """
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Evaluation Results</title>
-    <style>
-        body {
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            line-height: 1.6;
-            color: #333;
-            max-width: 1200px;
-            margin: 0 auto;
-            padding: 20px;
-        }
-        .evaluation-card {
-            background-color: #fff;
-            border-radius: 8px;
-            box-shadow: 0 4px 8px rgba(0,0,0,0.1);
-            margin-bottom: 24px;
-            padding: 20px;
-            border-left: 5px solid #4285f4;
-        }
-        .student-info {
-            display: flex;
-            justify-content: space-between;
-            border-bottom: 1px solid #eee;
-            padding-bottom: 10px;
-            margin-bottom: 15px;
-        }
-        .student-name {
-            font-size: 1.4rem;
-            font-weight: bold;
-            color: #4285f4;
-        }
-        .score {
-            font-size: 1.4rem;
-            font-weight: bold;
-        }
-        .score-high {
-            color: #0f9d58;
-        }
-        .score-medium {
-            color: #f4b400;
-        }
-        .score-low {
-            color: #db4437;
-        }
-        .question {
-            font-weight: bold;
-            margin-bottom: 10px;
-        }
-        .section {
-            margin-top: 15px;
-        }
-        .section-title {
-            font-weight: bold;
-            margin-bottom: 5px;
-        }
-        .strengths {
-            background-color: #e6f4ea;
-            border-radius: 4px;
-            padding: 10px;
-        }
-        .improvements {
-            background-color: #fce8e6;
-            border-radius: 4px;
-            padding: 10px;
-        }
-    </style>
-</head>
-<body>
-    <h1>Evaluation Results</h1>
-"""
-
-    # Group by student name
-    for student, group in df.groupby("Student Name"):
-        for _, row in group.iterrows():
-            score_class = "score-high" if isinstance(row["Score"], (int, float)) and row["Score"] >= 80 else \
-                         "score-medium" if isinstance(row["Score"], (int, float)) and row["Score"] >= 60 else \
-                         "score-low"
-            
-            html_content += f"""
-            <div class="evaluation-card">
-                <div class="student-info">
-                    <div class="student-name">{row["Student Name"]}</div>
-                    <div class="score {score_class}">Score: {row["Score"]}</div>
-                </div>
-                
-                <div class="question">{row["Question"]}</div>
-                
-                <div class="section">
-                    <div class="section-title">Student Answer:</div>
-                    <p>{row["Student Answer"]}</p>
-                </div>
-                
-                <div class="section">
-                    <div class="section-title">Feedback:</div>
-                    <p>{row["Feedback"]}</p>
-                </div>
-                
-                <div class="section strengths">
-                    <div class="section-title">Strengths:</div>
-                    <p>{row["Strengths"]}</p>
-                </div>
-                
-                <div class="section improvements">
-                    <div class="section-title">Areas for Improvement:</div>
-                    <p>{row["Areas for Improvement"]}</p>
-                </div>
-            </div>
-            """
-
-    html_content += """
-</body>
-</html>
-"""
+    
+    # Results are streamed to the report files as each item is graded
+    with ReportWriter(html_file, records_file=RECORDS_FILE, csv_file=args.csv, append=args.append) as writer:
+        if args.schedule == "question":
+            # Every student's answer to one question in a row, so each prompt shares the instructions,
+            # question and answer key with the one before and Ollama only evaluates the student's part.
+            # The journal still gets every record as it is graded; the HTML/CSV report is grouped by
+            # student, so it is written once the last question is done.
+            students = []
+            for student_name, student_answers in iter_student_answers(student_files):
+                check_answers(student_name, student_answers)
+                students.append((student_name, student_answers))
+            records = [[] for _ in students]
+            for i, question, answer_key, prompt_prefix in rubric.items():
+                for student_records, (student_name, student_answers) in zip(records, students):
+                    record = grade(student_name, student_answers, i, question, answer_key, prompt_prefix)
+                    writer.write_journal(record)
+                    student_records.append(record)
+            for student_records in records:
+                for record in student_records:
+                    writer.write_report(record)
+        else:
+            # Students are read one at a time, so grading starts before a cohort file is fully parsed
+            for student_name, student_answers in iter_student_answers(student_files):
+                check_answers(student_name, student_answers)
+                for i, question, answer_key, prompt_prefix in rubric.items():
+                    writer.write(grade(student_name, student_answers, i, question, answer_key, prompt_prefix))
 
-    with open("evaluation_results.html", "w", encoding="utf-8") as html_file:
-        html_file.write(html_content)
+    stop_reason = progress["stop_reason"]
+    print(f"Evaluation complete. {writer.count} results saved to {html_file or RECORDS_FILE}")
+    if args.csv:
+        print(f"CSV results saved to {args.csv}")
+    if args.consistency and writer.count:
+        print(f"Consistency mode used {progress['samples_used'] / writer.count:.2f} samples per item on average "
+              f"(at most {args.samples})")
+    if progress["reused"]:
+        print(f"{progress['reused']} item(s) reused from the completion archive")
+    if progress["ungraded"]:
+        print(f"{progress['ungraded']} item(s) not graded" + (f", stopped early: {stop_reason}" if stop_reason else ""))
+    return stop_reason
 
-    print("Evaluation complete. Results saved to evaluation_results.html")
+def grade_item(args, llm, question, answer_key, student_answer, prompt_prefix):
+    """Grade one item; returns (evaluation, extra record fields of consistency mode)"""
+    static_first = args.schedule == "question"
+    
+    def grade_once():
+        if args.long_answers:
+            return evaluate_long_answer(
+                llm, question, answer_key, student_answer, prompt_prefix=prompt_prefix,
+                token_budget=args.long_answer_tokens, overlap_tokens=args.chunk_overlap,
+                max_workers=args.chunk_workers, static_first=static_first
+            )
+        return evaluate_answer(
+            llm, question, answer_key, student_answer, prompt_prefix=prompt_prefix, static_first=static_first
+        )
+    
+    if not args.consistency:
+        return grade_once(), {}
+    evaluation, stats = sample_until_agreement(
+        grade_once, max_samples=args.samples, min_agreement=args.agreement,
+        tolerance=args.tolerance, max_workers=args.sample_workers
+    )
+    return evaluation, {"Samples Used": stats["samples"], "Score Spread": stats["spread"]}
 
 if __name__ == "__main__":
     main()
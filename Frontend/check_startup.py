@@ -0,0 +1,109 @@
+"""
+Startup budget check for the grader CLI and the Flask app.
+
+Runs each entry point in a fresh interpreter with `python -X importtime` and
+fails when it takes longer than its budget or imports a heavy dependency that
+only some code paths need (LangChain, BeautifulSoup, NumPy, pyarrow, pandas).
+Those must be imported where they are used, not at module load:
+
+    python check_startup.py
+    python check_startup.py --cli-budget-ms 80 --app-budget-ms 350 --repeat 5
+
+The CLI is measured as the import of auto_checker_v3, everything a run does before
+it reaches the model. The app is measured to its first response: importing app
+and serving GET /status through the test client. The best of --repeat runs is
+compared with the budget, and the slowest imports are listed to show where the
+time goes. Exits with status 1 when a check fails.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# Modules that must not be loaded at startup; each is imported on the path that needs it
+LAZY_MODULES = {
+    "cli": ("langchain", "langchain_community", "pandas", "numpy"),
+    "app": ("langchain", "langchain_community", "pandas", "bs4", "numpy", "pyarrow")
+}
+
+ENTRY_POINTS = {
+    "cli": "import auto_checker_v3",
+    "app": (
+        "import os, time\n"
+        "os.environ['OLLAMA_WARMUP_ON_START'] = '0'\n"
+        "started = time.perf_counter()\n"
+        "import app\n"
+        "app.app.test_client().get('/status')\n"
+        "print(f'first-request-ms {(time.perf_counter() - started) * 1000:.1f}')\n"
+    )
+}
+
+DEFAULT_BUDGETS_MS = {"cli": 150, "app": 450}
+SLOWEST_SHOWN = 8
+
+
+def parse_importtime(stderr):
+    """Return [(cumulative microseconds, module, depth)] from -X importtime output"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((int(cumulative), name.strip(), depth))
+    return entries
+
+
+def measure(entry, cwd):
+    """Run one entry point in a fresh interpreter; returns (elapsed ms, import entries)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", ENTRY_POINTS[entry]],
+        cwd=cwd, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{entry} failed to start:\n{result.stderr[-2000:]}")
+    entries = parse_importtime(result.stderr)
+    if entry == "app":
+        elapsed = float(result.stdout.split("first-request-ms")[1].split()[0])
+    else:
+        elapsed = next(cumulative for cumulative, name, _ in entries if name == "auto_checker_v3") / 1000
+    return elapsed, entries
+
+
+def check(entry, budget_ms, repeat, cwd):
+    """Measure an entry point and print its report; returns True when it is within budget"""
+    runs = [measure(entry, cwd) for _ in range(max(1, repeat))]
+    elapsed, entries = min(runs, key=lambda run: run[0])
+    loaded = {name for _, name, _ in entries}
+    eager = [module for module in LAZY_MODULES[entry] if module in loaded]
+
+    ok = elapsed <= budget_ms and not eager
+    print(f"{entry}: {elapsed:.1f} ms (budget {budget_ms} ms, best of {len(runs)}) {'OK' if ok else 'FAIL'}")
+    if eager:
+        print(f"  imported at startup but should be lazy: {', '.join(eager)}")
+    top_level = sorted((e for e in entries if e[2] == 1), reverse=True)[:SLOWEST_SHOWN]
+    for cumulative, name, _ in top_level:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check startup time and lazy imports of the entry points")
+    parser.add_argument("--cli-budget-ms", type=float, default=DEFAULT_BUDGETS_MS["cli"],
+                        help="Budget for importing the grader (default: %(default)s)")
+    parser.add_argument("--app-budget-ms", type=float, default=DEFAULT_BUDGETS_MS["app"],
+                        help="Budget for the app's first response (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per entry point, best one counts")
+    parser.add_argument("--only", choices=sorted(ENTRY_POINTS), help="Check a single entry point")
+    args = parser.parse_args()
+
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    budgets = {"cli": args.cli_budget_ms, "app": args.app_budget_ms}
+    entries = [args.only] if args.only else list(ENTRY_POINTS)
+    results = [check(entry, budgets[entry], args.repeat, cwd) for entry in entries]
+    if not all(results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
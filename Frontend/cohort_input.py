@@ -0,0 +1,113 @@
+"""
+Single-file cohort input for the grader.
+
+Besides one .txt file per student (one answer per line), a whole cohort can be
+given as one JSONL or CSV file with one row per answer:
+
+    {"student": "Ali", "question": 1, "answer": "..."}        (JSONL)
+    student,question,answer                                    (CSV, quoted
+    Ali,1,"An answer that may span several lines"              fields may hold newlines)
+
+Question ids are the 1-based question numbers of the rubric. Files are parsed as
+a stream in a single pass and yield one student at a time, as soon as the next
+student's first row is read, so memory stays flat with cohort size. The rows of
+a student must therefore be contiguous (sort the file by student); a student
+whose rows resume after another student's is rejected with a CohortError naming
+both rows.
+"""
+import csv
+import json
+import os
+
+from rubrics import load_text_file
+
+COHORT_EXTENSIONS = (".jsonl", ".csv")
+TEXT_EXTENSION = ".txt"
+# Every file type the grader accepts in the student answers folder
+STUDENT_FILE_EXTENSIONS = (TEXT_EXTENSION,) + COHORT_EXTENSIONS
+
+# Accepted column names for each field
+FIELD_ALIASES = {
+    "student": ("student", "student_name", "name"),
+    "question": ("question", "question_id", "question_number"),
+    "answer": ("answer", "student_answer")
+}
+
+
+class CohortError(ValueError):
+    """Raised when a cohort file has a missing column or an invalid row"""
+
+
+def is_cohort_file(path):
+    return path.lower().endswith(COHORT_EXTENSIONS)
+
+
+def _field(row, field, where):
+    if not isinstance(row, dict):
+        raise CohortError(f"{where}: expected an object with student, question and answer")
+    for alias in FIELD_ALIASES[field]:
+        if alias in row and row[alias] is not None:
+            return row[alias]
+    raise CohortError(f"{where}: missing '{field}' (accepted names: {', '.join(FIELD_ALIASES[field])})")
+
+
+def _json_lines(f, path):
+    for n, line in enumerate(f, start=1):
+        if line.strip():
+            try:
+                yield f"{path} line {n}", json.loads(line)
+            except ValueError as e:
+                raise CohortError(f"{path} line {n}: invalid JSON ({e})")
+
+
+def iter_rows(path):
+    """Yield (row location, student, question number, answer) for every row of a JSONL or CSV cohort file"""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            reader = csv.DictReader(f)
+            if reader.fieldnames:
+                reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+            rows = ((f"{path} row {reader.line_num}", row) for row in reader)
+        else:
+            rows = _json_lines(f, path)
+
+        for where, row in rows:
+            question = _field(row, "question", where)
+            try:
+                question = int(str(question).strip())
+            except ValueError:
+                raise CohortError(f"{where}: question id must be a question number")
+            student = str(_field(row, "student", where)).strip()
+            answer = str(_field(row, "answer", where)).strip()
+            yield where, student, question, answer
+
+
+def iter_cohort(path):
+    """Yield (student, {question number: answer}) as soon as the next student's first row is read"""
+    last_rows = {}   # student -> location of their last row, for the students already yielded
+    student = None
+    answers = {}
+    for where, name, question, answer in iter_rows(path):
+        if name != student:
+            if student is not None:
+                yield student, answers
+            if name in last_rows:
+                raise CohortError(
+                    f"{where}: rows of student '{name}' are not contiguous (their earlier rows end at "
+                    f"{last_rows[name]}); sort the file by student"
+                )
+            student, answers = name, {}
+        answers[question] = answer
+        last_rows[name] = where
+    if student is not None:
+        yield student, answers
+
+
+def iter_student_answers(paths):
+    """Yield (student, {question number: answer}) for .txt student files and cohort files alike"""
+    for path in paths:
+        if is_cohort_file(path):
+            yield from iter_cohort(path)
+        else:
+            student_name, _ = os.path.splitext(os.path.basename(path))
+            yield student_name, dict(enumerate(load_text_file(path), start=1))
@@ -0,0 +1,180 @@
+"""
+Archive of the raw model completions behind every graded item.
+
+Parsing a completion into a score and feedback is cheap; producing it is not.
+The grader stores every completion it receives, zlib-compressed and keyed by
+run, student and question, together with the item's record and the grading
+settings that shaped its prompts. reparse.py replays an item's grading from
+the archive with the current parsing rules, so parser changes can be applied
+to past runs without calling the model again, and the archive doubles as a
+benchmark and regression corpus for the parser.
+
+Completions are matched back to their calls by a hash of the prompt, so the
+prompts themselves are not stored. The archive is a SQLite database in WAL
+mode, like the shared job store:
+
+    items  run_id, student, question, position, record, settings, completions,
+           archived_at, item_key, seconds
+
+A new grader run starts a new run id; an --append run adds to the latest one,
+replacing items that are graded again, like the records journal. item_key
+identifies an item's inputs (question, answer key, answer and grading settings)
+so the grader can reuse an earlier result for an identical item, and seconds is
+the time grading took, which the run planner uses to estimate model speed.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import zlib
+from datetime import datetime
+
+ARCHIVE_FILE = "completion_archive.db"
+COMPRESSION_LEVEL = 6
+
+# Grader options that change the prompts or how completions are combined into a result
+GRADING_SETTINGS = (
+    "schedule", "long_answers", "long_answer_tokens", "chunk_overlap", "chunk_workers",
+    "consistency", "samples", "agreement", "tolerance", "sample_workers"
+)
+# Settings that only change how fast an item is graded, not its result
+CONCURRENCY_SETTINGS = ("chunk_workers", "sample_workers")
+
+
+def prompt_hash(prompt):
+    return hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+
+
+def item_key(question, answer_key, student_answer, settings):
+    """Hash of everything that determines an item's prompts and result"""
+    relevant = {name: value for name, value in settings.items() if name not in CONCURRENCY_SETTINGS}
+    return hashlib.sha1(
+        json.dumps([question, answer_key, student_answer, relevant], sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def pack(value):
+    """JSON-encode and compress a value for storage"""
+    return zlib.compress(json.dumps(value, ensure_ascii=False).encode("utf-8"), COMPRESSION_LEVEL)
+
+
+def unpack(blob):
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+class CompletionRecorder:
+    """Wraps the LLM for one item and keeps (prompt hash, completion) of every successful call"""
+
+    def __init__(self, llm):
+        self.llm = llm
+        self.completions = []
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt, affinity=None):
+        completion = self.llm(prompt, affinity=affinity)
+        # Chunks and consistency samples call from worker threads
+        with self._lock:
+            self.completions.append([prompt_hash(prompt), completion])
+        return completion
+
+
+class CompletionArchive:
+    """Stores and reads archived completions; use from one thread"""
+
+    def __init__(self, path=ARCHIVE_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS items (
+                run_id TEXT NOT NULL,
+                student TEXT NOT NULL,
+                question INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                record BLOB NOT NULL,
+                settings TEXT NOT NULL,
+                completions BLOB NOT NULL,
+                archived_at REAL NOT NULL,
+                item_key TEXT,
+                seconds REAL,
+                PRIMARY KEY (run_id, student, question)
+            )
+        """)
+        # Archives written before items were keyed lack the last two columns
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(items)")}
+        for column, kind in (("item_key", "TEXT"), ("seconds", "REAL")):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE items ADD COLUMN {column} {kind}")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS items_key ON items (item_key)")
+        self.run_id = None
+        self._positions = {}
+
+    def latest_run(self):
+        """Id of the most recently written run, or None for an empty archive"""
+        row = self.conn.execute("SELECT run_id FROM items ORDER BY archived_at DESC LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def runs(self):
+        """[(run_id, items)] from the newest run"""
+        return self.conn.execute(
+            "SELECT run_id, COUNT(*) FROM items GROUP BY run_id ORDER BY MAX(archived_at) DESC"
+        ).fetchall()
+
+    def start_run(self, append=False):
+        """Pick the run the following items belong to; appending continues the latest run"""
+        self.run_id = (self.latest_run() if append else None) or datetime.now().isoformat(timespec="microseconds")
+        # Students keep their place in the report; new students go after the existing ones
+        self._positions = dict(self.conn.execute(
+            "SELECT student, MIN(position) FROM items WHERE run_id = ? GROUP BY student", (self.run_id,)
+        ).fetchall())
+        return self.run_id
+
+    def store(self, record, completions, settings, seconds=None):
+        """Archive one graded item with the completions it was parsed from and the seconds it took"""
+        student = record["Student Name"]
+        if student not in self._positions:
+            self._positions[student] = max(self._positions.values(), default=-1) + 1
+        position = self._positions[student]
+        key = item_key(record["Question"], record["Answer Key"], record["Student Answer"], settings)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (self.run_id, student, record["Question Number"], position, pack(record),
+             json.dumps(settings), pack(completions), datetime.now().timestamp(), key, seconds)
+        )
+
+    def lookup(self, key):
+        """(record, completions) of the newest graded item with this item key, or None"""
+        row = self.conn.execute(
+            "SELECT record, completions FROM items WHERE item_key = ? "
+            "ORDER BY archived_at DESC LIMIT 1", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        record, completions = unpack(row[0]), unpack(row[1])
+        # Items that were not graded have no completions and nothing to reuse
+        return (record, completions) if completions else None
+
+    def recent(self, limit):
+        """Yield (record, settings, completions, seconds) of the newest timed items"""
+        rows = self.conn.execute(
+            "SELECT record, settings, completions, seconds FROM items WHERE seconds IS NOT NULL "
+            "ORDER BY archived_at DESC LIMIT ?", (limit,)
+        )
+        for record, settings, completions, seconds in rows:
+            yield unpack(record), json.loads(settings), unpack(completions), seconds
+
+    def rows(self, run_id=None):
+        """Yield still compressed (record, settings, completions) of a run in report order; the latest run by default"""
+        return self.conn.execute(
+            "SELECT record, settings, completions FROM items WHERE run_id = ? ORDER BY position, question",
+            (run_id or self.latest_run(),)
+        )
+
+    def items(self, run_id=None):
+        """Yield (record, settings, completions) of a run in report order; the latest run by default"""
+        for record, settings, completions in self.rows(run_id):
+            yield unpack(record), json.loads(settings), unpack(completions)
+
+    def close(self):
+        self.conn.close()
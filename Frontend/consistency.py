@@ -0,0 +1,107 @@
+"""
+Self-consistency scoring with agreement-based early stopping.
+
+One model sample per item gives noisy scores. Instead of always drawing k samples,
+samples are drawn concurrently and sampling stops as soon as enough of them agree
+within a tolerance, so clear-cut answers cost min_agreement calls (two by default)
+and only ambiguous ones use the full budget. No more samples are in flight than
+could still be needed to reach agreement, so none is left running, and uncounted,
+when it is reached. The reported score is the median of the
+agreeing samples, with the spread over all samples drawn.
+"""
+import statistics
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# Defaults for the consistency mode
+DEFAULT_MAX_SAMPLES = 5
+DEFAULT_MIN_AGREEMENT = 2
+DEFAULT_TOLERANCE = 10
+DEFAULT_SAMPLE_WORKERS = 2
+
+
+def agreeing_cluster(scores, tolerance):
+    """Largest group of scores whose range is within tolerance (sliding window over sorted scores)"""
+    ordered = sorted(scores)
+    best = ordered[:1]
+    start = 0
+    for end in range(len(ordered)):
+        while ordered[end] - ordered[start] > tolerance:
+            start += 1
+        if end - start + 1 > len(best):
+            best = ordered[start:end + 1]
+    return best
+
+
+def sample_until_agreement(draw, max_samples=DEFAULT_MAX_SAMPLES, min_agreement=DEFAULT_MIN_AGREEMENT,
+                           tolerance=DEFAULT_TOLERANCE, max_workers=DEFAULT_SAMPLE_WORKERS):
+    """
+    Call draw() until min_agreement numeric scores agree within tolerance or max_samples is reached.
+
+    draw returns an evaluation tuple (score, feedback, strengths, improvements, model_thoughts).
+    Up to max_workers samples are in flight at once, and never more than the agreeing scores still
+    missing, so every call made is one of the samples used. Returns (evaluation, stats): the sample whose
+    score is closest to the median of the agreeing samples, with its score replaced by that median,
+    and stats with the samples used, median, spread and whether agreement was reached.
+    """
+    max_samples = max(1, max_samples)
+    min_agreement = max(1, min(min_agreement, max_samples))
+    samples = []
+
+    pool = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        pending = set()
+        submitted = 0
+        missing = min_agreement
+        while True:
+            # Never have more samples in flight than could still be needed to reach agreement:
+            # each result grows the agreeing cluster by at most one
+            while submitted < max_samples and len(pending) < min(max_workers, missing):
+                pending.add(pool.submit(draw))
+                submitted += 1
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                samples.append(future.result())
+
+            scores = [s[0] for s in samples if isinstance(s[0], (int, float))]
+            cluster = agreeing_cluster(scores, tolerance) if scores else []
+            missing = min_agreement - len(cluster)
+            if missing <= 0:
+                break
+    finally:
+        # Nothing is in flight after agreement; this only cancels samples when draw raised
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    return combine_samples(samples, min_agreement, tolerance)
+
+
+def combine_samples(samples, min_agreement=DEFAULT_MIN_AGREEMENT, tolerance=DEFAULT_TOLERANCE):
+    """
+    Combine drawn evaluation samples into one, as sample_until_agreement does when it stops.
+
+    Returns (evaluation, stats); also used to re-combine archived samples without the model.
+    """
+    scores = [s[0] for s in samples if isinstance(s[0], (int, float))]
+    cluster = agreeing_cluster(scores, tolerance) if scores else []
+    stats = {
+        "samples": len(samples),
+        "agreed": len(cluster) >= min_agreement,
+        "median": None,
+        "spread": None
+    }
+    if not scores:
+        return samples[-1], stats
+
+    # Without agreement, fall back to the median of everything drawn
+    basis = cluster if stats["agreed"] else scores
+    median = statistics.median(basis)
+    stats["median"] = int(round(median))
+    stats["spread"] = max(scores) - min(scores)
+
+    chosen = min(
+        (s for s in samples if isinstance(s[0], (int, float))),
+        key=lambda s: abs(s[0] - median)
+    )
+    return (stats["median"],) + tuple(chosen[1:]), stats
@@ -0,0 +1,341 @@
+"""
+Pre-aggregated series for the "Data stuff" dashboard charts.
+
+The dashboard components only need a few hundred points each, so the raw rows
+never leave the server. A dataset is loaded once into NumPy columns
+(timestamps as datetime64, categorical columns dictionary-encoded to integer
+codes, numeric columns as float64) and every query is answered with masks and
+np.bincount over those columns. Query results are memoized until the dataset
+file changes.
+
+Configure the dataset with DASHBOARD_DATASET (a CSV file with a header row) and
+DASHBOARD_TIME_COLUMN (default "timestamp"). The parsed columns are cached next to
+the CSV as "<name>.columns.npz", so later startups skip CSV parsing.
+
+The HTTP routes live in dashboard_routes.py.
+"""
+import csv
+import math
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+DASHBOARD_CONFIG = {
+    "DATASET": os.environ.get("DASHBOARD_DATASET"),
+    "TIME_COLUMN": os.environ.get("DASHBOARD_TIME_COLUMN", "timestamp"),
+    "CACHE_SIZE": 256,
+    "DEFAULT_MAX_POINTS": 200,
+    # Largest product of the cardinalities of grouped dimensions; keeps combined codes within int64
+    "MAX_GROUP_COMBINATIONS": 2 ** 62
+}
+
+# Query bucket names mapped to NumPy datetime64 units
+TIME_BUCKETS = {"hour": "h", "day": "D", "week": "W", "month": "M", "year": "Y"}
+AGGREGATIONS = ("sum", "mean", "count", "min", "max")
+
+
+class QueryError(ValueError):
+    """Raised for query parameters that do not match the dataset."""
+
+
+class ColumnarDataset:
+    """A dataset held as NumPy columns with memoized aggregate queries"""
+
+    def __init__(self, path, time_column):
+        self.path = path
+        self.time_column = time_column
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._cache = OrderedDict()
+        self._buckets = {}
+        self.timestamps = None
+        self.numeric = {}
+        self.categorical = {}  # name -> (codes, categories)
+        self.rows = 0
+
+    # ----- Loading -----
+
+    def _cache_path(self):
+        return os.path.splitext(self.path)[0] + ".columns.npz"
+
+    def ensure_loaded(self):
+        """(Re)load the columns when the dataset file changed"""
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            cache_path = self._cache_path()
+            if os.path.exists(cache_path) and os.stat(cache_path).st_mtime_ns >= mtime:
+                self._load_npz(cache_path)
+            else:
+                self._load_csv()
+                self._save_npz(cache_path)
+            self._cache.clear()
+            # Calendar conversion is the slowest step of a time query, so do it once per load
+            self._buckets = {
+                bucket: self.timestamps.astype(f"datetime64[{unit}]").astype(np.int64)
+                for bucket, unit in TIME_BUCKETS.items()
+            }
+            self._mtime = mtime
+
+    def _load_csv(self):
+        with open(self.path, "r", encoding="utf-8", newline="") as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            columns = [[] for _ in header]
+            for row in reader:
+                for values, value in zip(columns, row):
+                    values.append(value)
+
+        if self.time_column not in header:
+            raise QueryError(f"Time column '{self.time_column}' not found in {self.path}")
+
+        self.numeric, self.categorical = {}, {}
+        for name, values in zip(header, columns):
+            if name == self.time_column:
+                self.timestamps = np.array(values, dtype="datetime64[s]")
+                continue
+            try:
+                self.numeric[name] = np.array(values, dtype=np.float64)
+            except ValueError:
+                categories, codes = np.unique(np.array(values, dtype=object).astype(str), return_inverse=True)
+                self.categorical[name] = (codes.astype(np.int32), categories)
+        self.rows = len(self.timestamps)
+
+    def _save_npz(self, cache_path):
+        arrays = {"__time__": self.timestamps.astype(np.int64)}
+        for name, values in self.numeric.items():
+            arrays[f"num:{name}"] = values
+        for name, (codes, categories) in self.categorical.items():
+            arrays[f"codes:{name}"] = codes
+            arrays[f"cats:{name}"] = categories
+        try:
+            with open(cache_path, "wb") as f:
+                np.savez(f, **arrays)
+        except OSError:
+            pass  # The cache is only an optimization
+
+    def _load_npz(self, cache_path):
+        with np.load(cache_path, allow_pickle=False) as data:
+            self.timestamps = data["__time__"].astype("datetime64[s]")
+            self.numeric, self.categorical = {}, {}
+            for key in data.files:
+                kind, _, name = key.partition(":")
+                if kind == "num":
+                    self.numeric[name] = data[key]
+                elif kind == "codes":
+                    self.categorical[name] = (data[key], data[f"cats:{name}"])
+        self.rows = len(self.timestamps)
+
+    # ----- Query helpers -----
+
+    def schema(self):
+        self.ensure_loaded()
+        return {
+            "rows": self.rows,
+            "timeColumn": self.time_column,
+            "start": str(self.timestamps.min()) if self.rows else None,
+            "end": str(self.timestamps.max()) if self.rows else None,
+            "metrics": sorted(self.numeric),
+            "dimensions": {name: len(cats) for name, (_, cats) in sorted(self.categorical.items())}
+        }
+
+    def _memoized(self, key, compute):
+        self.ensure_loaded()
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        result = compute()
+        with self._lock:
+            self._cache[key] = result
+            if len(self._cache) > DASHBOARD_CONFIG["CACHE_SIZE"]:
+                self._cache.popitem(last=False)
+        return result
+
+    def _mask(self, start, end, filters):
+        mask = None
+        if start:
+            mask = self.timestamps >= np.datetime64(start, "s")
+        if end:
+            upper = self.timestamps < np.datetime64(end, "s")
+            mask = upper if mask is None else mask & upper
+        for column, value in filters:
+            if column not in self.categorical:
+                raise QueryError(f"Unknown dimension '{column}'")
+            codes, categories = self.categorical[column]
+            position = np.searchsorted(categories, value)
+            if position >= len(categories) or categories[position] != value:
+                match = np.zeros(self.rows, dtype=bool)
+            else:
+                match = codes == position
+            mask = match if mask is None else mask & match
+        return mask
+
+    def _metric(self, metric, agg):
+        if agg not in AGGREGATIONS:
+            raise QueryError(f"Unknown aggregation '{agg}', expected one of {', '.join(AGGREGATIONS)}")
+        if agg == "count":
+            return None
+        if metric not in self.numeric:
+            raise QueryError(f"Unknown metric '{metric}'")
+        return self.numeric[metric]
+
+    def _bucket_codes(self, bucket):
+        """Integer bucket ids for every row, precomputed at load time"""
+        if bucket not in TIME_BUCKETS:
+            raise QueryError(f"Unknown bucket '{bucket}', expected one of {', '.join(TIME_BUCKETS)}")
+        return self._buckets[bucket]
+
+    @staticmethod
+    def _aggregate(groups, size, values, agg):
+        """Aggregate values per group id in [0, size) with bincount"""
+        counts = np.bincount(groups, minlength=size)
+        if agg == "count":
+            return counts.astype(np.float64), counts
+        if agg in ("sum", "mean"):
+            sums = np.bincount(groups, weights=values, minlength=size)
+            if agg == "sum":
+                return sums, counts
+            with np.errstate(invalid="ignore", divide="ignore"):
+                return sums / counts, counts
+        fill = np.inf if agg == "min" else -np.inf
+        result = np.full(size, fill)
+        (np.minimum if agg == "min" else np.maximum).at(result, groups, values)
+        return result, counts
+
+    @staticmethod
+    def _clean(values, counts):
+        """Round for transport and use None for empty groups"""
+        return [round(float(v), 4) if c else None for v, c in zip(values, counts)]
+
+    # ----- Queries -----
+
+    def timeseries(self, metric, agg="sum", bucket="day", group_by=None, max_points=None,
+                   start=None, end=None, filters=()):
+        """Metric over time buckets, optionally one series per dimension value"""
+        max_points = max(1, max_points or DASHBOARD_CONFIG["DEFAULT_MAX_POINTS"])
+        key = ("timeseries", metric, agg, bucket, group_by, max_points, start, end, tuple(filters))
+
+        def compute():
+            values = self._metric(metric, agg)
+            buckets = self._bucket_codes(bucket)
+            mask = self._mask(start, end, filters)
+            if mask is not None:
+                buckets = buckets[mask]
+                values = values[mask] if values is not None else None
+            if len(buckets) == 0:
+                return {"bucket": bucket, "bucketsPerPoint": 1, "labels": [], "series": []}
+
+            first = int(buckets.min())
+            offsets = buckets - first
+            span = int(offsets.max()) + 1
+            # Downsample by merging adjacent buckets so at most max_points remain
+            factor = math.ceil(span / max_points)
+            if factor > 1:
+                offsets = offsets // factor
+                span = math.ceil(span / factor)
+            unit = TIME_BUCKETS[bucket]
+            labels = [
+                str(np.datetime64(first + i * factor, unit))
+                for i in range(span)
+            ]
+
+            if group_by is None:
+                result, counts = self._aggregate(offsets, span, values, agg)
+                series = [{"name": metric if agg != "count" else "count", "values": self._clean(result, counts)}]
+            else:
+                if group_by not in self.categorical:
+                    raise QueryError(f"Unknown dimension '{group_by}'")
+                codes, categories = self.categorical[group_by]
+                if mask is not None:
+                    codes = codes[mask]
+                combined = codes.astype(np.int64) * span + offsets
+                result, counts = self._aggregate(combined, span * len(categories), values, agg)
+                result = result.reshape(len(categories), span)
+                counts = counts.reshape(len(categories), span)
+                present = np.flatnonzero(counts.sum(axis=1))
+                series = [
+                    {"name": str(categories[i]), "values": self._clean(result[i], counts[i])}
+                    for i in present
+                ]
+            return {"bucket": bucket, "bucketsPerPoint": factor, "labels": labels, "series": series}
+
+        return self._memoized(key, compute)
+
+    def group_by(self, dimensions, metric=None, agg="sum", start=None, end=None, filters=()):
+        """Metric per combination of one or more dimensions"""
+        key = ("groupby", tuple(dimensions), metric, agg, start, end, tuple(filters))
+
+        def compute():
+            if not dimensions:
+                raise QueryError("At least one dimension is required")
+            if len(set(dimensions)) != len(dimensions):
+                raise QueryError("Each dimension may only be given once")
+            values = self._metric(metric, agg)
+            mask = self._mask(start, end, filters)
+            combined = np.zeros(self.rows if mask is None else int(mask.sum()), dtype=np.int64)
+            sizes = []
+            for name in dimensions:
+                if name not in self.categorical:
+                    raise QueryError(f"Unknown dimension '{name}'")
+                codes, categories = self.categorical[name]
+                codes = codes if mask is None else codes[mask]
+                combined = combined * len(categories) + codes
+                sizes.append(len(categories))
+                if math.prod(sizes) > DASHBOARD_CONFIG["MAX_GROUP_COMBINATIONS"]:
+                    raise QueryError("Too many combinations of these dimensions to group by")
+            if mask is not None and values is not None:
+                values = values[mask]
+
+            # Only combinations that occur get a group, so the arrays grow with the rows, not the product
+            present, groups = np.unique(combined, return_inverse=True)
+            result, counts = self._aggregate(groups.ravel(), len(present), values, agg)
+            keys = np.unravel_index(present, sizes)
+            rows = []
+            for group in range(len(present)):
+                row = {name: str(self.categorical[name][1][keys[d][group]]) for d, name in enumerate(dimensions)}
+                row["value"] = round(float(result[group]), 4)
+                row["count"] = int(counts[group])
+                rows.append(row)
+            return {"dimensions": list(dimensions), "rows": rows}
+
+        return self._memoized(key, compute)
+
+    def top_k(self, dimension, metric=None, agg="sum", k=10, start=None, end=None, filters=()):
+        """The k dimension values with the largest metric, plus the remainder as "Other" """
+        key = ("topk", dimension, metric, agg, k, start, end, tuple(filters))
+
+        def compute():
+            if dimension not in self.categorical:
+                raise QueryError(f"Unknown dimension '{dimension}'")
+            values = self._metric(metric, agg)
+            codes, categories = self.categorical[dimension]
+            mask = self._mask(start, end, filters)
+            if mask is not None:
+                codes = codes[mask]
+                values = values[mask] if values is not None else None
+
+            result, counts = self._aggregate(codes, len(categories), values, agg)
+            present = np.flatnonzero(counts)
+            limit = min(max(k, 1), len(present))
+            if limit == 0:
+                return {"dimension": dimension, "items": [], "other": None}
+            # argpartition picks the top k in linear time; only those k are sorted
+            candidates = present[np.argpartition(-result[present], limit - 1)[:limit]]
+            top = candidates[np.argsort(-result[candidates], kind="stable")]
+            items = [
+                {"name": str(categories[i]), "value": round(float(result[i]), 4), "count": int(counts[i])}
+                for i in top
+            ]
+            other = None
+            if agg in ("sum", "count") and len(present) > limit:
+                rest = np.setdiff1d(present, top, assume_unique=True)
+                other = {"value": round(float(result[rest].sum()), 4), "count": int(counts[rest].sum())}
+            return {"dimension": dimension, "items": items, "other": other}
+
+        return self._memoized(key, compute)
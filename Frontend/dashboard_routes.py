@@ -0,0 +1,103 @@
+"""
+HTTP routes for the "Data stuff" dashboard, backed by dashboard_data.py.
+
+Routes (all GET, JSON):
+    /api/dashboard/schema
+    /api/dashboard/timeseries?metric=revenue&agg=sum&bucket=day&group_by=region&max_points=200
+    /api/dashboard/topk?dimension=country&metric=revenue&agg=sum&k=10
+    /api/dashboard/groupby?dimensions=region,device&metric=visits&agg=count
+Every route also accepts start/end (ISO dates) and repeated filter=column:value.
+"""
+import os
+import threading
+
+from flask import Blueprint, Response, jsonify, request
+
+from serialization import dump_json_bytes
+
+
+dashboard_bp = Blueprint("dashboard", __name__, url_prefix="/api/dashboard")
+
+_datasets = {}
+_datasets_lock = threading.Lock()
+
+
+def get_dataset():
+    """Return the configured dataset, or None when no dataset is configured"""
+    # NumPy and the columnar code load with the first dashboard query, not at app startup
+    from dashboard_data import ColumnarDataset, DASHBOARD_CONFIG
+    path = DASHBOARD_CONFIG["DATASET"]
+    if not path or not os.path.exists(path):
+        return None
+    with _datasets_lock:
+        dataset = _datasets.get(path)
+        if dataset is None:
+            dataset = _datasets[path] = ColumnarDataset(path, DASHBOARD_CONFIG["TIME_COLUMN"])
+    return dataset
+
+
+def _common_args():
+    filters = []
+    for item in request.args.getlist("filter"):
+        column, sep, value = item.partition(":")
+        if not sep:
+            raise ValueError(f"Filter '{item}' must look like column:value")
+        filters.append((column, value))
+    return {
+        "start": request.args.get("start") or None,
+        "end": request.args.get("end") or None,
+        "filters": tuple(sorted(filters))
+    }
+
+
+def _run_query(query):
+    dataset = get_dataset()
+    if dataset is None:
+        return jsonify({"status": "error", "message": "No dashboard dataset configured"}), 404
+    try:
+        return Response(dump_json_bytes(query(dataset)), mimetype="application/json")
+    except ValueError as e:  # includes dashboard_data.QueryError
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+
+@dashboard_bp.route("/schema")
+def dashboard_schema():
+    """Describe the dataset: row count, time range, metrics and dimensions"""
+    return _run_query(lambda dataset: dataset.schema())
+
+
+@dashboard_bp.route("/timeseries")
+def dashboard_timeseries():
+    """Bucketed and downsampled metric series for line and area charts"""
+    return _run_query(lambda dataset: dataset.timeseries(
+        request.args.get("metric"),
+        agg=request.args.get("agg", "sum"),
+        bucket=request.args.get("bucket", "day"),
+        group_by=request.args.get("group_by") or None,
+        max_points=request.args.get("max_points", None, type=int),
+        **_common_args()
+    ))
+
+
+@dashboard_bp.route("/topk")
+def dashboard_top_k():
+    """Top dimension values by a metric, for ranked lists, pies and maps"""
+    return _run_query(lambda dataset: dataset.top_k(
+        request.args.get("dimension"),
+        metric=request.args.get("metric"),
+        agg=request.args.get("agg", "sum"),
+        k=request.args.get("k", 10, type=int),
+        **_common_args()
+    ))
+
+
+@dashboard_bp.route("/groupby")
+def dashboard_group_by():
+    """Metric per combination of dimensions, for grouped bars and funnels"""
+    dimensions = [d for d in request.args.get("dimensions", "").split(",") if d]
+    return _run_query(lambda dataset: dataset.group_by(
+        dimensions,
+        metric=request.args.get("metric"),
+        agg=request.args.get("agg", "sum"),
+        **_common_args()
+    ))
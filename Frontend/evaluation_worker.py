@@ -0,0 +1,52 @@
+"""
+Evaluation worker for production serving.
+
+Runs queued evaluation jobs outside the web processes. Start one or more of these
+next to the Flask app with the same EVALUATION_STATE_DB, and run the app with
+EVALUATION_JOB_MODE=queue so /start_evaluation only queues the job:
+
+    EVALUATION_STATE_DB=jobs.db python evaluation_worker.py
+
+Several workers can poll the same database; each queued job is claimed by exactly
+one of them.
+"""
+import argparse
+import logging
+import os
+import time
+
+from app import APP_CONFIG, job_store, run_auto_checker
+
+logger = logging.getLogger("evaluation_worker")
+
+
+def work_loop(poll_interval):
+    """Claim and run queued jobs until interrupted"""
+    while True:
+        claimed = job_store.claim()
+        if claimed is None:
+            time.sleep(poll_interval)
+            continue
+
+        job_id, params = claimed
+        logger.info(f"Worker {os.getpid()} claimed evaluation job {job_id}")
+        run_auto_checker(job_id, exam=params.get("exam"), files=params.get("files"), deadline=params.get("deadline"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run queued evaluation jobs")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between queue polls")
+    args = parser.parse_args()
+
+    if not APP_CONFIG["STATE_DB"]:
+        parser.error("EVALUATION_STATE_DB must point at the database shared with the web app")
+
+    logger.info(f"Evaluation worker {os.getpid()} polling {APP_CONFIG['STATE_DB']}")
+    try:
+        work_loop(args.poll_interval)
+    except KeyboardInterrupt:
+        logger.info("Evaluation worker stopped")
+
+
+if __name__ == "__main__":
+    main()
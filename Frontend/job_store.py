@@ -0,0 +1,262 @@
+"""
+Evaluation job state shared between the Flask app and evaluation workers.
+
+The Flask dev server runs everything in one process, so job state can live in
+memory. Under gunicorn every worker process has its own module globals, which
+made `/status` answer differently depending on the worker that served it. Pointing
+EVALUATION_STATE_DB at a SQLite file switches to a WAL-mode database that every
+web worker and evaluation worker reads and writes, e.g.:
+
+    EVALUATION_STATE_DB=jobs.db EVALUATION_JOB_MODE=queue gunicorn -w 4 app:app
+    EVALUATION_STATE_DB=jobs.db python evaluation_worker.py
+"""
+import json
+import sqlite3
+import threading
+import time
+
+# Shape of the status payload returned by /status
+DEFAULT_STATUS = {
+    "jobId": None,
+    "running": False,
+    "complete": False,
+    "progress": 0,
+    "message": "",
+    "error": None,
+    "cancelled": False
+}
+
+STATUS_FIELDS = ("running", "complete", "progress", "message", "error", "cancelled")
+
+# Seconds between heartbeats of a running job; the process waiting for the grader sends them
+HEARTBEAT_SECONDS = 60
+
+# Running jobs without a heartbeat for this long are treated as abandoned (crashed worker)
+STALE_JOB_SECONDS = 15 * 60
+
+# Queued jobs no evaluation worker has claimed for this long are dropped
+STALE_QUEUED_SECONDS = 6 * 60 * 60
+
+
+class MemoryJobStore:
+    """Job state kept in this process; only correct with a single server process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._status = dict(DEFAULT_STATUS)
+        self._next_id = 1
+
+    def status(self, job_id=None):
+        """Return a copy of the status of the latest job"""
+        with self._lock:
+            return dict(self._status)
+
+    def update(self, job_id=None, **fields):
+        """Update status fields of the current job"""
+        with self._lock:
+            self._status.update({k: v for k, v in fields.items() if k in STATUS_FIELDS})
+
+    def touch(self, job_id=None):
+        """Heartbeat of a running job; nothing to do in memory, where a job dies with its process"""
+
+    def begin(self, message="Starting evaluation...", params=None):
+        """Atomically start a new job; returns its id, or None if one is active"""
+        with self._lock:
+            if self._status["running"]:
+                return None
+            job_id = self._next_id
+            self._next_id += 1
+            self._status = dict(DEFAULT_STATUS, jobId=job_id, running=True, message=message)
+            return job_id
+
+    def cancel(self, job_id=None):
+        """Ask the running job to stop; returns True if there was one"""
+        with self._lock:
+            if not self._status["running"]:
+                return False
+            self._status["cancelled"] = True
+            return True
+
+    def enqueue(self, params=None):
+        raise RuntimeError("Queued jobs need a shared store; set EVALUATION_STATE_DB")
+
+    def claim(self):
+        return None
+
+
+class SQLiteJobStore:
+    """Job state in a SQLite database in WAL mode, shared by all processes on the host"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                state TEXT NOT NULL,
+                running INTEGER NOT NULL DEFAULT 0,
+                complete INTEGER NOT NULL DEFAULT 0,
+                progress INTEGER NOT NULL DEFAULT 0,
+                message TEXT NOT NULL DEFAULT '',
+                error TEXT,
+                cancelled INTEGER NOT NULL DEFAULT 0,
+                params TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id)")
+        # Databases created before jobs could be cancelled lack the column
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "cancelled" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN cancelled INTEGER NOT NULL DEFAULT 0")
+
+    def _connect(self):
+        # One connection per thread; autocommit so transactions are explicit
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row_to_status(row):
+        if row is None:
+            return dict(DEFAULT_STATUS)
+        return {
+            "jobId": row[0],
+            "running": bool(row[1]),
+            "complete": bool(row[2]),
+            "progress": row[3],
+            "message": row[4],
+            "error": row[5],
+            "cancelled": bool(row[6])
+        }
+
+    def status(self, job_id=None):
+        """Return the status of a job, or of the latest job when no id is given"""
+        conn = self._connect()
+        query = "SELECT id, running, complete, progress, message, error, cancelled FROM jobs"
+        if job_id is None:
+            row = conn.execute(query + " ORDER BY id DESC LIMIT 1").fetchone()
+        else:
+            row = conn.execute(query + " WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_status(row)
+
+    def update(self, job_id=None, **fields):
+        """Update status fields of a job (the latest one when no id is given)"""
+        fields = {k: v for k, v in fields.items() if k in STATUS_FIELDS}
+        if not fields:
+            return
+        if "running" in fields and not fields["running"]:
+            fields["state"] = "done"
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        values = list(fields.values()) + [time.time()]
+        conn = self._connect()
+        if job_id is None:
+            conn.execute(
+                f"UPDATE jobs SET {assignments}, updated_at = ? WHERE id = (SELECT MAX(id) FROM jobs)",
+                values
+            )
+        else:
+            conn.execute(f"UPDATE jobs SET {assignments}, updated_at = ? WHERE id = ?", values + [job_id])
+
+    def touch(self, job_id=None):
+        """Heartbeat of a running job, so it is not taken for abandoned however long it runs"""
+        conn = self._connect()
+        if job_id is None:
+            conn.execute("UPDATE jobs SET updated_at = ? WHERE id = (SELECT MAX(id) FROM jobs)", (time.time(),))
+        else:
+            conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def _insert_if_idle(self, state, message, params):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET state = 'done', running = 0, error = ? "
+                "WHERE (state = 'running' AND updated_at < ?) OR (state = 'queued' AND updated_at < ?)",
+                ("Job abandoned by its worker", now - STALE_JOB_SECONDS, now - STALE_QUEUED_SECONDS)
+            )
+            active = conn.execute("SELECT 1 FROM jobs WHERE state != 'done' LIMIT 1").fetchone()
+            if active:
+                conn.execute("ROLLBACK")
+                return None
+            cursor = conn.execute(
+                "INSERT INTO jobs (state, running, message, params, created_at, updated_at) VALUES (?, 1, ?, ?, ?, ?)",
+                (state, message, json.dumps(params or {}), now, now)
+            )
+            conn.execute("COMMIT")
+            return cursor.lastrowid
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def begin(self, message="Starting evaluation...", params=None):
+        """Atomically start a job in this process; returns its id, or None if one is active"""
+        return self._insert_if_idle("running", message, params)
+
+    def enqueue(self, params=None):
+        """Queue a job for an evaluation worker; returns its id, or None if one is active"""
+        return self._insert_if_idle("queued", "Queued for evaluation...", params)
+
+    def cancel(self, job_id=None):
+        """Cancel a job (the active one when no id is given); returns True if there was one
+
+        A queued job is finished right away; a running one is flagged, and the process
+        running it stops the grader when it sees the flag.
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            query = "SELECT id, state FROM jobs WHERE state != 'done'"
+            if job_id is None:
+                row = conn.execute(query + " ORDER BY id DESC LIMIT 1").fetchone()
+            else:
+                row = conn.execute(query + " AND id = ?", (job_id,)).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return False
+            if row[1] == "queued":
+                conn.execute(
+                    "UPDATE jobs SET state = 'done', running = 0, cancelled = 1, message = ?, updated_at = ? WHERE id = ?",
+                    ("Evaluation cancelled before it started", time.time(), row[0])
+                )
+            else:
+                conn.execute("UPDATE jobs SET cancelled = 1, updated_at = ? WHERE id = ?", (time.time(), row[0]))
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def claim(self):
+        """Take the oldest queued job for this worker; returns (id, params) or None"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT id, params FROM jobs WHERE state = 'queued' ORDER BY id LIMIT 1").fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return None
+            conn.execute(
+                "UPDATE jobs SET state = 'running', message = ?, updated_at = ? WHERE id = ?",
+                ("Starting evaluation...", time.time(), row[0])
+            )
+            conn.execute("COMMIT")
+            return row[0], json.loads(row[1] or "{}")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def create_job_store(db_path=None):
+    """Return a SQLite-backed store when a database path is configured, else an in-memory one"""
+    if db_path:
+        return SQLiteJobStore(db_path)
+    return MemoryJobStore()
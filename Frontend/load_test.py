@@ -0,0 +1,329 @@
+"""
+Load generator for the Flask API.
+
+Simulates a class of browsers hitting the app at once: worker threads send a
+weighted mix of requests for a fixed duration. The report gives throughput,
+p50/p95/p99 latency and the error rate per route. The app is either driven
+in-process through Flask's test client (no network, measures the app alone) or
+over HTTP with one keep-alive connection per worker:
+
+    python load_test.py --concurrency 30 --duration 20
+    python load_test.py --url http://127.0.0.1:5000 --mix status=5,upload=1 --upload-bytes 20000
+    python load_test.py --save baseline.json
+    python load_test.py --baseline baseline.json --max-regression 25
+
+With --baseline, the run exits with status 1 if a route's p95 latency or
+throughput got worse than --max-regression percent, or its error rate went up.
+Uploads are sent as exam "loadtest"; the files they create are removed afterwards.
+
+All workers come from one address, so the app's admission control (admission.py)
+would treat the whole run as one client and turn most requests away with 429.
+The in-process app is loaded with ADMISSION_CONTROL=0 unless the variable is set;
+start the app under test with ADMISSION_CONTROL=0 for HTTP runs too, or set it to
+1 here on purpose to measure the limits themselves.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+import numpy as np
+
+# Route name -> (method, path)
+ROUTES = {
+    "status": ("GET", "/status"),
+    "students_results": ("GET", "/api/students_results"),
+    "results": ("GET", "/results?page=1"),
+    "results_index": ("GET", "/results/students"),
+    "analytics": ("GET", "/api/analytics"),
+    "upload": ("POST", "/api/upload")
+}
+DEFAULT_MIX = "status=8,students_results=2,results=2,upload=1"
+PERCENTILES = (50, 95, 99)
+
+# Exam name of generated uploads, so their files can be told apart and removed
+LOADTEST_SUBJECT = "loadtest"
+UPLOAD_FOLDER = "student_answers"
+
+
+def parse_mix(text):
+    """Parse "route=weight,..." into {route: weight}"""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ROUTES:
+            raise ValueError(f"Unknown route '{name}', expected one of {', '.join(ROUTES)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def build_upload(size):
+    """Multipart body with a generated answer file of about size bytes"""
+    boundary = uuid.uuid4().hex
+    line = b"The answer discusses the main concept with a short example.\n"
+    content = (line * (size // len(line) + 1))[:size]
+    parts = []
+    for name, value in (("subject", LOADTEST_SUBJECT), ("year", "2024"), ("semester", "1")):
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode("utf-8")
+        )
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="answers.txt"\r\n'
+        f'Content-Type: text/plain\r\n\r\n'.encode("utf-8") + content + b"\r\n"
+    )
+    parts.append(f"--{boundary}--\r\n".encode("utf-8"))
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+class InProcessClient:
+    """Sends requests through Flask's test client; one per worker thread"""
+
+    def __init__(self):
+        # Importing the app must not start loading the model for a load test, nor rate-limit
+        # the workers, which all share one client address
+        os.environ.setdefault("OLLAMA_WARMUP_ON_START", "0")
+        os.environ.setdefault("ADMISSION_CONTROL", "0")
+        from app import app
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None, headers=None):
+        response = self.client.open(path, method=method, data=body, headers=headers or {})
+        # Read the whole body so streamed responses are timed to the end
+        response.get_data()
+        status = response.status_code
+        response.close()
+        return status
+
+    def close(self):
+        pass
+
+
+class HttpClient:
+    """Sends requests over one keep-alive HTTP connection; one per worker thread"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        try:
+            self.conn.request(method, path, body=body, headers=headers or {})
+            response = self.conn.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            # Reconnect on the next request
+            self.close()
+            raise
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def run_load(make_client, mix, concurrency, duration, upload_bytes, warmup=0, seed=0):
+    """Drive the app and return {route: [(latency seconds, ok), ...]} and the measured wall time"""
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    upload_body = build_upload(upload_bytes) if "upload" in mix else None
+    samples = {name: [] for name in names}
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(concurrency + 1)
+    timing = {}
+    failures = []
+
+    def worker(index):
+        client = None
+        rng = random.Random(seed + index)
+        local = {name: [] for name in names}
+        try:
+            client = make_client()
+            for _ in range(warmup):
+                try:
+                    send(client, rng.choices(names, weights)[0])
+                except Exception:
+                    pass
+            start_barrier.wait()
+            while time.perf_counter() < timing["end"]:
+                name = rng.choices(names, weights)[0]
+                started = time.perf_counter()
+                try:
+                    ok = send(client, name) < 400
+                except Exception:
+                    ok = False
+                local[name].append((time.perf_counter() - started, ok))
+        except threading.BrokenBarrierError:
+            pass
+        except Exception as e:
+            # Release the other workers and the caller instead of leaving them at the barrier
+            failures.append(e)
+            start_barrier.abort()
+        finally:
+            if client is not None:
+                client.close()
+            with lock:
+                for name in names:
+                    samples[name].extend(local[name])
+
+    def send(client, name):
+        method, path = ROUTES[name]
+        if name == "upload":
+            body, content_type = upload_body
+            return client.request(method, path, body=body, headers={"Content-Type": content_type})
+        return client.request(method, path)
+
+    timing["end"] = float("inf")
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    # Start measuring once every worker has its client and finished warming up
+    try:
+        start_barrier.wait()
+    except threading.BrokenBarrierError:
+        for thread in threads:
+            thread.join()
+        raise RuntimeError(f"A load worker failed to start: {failures[0]}") from failures[0]
+    started = time.perf_counter()
+    timing["end"] = started + duration
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - started
+
+
+def summarize(samples, elapsed):
+    """Per-route throughput, latency percentiles (ms) and error rate"""
+    report = {}
+    for name, entries in samples.items():
+        if not entries:
+            continue
+        latencies = np.array([latency for latency, _ in entries]) * 1000
+        errors = sum(1 for _, ok in entries if not ok)
+        report[name] = {
+            "requests": len(entries),
+            "throughput": round(len(entries) / elapsed, 2),
+            "errorRate": round(errors / len(entries), 4),
+            **{f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, np.percentile(latencies, PERCENTILES))},
+            "mean": round(float(latencies.mean()), 2)
+        }
+    return report
+
+
+def compare(report, baseline, max_regression):
+    """Lines describing each route against the baseline, and whether any route regressed"""
+    lines = []
+    regressed = False
+    for name, current in report.items():
+        before = baseline.get(name)
+        if before is None:
+            lines.append(f"{name:<18} not in baseline")
+            continue
+        p95_change = (current["p95"] - before["p95"]) / before["p95"] * 100 if before["p95"] else 0.0
+        rps_change = (current["throughput"] - before["throughput"]) / before["throughput"] * 100 if before["throughput"] else 0.0
+        worse = (
+            p95_change > max_regression
+            or rps_change < -max_regression
+            or current["errorRate"] > before["errorRate"]
+        )
+        regressed = regressed or worse
+        lines.append(
+            f"{name:<18} p95 {before['p95']:>9.2f} -> {current['p95']:>9.2f} ms ({p95_change:+.1f}%)  "
+            f"rps {before['throughput']:>8.2f} -> {current['throughput']:>8.2f} ({rps_change:+.1f}%)  "
+            f"errors {before['errorRate']:.2%} -> {current['errorRate']:.2%}"
+            + ("  REGRESSION" if worse else "")
+        )
+    return lines, regressed
+
+
+def remove_loadtest_uploads(folder=UPLOAD_FOLDER):
+    """Delete the answer files created by generated uploads"""
+    try:
+        names = os.listdir(folder)
+    except OSError:
+        return 0
+    removed = 0
+    for name in names:
+        if name.startswith(LOADTEST_SUBJECT + "_"):
+            try:
+                os.remove(os.path.join(folder, name))
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the evaluation API")
+    parser.add_argument("--url", help="Base URL of a running server; default drives the app in-process")
+    parser.add_argument("--concurrency", type=int, default=20, help="Simultaneous clients (default: %(default)s)")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds to measure (default: %(default)s)")
+    parser.add_argument("--warmup", type=int, default=2, help="Unmeasured requests per client first (default: %(default)s)")
+    parser.add_argument("--mix", default=DEFAULT_MIX,
+                        help=f"Weighted routes, from {', '.join(ROUTES)} (default: %(default)s)")
+    parser.add_argument("--upload-bytes", type=int, default=4096, help="Size of each uploaded file (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the request mix")
+    parser.add_argument("--save", metavar="PATH", help="Write the report as JSON, e.g. as a new baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="Compare against a report saved with --save")
+    parser.add_argument("--max-regression", type=float, default=20,
+                        help="Allowed p95/throughput change against the baseline in percent (default: %(default)s)")
+    args = parser.parse_args()
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    make_client = (lambda: HttpClient(args.url)) if args.url else InProcessClient
+    target = args.url or "in-process app"
+    print(f"Load testing {target}: {args.concurrency} clients for {args.duration}s, mix {args.mix}")
+    try:
+        samples, elapsed = run_load(
+            make_client, mix, args.concurrency, args.duration, args.upload_bytes, args.warmup, args.seed
+        )
+    finally:
+        if "upload" in mix:
+            remove_loadtest_uploads()
+
+    report = summarize(samples, elapsed)
+    print(f"{'route':<18} {'requests':>9} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>8}")
+    for name, row in report.items():
+        print(
+            f"{name:<18} {row['requests']:>9} {row['throughput']:>9.2f} {row['p50']:>9.2f} "
+            f"{row['p95']:>9.2f} {row['p99']:>9.2f} {row['errorRate']:>8.2%}"
+        )
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({
+                "target": target,
+                "concurrency": args.concurrency,
+                "duration": args.duration,
+                "mix": args.mix,
+                "uploadBytes": args.upload_bytes,
+                "routes": report
+            }, f, indent=2)
+        print(f"Report saved to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        lines, regressed = compare(report, baseline["routes"], args.max_regression)
+        print(f"\nCompared with {args.baseline}:")
+        for line in lines:
+            print(line)
+        if regressed:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
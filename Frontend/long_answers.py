@@ -0,0 +1,87 @@
+"""
+Helpers for grading answers that are too long for a single prompt.
+
+deepseek-r1 runs with a small default context in Ollama, so a long essay plus the
+question, the answer key and the grading instructions either overflows it or
+slows every call down. Answers over a token budget are split into overlapping
+chunks on sentence boundaries; the grader evaluates the chunks in parallel and
+reduces them into one score and feedback (see evaluate_long_answer in
+auto_checker_v3.py).
+"""
+import re
+
+# Rough characters-per-token ratio for English text; no tokenizer is needed to plan chunks
+CHARS_PER_TOKEN = 4
+
+# Defaults for the long-answer mode
+DEFAULT_TOKEN_BUDGET = 1200
+DEFAULT_OVERLAP_TOKENS = 100
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text):
+    """Approximate the number of model tokens in text"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def split_sentences(text):
+    """Split text into sentences, keeping very long sentences as their own pieces"""
+    return [s for s in _SENTENCE_END.split(text.strip()) if s]
+
+
+def split_into_chunks(text, token_budget=DEFAULT_TOKEN_BUDGET, overlap_tokens=DEFAULT_OVERLAP_TOKENS):
+    """
+    Split text into chunks of at most token_budget tokens.
+    
+    Consecutive chunks share about overlap_tokens of trailing sentences so an argument
+    that spans a boundary is seen whole by at least one chunk. Sentences longer than the
+    budget are hard-split by characters.
+    """
+    if estimate_tokens(text) <= token_budget:
+        return [text]
+    
+    overlap_tokens = min(overlap_tokens, token_budget // 2)
+    max_chars = token_budget * CHARS_PER_TOKEN
+    
+    pieces = []
+    for sentence in split_sentences(text):
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+        else:
+            pieces.extend(sentence[i:i + max_chars] for i in range(0, len(sentence), max_chars))
+    
+    chunks = []
+    current = []
+    current_tokens = 0
+    for piece in pieces:
+        piece_tokens = estimate_tokens(piece) + 1
+        if current and current_tokens + piece_tokens > token_budget:
+            chunks.append(" ".join(current))
+            # Carry trailing sentences into the next chunk as overlap
+            carried = []
+            carried_tokens = 0
+            for previous in reversed(current):
+                previous_tokens = estimate_tokens(previous) + 1
+                if carried_tokens + previous_tokens > overlap_tokens:
+                    break
+                carried.insert(0, previous)
+                carried_tokens += previous_tokens
+            # The overlap gives way to the next piece so the chunk stays within the budget
+            while carried and carried_tokens + piece_tokens > token_budget:
+                carried_tokens -= estimate_tokens(carried.pop(0)) + 1
+            current, current_tokens = carried, carried_tokens
+        current.append(piece)
+        current_tokens += piece_tokens
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def weighted_score(scores_and_weights):
+    """Weighted mean of the numeric chunk scores, or None if none parsed"""
+    numeric = [(s, w) for s, w in scores_and_weights if isinstance(s, (int, float))]
+    total_weight = sum(w for _, w in numeric)
+    if not numeric or total_weight == 0:
+        return None
+    return int(round(sum(s * w for s, w in numeric) / total_weight))
@@ -0,0 +1,200 @@
+"""
+Model warm-up and keep-alive management for the Ollama server.
+
+Loading deepseek-r1 takes several seconds, and Ollama unloads a model once its
+keep_alive expires. The app warms the model in the background at startup and
+whenever a job is queued. It pins the model (a long keep_alive) while a job is
+pending and hands it back to the idle keep_alive when the job ends. Ollama
+resets a model's expiry with every call, to its own default when the call names
+no keep_alive, so the grader (--keep-alive) and regrades pass
+current_keep_alive() with each call. The health
+probe asks Ollama which models are loaded and reports that together with the
+measured load latency.
+
+With several Ollama servers (OLLAMA_ENDPOINTS, see ollama_client.py) every one of
+them is warmed and pinned, and the health report lists each server. The model is
+loaded with the options of the tuned profile (tune_ollama.py), since Ollama
+reloads it when a call asks for another num_ctx.
+
+Configuration (environment):
+    OLLAMA_BASE_URL         default http://127.0.0.1:11434
+    OLLAMA_ENDPOINTS        comma-separated base URLs of all Ollama servers, default OLLAMA_BASE_URL
+    OLLAMA_MODEL            default deepseek-r1
+    OLLAMA_KEEP_ALIVE       keep_alive while idle, default 30m
+    OLLAMA_JOB_KEEP_ALIVE   keep_alive while jobs are pending, default -1 (never unload)
+    OLLAMA_WARMUP_ON_START  set to 0 to skip the warm-up on the app's first request
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from ollama_client import OLLAMA_CLIENT_CONFIG, OllamaError, OllamaPool, keep_alive_value, load_profile
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_CONFIG = {
+    "BASE_URL": os.environ.get("OLLAMA_BASE_URL", "http://127.0.0.1:11434"),
+    "ENDPOINTS": OLLAMA_CLIENT_CONFIG["ENDPOINTS"],
+    "MODEL": os.environ.get("OLLAMA_MODEL", "deepseek-r1"),
+    "IDLE_KEEP_ALIVE": os.environ.get("OLLAMA_KEEP_ALIVE", "30m"),
+    "JOB_KEEP_ALIVE": os.environ.get("OLLAMA_JOB_KEEP_ALIVE", "-1"),
+    "WARMUP_ON_START": os.environ.get("OLLAMA_WARMUP_ON_START", "1") != "0",
+    "WARMUP_TIMEOUT": 300,
+    "PROBE_TIMEOUT": 5
+}
+
+
+class ModelKeeper:
+    """Keeps one Ollama model warm on every endpoint and reports its state"""
+
+    def __init__(self, base_url=None, model=None, endpoints=None):
+        self.pool = OllamaPool(endpoints or base_url or OLLAMA_CONFIG["ENDPOINTS"])
+        self.base_url = self.pool.endpoints[0].url
+        self.model = model or OLLAMA_CONFIG["MODEL"]
+        profile = load_profile(self.model)
+        # Runtime options every call of the app and the grader passes
+        self.options = profile["options"] if profile else None
+        self._lock = threading.Lock()
+        self._warming = False
+        self._rerun = False
+        self._pending_jobs = 0
+        self.last_warm_up = None
+        self.last_load_seconds = None
+        self.last_warm_up_seconds = None
+        self.last_error = None
+
+    def _request(self, endpoint, path, payload=None, timeout=None):
+        return self.pool.request(
+            "POST" if payload is not None else "GET", path, payload,
+            timeout=timeout or OLLAMA_CONFIG["PROBE_TIMEOUT"], endpoint=endpoint
+        )
+
+    def current_keep_alive(self):
+        with self._lock:
+            pinned = self._pending_jobs > 0
+        return OLLAMA_CONFIG["JOB_KEEP_ALIVE"] if pinned else OLLAMA_CONFIG["IDLE_KEEP_ALIVE"]
+
+    def warm_up(self, keep_alive=None):
+        """Load the model on every endpoint (a generate call without a prompt) and set its keep_alive
+
+        Returns True when at least one endpoint is warm.
+        """
+        keep_alive = keep_alive or self.current_keep_alive()
+        started = time.time()
+        load_seconds = []
+        errors = []
+        for endpoint in self.pool.endpoints:
+            try:
+                payload = {"model": self.model, "keep_alive": keep_alive_value(keep_alive)}
+                if self.options:
+                    payload["options"] = self.options
+                result = self._request(endpoint, "/api/generate", payload, timeout=OLLAMA_CONFIG["WARMUP_TIMEOUT"])
+                # load_duration is in nanoseconds and is ~0 when the model was already loaded
+                load_seconds.append(round(result.get("load_duration", 0) / 1e9, 3))
+            except OllamaError as e:
+                errors.append(str(e))
+                logger.warning(f"Model warm-up failed for {self.model} on {endpoint.url}: {str(e)}")
+        self.last_error = "; ".join(errors) or None
+        if not load_seconds:
+            return False
+        self.last_warm_up_seconds = round(time.time() - started, 3)
+        self.last_load_seconds = max(load_seconds)
+        self.last_warm_up = datetime.now().isoformat()
+        logger.info(f"Model {self.model} warm (load {self.last_load_seconds}s, keep_alive {keep_alive})")
+        return True
+
+    def start_warm_up(self):
+        """Warm up in a background thread with the keep_alive for the current job state.
+
+        If a warm-up is already running, it runs once more when done so a pin or
+        release requested meanwhile is not lost.
+        """
+        with self._lock:
+            if self._warming:
+                self._rerun = True
+                return False
+            self._warming = True
+
+        def run():
+            while True:
+                try:
+                    self.warm_up()
+                finally:
+                    with self._lock:
+                        rerun, self._rerun = self._rerun, False
+                        if not rerun:
+                            self._warming = False
+                if not rerun:
+                    return
+
+        thread = threading.Thread(target=run, name="model-warmup")
+        thread.daemon = True
+        thread.start()
+        return True
+
+    def job_started(self):
+        """Pin the model for the duration of a job and make sure it is loaded"""
+        with self._lock:
+            self._pending_jobs += 1
+        self.start_warm_up()
+
+    def job_finished(self):
+        """Release the pin once no job is pending"""
+        with self._lock:
+            self._pending_jobs = max(0, self._pending_jobs - 1)
+            release = self._pending_jobs == 0
+        if release:
+            self.start_warm_up()
+
+    def health(self):
+        """Probe every Ollama endpoint for the loaded models and report this model's state"""
+        report = {
+            "model": self.model,
+            "baseUrl": self.base_url,
+            "reachable": False,
+            "loaded": False,
+            "expiresAt": None,
+            "pinned": self._pending_jobs > 0,
+            "warming": self._warming,
+            "lastWarmUp": self.last_warm_up,
+            "lastLoadSeconds": self.last_load_seconds,
+            "lastWarmUpSeconds": self.last_warm_up_seconds,
+            "probeMs": None,
+            "options": self.options,
+            "error": self.last_error,
+            "endpoints": []
+        }
+        for endpoint, stats in zip(self.pool.endpoints, self.pool.stats()):
+            entry = dict(stats, reachable=False, loaded=False, expiresAt=None)
+            started = time.time()
+            try:
+                running = self._request(endpoint, "/api/ps").get("models", [])
+                entry["probeMs"] = round((time.time() - started) * 1000, 1)
+                entry["reachable"] = True
+                for model in running:
+                    name = model.get("name") or model.get("model") or ""
+                    if name == self.model or name.split(":")[0] == self.model:
+                        entry["loaded"] = True
+                        entry["expiresAt"] = model.get("expires_at")
+                        break
+            except OllamaError as e:
+                entry["lastError"] = str(e)
+            report["endpoints"].append(entry)
+
+        # The top-level fields describe the first endpoint that is up, as with a single server
+        up = [e for e in report["endpoints"] if e["reachable"]]
+        if up:
+            first = next((e for e in up if e["loaded"]), up[0])
+            report.update(
+                reachable=True, loaded=first["loaded"], expiresAt=first["expiresAt"],
+                probeMs=first["probeMs"], error=None
+            )
+        elif report["endpoints"]:
+            report["error"] = report["endpoints"][0]["lastError"]
+        return report
+
+
+# Shared keeper for the app process
+model_keeper = ModelKeeper()
@@ -0,0 +1,378 @@
+"""
+Pooled HTTP client for one or more Ollama servers.
+
+The grader talks to Ollama directly instead of through LangChain's client:
+every endpoint keeps a pool of persistent keep-alive connections, each request
+goes to the healthy endpoint with the fewest requests in flight (the lower
+average latency breaks ties), and a request that fails on one endpoint because
+of a connection error, a timeout or a server error is retried on the next one.
+A failed endpoint is left out for a cooldown and then tried again. With several
+endpoints, a background thread probes every one of them each HEALTH_INTERVAL
+seconds: an endpoint that does not answer its probe is left out until one
+succeeds, so a dead server is found by a quick probe rather than by a model call
+running into its full timeout. Only when every endpoint is down is the one that
+failed longest ago tried anyway.
+
+A request may carry an affinity key, e.g. the question part of a grading prompt.
+Requests with the same key prefer the same healthy endpoint (rendezvous hashing,
+so a key moves only when its endpoint goes down), where Ollama still has that
+prompt prefix evaluated and cached; they go to the least busy endpoint instead
+when the preferred one has more than AFFINITY_SLACK requests in flight beyond it.
+
+Per-endpoint statistics (in flight, requests, failures, latency percentiles)
+are available from stats().
+
+Runtime options (num_thread, num_ctx, num_batch, num_predict) and the number of
+concurrent calls that suit the host are measured by tune_ollama.py and saved to
+a profile; load_profile() reads it for the grader and the app.
+
+Configuration (environment):
+    OLLAMA_ENDPOINTS        comma-separated base URLs, e.g.
+                            http://10.0.0.5:11434,http://10.0.0.6:11434
+                            (default: OLLAMA_BASE_URL, http://127.0.0.1:11434)
+    OLLAMA_PROFILE          tuned profile, default ollama_profile.json; empty to use Ollama's defaults
+    OLLAMA_HEALTH_INTERVAL  seconds between health probes of the endpoints, default 15; 0 turns them off
+"""
+import hashlib
+import http.client
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_CLIENT_CONFIG = {
+    "ENDPOINTS": os.environ.get("OLLAMA_ENDPOINTS") or os.environ.get("OLLAMA_BASE_URL", "http://127.0.0.1:11434"),
+    # Idle keep-alive connections kept per endpoint
+    "POOL_SIZE": 8,
+    # Seconds a failed endpoint is skipped before it is tried again
+    "COOLDOWN_SECONDS": 30,
+    "PROBE_TIMEOUT": 5,
+    "HEALTH_INTERVAL": float(os.environ.get("OLLAMA_HEALTH_INTERVAL", "15")),
+    # Extra requests in flight a preferred endpoint may have over the least busy one
+    "AFFINITY_SLACK": 1,
+    # Successful requests per endpoint kept for the latency percentiles
+    "LATENCY_WINDOW": 256,
+    "PROFILE": os.environ.get("OLLAMA_PROFILE", "ollama_profile.json")
+}
+
+# Errors that mean the connection or the server failed, as opposed to a bad request
+CONNECTION_ERRORS = (OSError, http.client.HTTPException)
+# Errors of a pooled connection the server closed while it was idle
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)
+
+
+class OllamaError(Exception):
+    """Raised when no endpoint could answer a request, or Ollama rejected it"""
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def keep_alive_value(value):
+    """Ollama takes durations as strings ("30m") and plain seconds as numbers"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def load_profile(model, path=None):
+    """The tuned profile for model ({"options", "parallel", ...}), or None when there is none"""
+    path = OLLAMA_CLIENT_CONFIG["PROFILE"] if path is None else path
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            profile = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring the Ollama profile {path}: {str(e)}")
+        return None
+    # Options tuned for another model do not carry over
+    if profile.get("model") != model:
+        return None
+    return profile
+
+
+def parse_endpoints(text):
+    """Split a comma-separated list of base URLs"""
+    return [url.strip().rstrip("/") for url in text.split(",") if url.strip()]
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Endpoint:
+    """One Ollama server: its idle connections, health and request statistics"""
+
+    def __init__(self, url, pool_size, latency_window):
+        parts = urlsplit(url)
+        self.url = url
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.https = parts.scheme == "https"
+        self.pool_size = pool_size
+        self._idle = []
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.healthy = True
+        self.down_until = 0.0
+        self.last_error = None
+        self.probe_ms = None
+        self._latencies = deque(maxlen=latency_window)
+
+    def available(self, now, probed=False):
+        """Whether requests may go here; probed endpoints come back only through a successful probe"""
+        return self.healthy or (not probed and now >= self.down_until)
+
+    def record_latency(self, seconds):
+        self._latencies.append(seconds)
+
+    def mean_latency(self):
+        return sum(self._latencies) / len(self._latencies) if self._latencies else 0.0
+
+    def acquire(self, timeout, fresh=False):
+        """An idle pooled connection, or a new one; returns (connection, reused). Call under the pool lock"""
+        conn = self._idle.pop() if self._idle and not fresh else None
+        reused = conn is not None
+        if conn is None:
+            connection_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            conn = connection_class(self.host, self.port, timeout=timeout)
+        elif conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, reused
+
+    def release(self, conn):
+        if len(self._idle) < self.pool_size:
+            self._idle.append(conn)
+        else:
+            conn.close()
+
+    def close(self):
+        while self._idle:
+            self._idle.pop().close()
+
+    def stats(self):
+        ordered = sorted(self._latencies)
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "inFlight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "idleConnections": len(self._idle),
+            "latencyMs": {
+                "mean": round(self.mean_latency() * 1000, 1),
+                "p50": round(_percentile(ordered, 0.5) * 1000, 1),
+                "p95": round(_percentile(ordered, 0.95) * 1000, 1)
+            } if ordered else None,
+            "probeMs": self.probe_ms,
+            "lastError": self.last_error
+        }
+
+
+class OllamaPool:
+    """Balances Ollama requests over the configured endpoints with pooled connections"""
+
+    def __init__(self, endpoints=None, pool_size=None, cooldown=None, health_interval=None):
+        urls = parse_endpoints(endpoints) if isinstance(endpoints, str) else endpoints
+        urls = urls or parse_endpoints(OLLAMA_CLIENT_CONFIG["ENDPOINTS"])
+        self.cooldown = OLLAMA_CLIENT_CONFIG["COOLDOWN_SECONDS"] if cooldown is None else cooldown
+        self.endpoints = [
+            Endpoint(url, pool_size or OLLAMA_CLIENT_CONFIG["POOL_SIZE"], OLLAMA_CLIENT_CONFIG["LATENCY_WINDOW"])
+            for url in urls
+        ]
+        self._lock = threading.Lock()
+        self._health_thread = None
+        self._closed = threading.Event()
+        # With a single endpoint there is nothing to route around
+        interval = OLLAMA_CLIENT_CONFIG["HEALTH_INTERVAL"] if health_interval is None else health_interval
+        if interval > 0 and len(self.endpoints) > 1:
+            self.start_health_checks(interval)
+
+    @staticmethod
+    def _affinity_rank(key, endpoint):
+        return hashlib.blake2b(key + endpoint.url.encode("utf-8"), digest_size=8).digest()
+
+    def _pick(self, exclude, affinity=None):
+        """Reserve the preferred endpoint for the affinity key, or the one with the fewest requests in flight"""
+        now = time.monotonic()
+        with self._lock:
+            probed = self._health_thread is not None
+            candidates = [e for e in self.endpoints if e not in exclude and e.available(now, probed)]
+            if not candidates:
+                # Everything is cooling down: try the one that failed longest ago rather than nothing
+                candidates = sorted((e for e in self.endpoints if e not in exclude), key=lambda e: e.down_until)[:1]
+            if not candidates:
+                return None
+            endpoint = min(candidates, key=lambda e: (e.in_flight, e.mean_latency()))
+            if affinity is not None and len(candidates) > 1:
+                preferred = max(candidates, key=lambda e: self._affinity_rank(affinity, e))
+                if preferred.in_flight <= endpoint.in_flight + OLLAMA_CLIENT_CONFIG["AFFINITY_SLACK"]:
+                    endpoint = preferred
+            endpoint.in_flight += 1
+            return endpoint
+
+    def _finish(self, endpoint, elapsed=None, error=None):
+        with self._lock:
+            endpoint.in_flight -= 1
+            endpoint.requests += 1
+            if error is None:
+                endpoint.healthy = True
+                endpoint.last_error = None
+                if elapsed is not None:
+                    endpoint.record_latency(elapsed)
+            else:
+                endpoint.failures += 1
+                endpoint.healthy = False
+                endpoint.down_until = time.monotonic() + self.cooldown
+                endpoint.last_error = error
+
+    def _send(self, endpoint, method, path, body, timeout):
+        """One HTTP exchange on a pooled connection; returns (status, body)"""
+        with self._lock:
+            conn, reused = endpoint.acquire(timeout)
+        while True:
+            try:
+                conn.request(method, path, body=body, headers={"Content-Type": "application/json"})
+                response = conn.getresponse()
+                data = response.read()
+            except STALE_CONNECTION_ERRORS:
+                conn.close()
+                if not reused:
+                    raise
+                # The server closed the idle connection; retry once on a new one
+                with self._lock:
+                    conn, reused = endpoint.acquire(timeout, fresh=True)
+                continue
+            except BaseException:
+                # Also on an interrupt in the middle of a call: the connection state is unknown
+                conn.close()
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                with self._lock:
+                    endpoint.release(conn)
+            return response.status, data
+
+    def request(self, method, path, payload=None, timeout=None, endpoint=None, affinity=None):
+        """
+        Send a JSON request and return the decoded response.
+
+        Goes to the given endpoint only, or to the preferred endpoint for the affinity key or the
+        least busy one, with failover to the others. Raises OllamaError when every endpoint tried
+        failed or Ollama rejected the request.
+        """
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        if affinity is not None:
+            affinity = hashlib.blake2b(affinity.encode("utf-8"), digest_size=16).digest()
+        tried = set()
+        errors = []
+        while True:
+            if endpoint is not None:
+                if endpoint in tried:
+                    break
+                with self._lock:
+                    endpoint.in_flight += 1
+                current = endpoint
+            else:
+                current = self._pick(tried, affinity)
+                if current is None:
+                    break
+            tried.add(current)
+            started = time.monotonic()
+            try:
+                status, data = self._send(current, method, path, body, timeout)
+            except CONNECTION_ERRORS as e:
+                self._finish(current, error=f"{type(e).__name__}: {e}")
+                errors.append(f"{current.url}: {type(e).__name__}: {e}")
+                logger.warning(f"Ollama endpoint {current.url} failed: {e}" + ("" if endpoint else ", trying the next one"))
+                continue
+            except BaseException:
+                self._finish(current)
+                raise
+            if status >= 500:
+                message = data.decode("utf-8", "replace")[:200]
+                self._finish(current, error=f"HTTP {status}: {message}")
+                errors.append(f"{current.url}: HTTP {status}: {message}")
+                continue
+            self._finish(current, elapsed=time.monotonic() - started)
+            if status >= 400:
+                raise OllamaError(f"{current.url}: HTTP {status}: {data.decode('utf-8', 'replace')[:200]}",
+                                  retryable=False)
+            try:
+                return json.loads(data.decode("utf-8") or "{}")
+            except ValueError as e:
+                raise OllamaError(f"{current.url}: invalid response: {e}")
+        raise OllamaError("No Ollama endpoint could answer: " + ("; ".join(errors) or "none configured"))
+
+    def generate(self, model, prompt, timeout=None, options=None, keep_alive=None, affinity=None):
+        """Run one non-streaming completion; returns Ollama's response with "response" and its metadata
+
+        affinity is a key, such as the prompt's shared prefix, whose requests should share an endpoint.
+        """
+        payload = {"model": model, "prompt": prompt, "stream": False}
+        if options:
+            payload["options"] = options
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive_value(keep_alive)
+        return self.request("POST", "/api/generate", payload, timeout=timeout, affinity=affinity)
+
+    def check_health(self):
+        """Probe every endpoint; reachable ones are marked healthy again"""
+        for endpoint in self.endpoints:
+            started = time.monotonic()
+            try:
+                status, _ = self._send(endpoint, "GET", "/api/version", None, OLLAMA_CLIENT_CONFIG["PROBE_TIMEOUT"])
+                error = f"HTTP {status}" if status >= 500 else None
+            except CONNECTION_ERRORS as e:
+                error = f"{type(e).__name__}: {e}"
+            if error is not None:
+                with self._lock:
+                    endpoint.healthy = False
+                    endpoint.down_until = time.monotonic() + self.cooldown
+                    endpoint.last_error = error
+                    endpoint.probe_ms = None
+                continue
+            with self._lock:
+                endpoint.healthy = True
+                endpoint.last_error = None
+                endpoint.probe_ms = round((time.monotonic() - started) * 1000, 1)
+        return self.stats()
+
+    def start_health_checks(self, interval=None):
+        """Probe the endpoints in a background thread every interval seconds, starting now"""
+        interval = interval or OLLAMA_CLIENT_CONFIG["HEALTH_INTERVAL"] or 15
+        with self._lock:
+            if self._health_thread is not None:
+                return
+            self._health_thread = threading.Thread(
+                target=self._health_loop, args=(interval,), name="ollama-health", daemon=True
+            )
+        self._health_thread.start()
+
+    def _health_loop(self, interval):
+        while not self._closed.is_set():
+            try:
+                self.check_health()
+            except Exception as e:
+                logger.warning(f"Ollama health check failed: {str(e)}")
+            self._closed.wait(interval)
+
+    def stats(self):
+        with self._lock:
+            return [endpoint.stats() for endpoint in self.endpoints]
+
+    def close(self):
+        self._closed.set()
+        with self._lock:
+            for endpoint in self.endpoints:
+                endpoint.close()
@@ -0,0 +1,66 @@
+"""
+High-priority lane shared by the app and grader processes.
+
+A single-answer regrade (/api/regrade) must not wait behind a whole cohort. While
+a regrade is in progress it holds a token file in LANE_FOLDER; a bulk grader run
+checks the folder before every item and waits while any token is present, so
+the regrade only ever waits for the model call that was already in flight.
+Tokens are plain files so every web worker and grader process sees them;
+a token older than STALE_SECONDS is ignored in case its holder crashed.
+"""
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+LANE_FOLDER = "priority_lane"
+STALE_SECONDS = 15 * 60
+POLL_SECONDS = 0.05
+
+
+class PriorityLane:
+    """Token files announcing high-priority work that bulk grading yields to"""
+
+    def __init__(self, folder=LANE_FOLDER, stale_seconds=STALE_SECONDS):
+        self.folder = folder
+        self.stale_seconds = stale_seconds
+
+    @contextmanager
+    def hold(self):
+        """Keep bulk grading paused between items for the duration of the block"""
+        os.makedirs(self.folder, exist_ok=True)
+        path = os.path.join(self.folder, f"{os.getpid()}-{uuid.uuid4().hex}")
+        with open(path, "w"):
+            pass
+        try:
+            yield
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def busy(self):
+        """True while a live token is held"""
+        try:
+            entries = list(os.scandir(self.folder))
+        except OSError:
+            return False
+        now = time.time()
+        for entry in entries:
+            try:
+                if now - entry.stat().st_mtime < self.stale_seconds:
+                    return True
+            except OSError:
+                # Removed while scanning
+                continue
+        return False
+
+    def wait_until_clear(self, should_stop=None, poll=POLL_SECONDS):
+        """Block while the lane is busy or until should_stop() returns a reason; returns the seconds waited"""
+        started = time.monotonic()
+        while self.busy():
+            if should_stop and should_stop():
+                break
+            time.sleep(poll)
+        return time.monotonic() - started
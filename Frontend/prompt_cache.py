@@ -0,0 +1,63 @@
+"""
+Accounting for Ollama's prompt cache.
+
+Ollama keeps the evaluated prompt of the last request in the model's context and
+only evaluates the tokens after the longest prefix a new prompt shares with it.
+On CPU hosts prompt evaluation is a large part of each call, so the grader can
+save most of it by sending prompts that start with the same text back to back:
+the static instructions, then the question and answer key, then the student's
+answer (see --schedule question in auto_checker_v3.py).
+
+PromptCacheStats records every prompt sent and estimates how many of its tokens
+were shared with the previous one. When the client returns Ollama's response
+metadata, the prompt tokens Ollama actually evaluated are added up as well.
+"""
+import os
+import threading
+
+from long_answers import estimate_tokens
+
+
+def shared_prefix_length(a, b):
+    """Number of leading characters a and b have in common"""
+    return len(os.path.commonprefix([a, b]))
+
+
+class PromptCacheStats:
+    """Estimates the prompt tokens that could be served from Ollama's prompt cache"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._previous = ""
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.shared_tokens = 0
+        # Prompt tokens Ollama reports as evaluated (prompt_eval_count), when available
+        self.evaluated_tokens = 0
+        self.reported_calls = 0
+
+    def record(self, prompt, generation_info=None):
+        """Count one model call; generation_info is the response metadata from Ollama, if any"""
+        evaluated = (generation_info or {}).get("prompt_eval_count")
+        with self._lock:
+            shared = shared_prefix_length(self._previous, prompt)
+            self._previous = prompt
+            self.calls += 1
+            self.prompt_tokens += estimate_tokens(prompt)
+            self.shared_tokens += estimate_tokens(prompt[:shared])
+            if isinstance(evaluated, int):
+                self.evaluated_tokens += evaluated
+                self.reported_calls += 1
+
+    def summary(self):
+        """One line describing the prompt tokens sent and the share reusable from the cache"""
+        if not self.calls:
+            return "Prompt cache: no model calls"
+        share = self.shared_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+        line = (
+            f"Prompt cache: {self.calls} calls, ~{self.prompt_tokens} prompt tokens, "
+            f"~{self.shared_tokens} ({share:.0%}) saved from prompt evaluation by sharing the previous call's prefix"
+        )
+        if self.reported_calls:
+            line += f"; Ollama evaluated {self.evaluated_tokens} prompt tokens over {self.reported_calls} calls"
+        return line
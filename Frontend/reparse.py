@@ -0,0 +1,220 @@
+"""
+Re-parse archived completions with the current parsing rules, without the model.
+
+Every grader run stores its raw completions in the completion archive (see
+completion_archive.py). This command replays the grading of each archived item
+through the same code path as the grader (long-answer chunks, consistency
+samples), answering every model call from the archive instead of Ollama, and
+regenerates the report files and the records journal from the results:
+
+    python reparse.py                          # latest run, rewrites the report and journal
+    python reparse.py --run 2025-01-31T10:00:00.000000 --csv results.csv
+    python reparse.py --list
+
+Items are re-parsed in a process pool. An item whose prompts no longer match the
+archive (the prompt layout changed) or that was not graded is kept as it was.
+
+The archive is also a benchmark and regression corpus for the parser:
+
+    python reparse.py --benchmark
+    python reparse.py --benchmark --fail-on-change
+
+reports parse throughput over every archived completion, the share that yields a
+numeric score, and the items whose result differs from what was archived; with
+--fail-on-change that exits with status 1.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from argparse import Namespace
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from auto_checker_v3 import HTML_RESULTS_FILE, RECORDS_FILE, ModelCallFailed, grade_item, parse_evaluation
+from consistency import combine_samples
+from completion_archive import ARCHIVE_FILE, CompletionArchive, prompt_hash, unpack
+from report_writer import ReportWriter
+
+# Record fields that come out of parsing; the rest of a record is copied as archived
+PARSED_FIELDS = ("Score", "Feedback", "Strengths", "Areas for Improvement", "Model_Thoughts",
+                 "Samples Used", "Score Spread")
+# Items handed to a pool worker at a time
+POOL_CHUNKSIZE = 32
+
+
+class ReplayLLM:
+    """Answers model calls with archived completions of the same prompt, in their original order"""
+
+    def __init__(self, completions):
+        self._completions = defaultdict(deque)
+        for digest, completion in completions:
+            self._completions[digest].append(completion)
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt, affinity=None):
+        with self._lock:
+            remaining = self._completions.get(prompt_hash(prompt))
+            if not remaining:
+                raise ModelCallFailed("no archived completion for this prompt")
+            return remaining.popleft()
+
+
+def reparse_item(row):
+    """
+    Replay one archived item; returns (record, status) with status "same", "changed" or "kept".
+
+    Takes the compressed archive row so pool workers do the decompression.
+    """
+    record_blob, settings, completions_blob = row
+    record = unpack(record_blob)
+    completions = unpack(completions_blob)
+    if not completions:
+        return record, "kept"
+
+    args = Namespace(**dict(json.loads(settings), chunk_workers=1))
+    llm = ReplayLLM(completions)
+
+    def replay():
+        return grade_item(
+            args, llm, record["Question"], record["Answer Key"], record["Student Answer"], None
+        )
+
+    try:
+        if not args.consistency:
+            evaluation, consistency_fields = replay()
+        else:
+            # Re-combine the samples the item was graded from. A sample still in flight when the
+            # others agreed may have left completions too, so the record's count is preferred.
+            args.consistency = False
+            sample_count = record.get("Samples Used") or sum(
+                1 for digest, _ in completions if digest == completions[0][0]
+            )
+            samples = [replay()[0] for _ in range(sample_count)]
+            evaluation, stats = combine_samples(samples, min(args.agreement, max(1, args.samples)), args.tolerance)
+            consistency_fields = {"Samples Used": stats["samples"], "Score Spread": stats["spread"]}
+    except ModelCallFailed:
+        return record, "kept"
+
+    score, feedback, strengths, improvements, model_thoughts = evaluation
+    reparsed = dict(record, **{
+        "Score": score,
+        "Feedback": feedback,
+        "Strengths": strengths,
+        "Areas for Improvement": improvements,
+        "Model_Thoughts": model_thoughts,
+        **consistency_fields
+    })
+    changed = any(reparsed.get(field) != record.get(field) for field in PARSED_FIELDS)
+    return reparsed, "changed" if changed else "same"
+
+
+def reparse_run(archive, run_id=None, workers=None):
+    """Yield (record, status) for every item of a run in report order"""
+    rows = archive.rows(run_id)
+    if workers == 1:
+        yield from map(reparse_item, rows)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(reparse_item, rows, chunksize=POOL_CHUNKSIZE)
+
+
+def benchmark(archive, run_id=None, workers=None, repeat=3):
+    """Parse every archived completion of a run and replay its items; returns the report"""
+    completions = [text for _, _, item_completions in archive.items(run_id) for _, text in item_completions]
+    if not completions:
+        return None
+
+    # Parser alone: best of repeat passes over the corpus
+    best = float("inf")
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        results = [parse_evaluation(text) for text in completions]
+        best = min(best, time.perf_counter() - started)
+    numeric = sum(1 for r in results if isinstance(r[0], (int, float)))
+
+    # Whole replay in the process pool, as the reparse command runs it
+    started = time.perf_counter()
+    statuses = defaultdict(int)
+    changed = []
+    for record, status in reparse_run(archive, run_id, workers):
+        statuses[status] += 1
+        if status == "changed":
+            changed.append((record["Student Name"], record["Question Number"]))
+    replay_seconds = time.perf_counter() - started
+
+    size = sum(len(text.encode("utf-8")) for text in completions)
+    return {
+        "completions": len(completions),
+        "parseMicroseconds": round(best / len(completions) * 1e6, 2),
+        "parsePerSecond": round(len(completions) / best) if best else None,
+        "parseMBPerSecond": round(size / best / 1e6, 2) if best else None,
+        "numericScores": numeric,
+        "numericRate": round(numeric / len(completions), 4),
+        "items": sum(statuses.values()),
+        "replaySeconds": round(replay_seconds, 3),
+        "same": statuses["same"],
+        "changed": statuses["changed"],
+        "kept": statuses["kept"],
+        "changedItems": changed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-parse archived model completions without calling the model")
+    parser.add_argument("--archive", default=ARCHIVE_FILE, help="Completion archive (default: %(default)s)")
+    parser.add_argument("--run", help="Run id to re-parse (default: the latest run)")
+    parser.add_argument("--list", action="store_true", help="List the archived runs and exit")
+    parser.add_argument("--workers", type=int, help="Processes to re-parse with (default: one per CPU)")
+    parser.add_argument("--html", default=HTML_RESULTS_FILE, help="HTML report to write (default: %(default)s)")
+    parser.add_argument("--records", default=RECORDS_FILE, help="Records journal to write (default: %(default)s)")
+    parser.add_argument("--csv", metavar="PATH", help="Also write the results as CSV to PATH")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Measure the parser on the archive and report changed items; writes nothing")
+    parser.add_argument("--repeat", type=int, default=3, help="Parser passes in benchmark mode, best one counts")
+    parser.add_argument("--fail-on-change", action="store_true",
+                        help="In benchmark mode, exit with status 1 when any item's result changed")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.archive):
+        parser.error(f"No completion archive at {args.archive}; it is written by auto_checker_v3.py")
+    archive = CompletionArchive(args.archive)
+    try:
+        if args.list:
+            for run_id, items in archive.runs():
+                print(f"{run_id}  {items} items")
+            return
+        run_id = args.run or archive.latest_run()
+        if run_id is None:
+            parser.error("The completion archive is empty")
+
+        if args.benchmark:
+            report = benchmark(archive, run_id, args.workers, args.repeat)
+            if report is None:
+                print(f"Run {run_id} has no archived completions")
+                return
+            print(json.dumps({k: v for k, v in report.items() if k != "changedItems"}, indent=2))
+            for student, question in report["changedItems"]:
+                print(f"changed: {student} - Question {question}")
+            if args.fail_on_change and report["changed"]:
+                raise SystemExit(1)
+            return
+
+        statuses = defaultdict(int)
+        started = time.perf_counter()
+        with ReportWriter(args.html, records_file=args.records, csv_file=args.csv) as writer:
+            for record, status in reparse_run(archive, run_id, args.workers):
+                statuses[status] += 1
+                writer.write(record)
+        print(
+            f"Re-parsed run {run_id}: {writer.count} items in {time.perf_counter() - started:.2f}s, "
+            f"{statuses['changed']} changed, {statuses['same']} unchanged, {statuses['kept']} kept as archived"
+        )
+        print(f"Results saved to {args.html} and {args.records}" + (f" and {args.csv}" if args.csv else ""))
+    finally:
+        archive.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Paginated per-student rendering of evaluation reports.
+
+The grader writes one structured record per (student, question) to
+evaluation_records.jsonl. Instead of shipping the whole cohort as one HTML file,
+pages are rendered from those records with templates compiled once at import.
+Each student's rendered cards are cached and only re-rendered when that
+student's records change.
+"""
+import hashlib
+import json
+import math
+import os
+import threading
+
+from jinja2 import Environment
+
+from report_writer import REPORT_CSS as BASE_REPORT_CSS, score_class
+
+# Structured results written by auto_checker_v3.py
+RECORDS_FILE = "evaluation_records.jsonl"
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 200
+
+# Extra rules for the pager and summary table on top of the full report's styles
+REPORT_CSS = BASE_REPORT_CSS + """
+        .pager a {
+            margin-left: 10px;
+        }
+        .summary {
+            width: 100%;
+            border-collapse: collapse;
+        }
+        .summary th, .summary td {
+            text-align: left;
+            padding: 8px;
+            border-bottom: 1px solid #eee;
+        }
+    """
+
+# Autoescaping keeps student answers and model output from injecting markup
+_env = Environment(autoescape=True, trim_blocks=True, lstrip_blocks=True)
+_env.filters["score_class"] = score_class
+
+STUDENT_TEMPLATE = _env.from_string("""
+{% for row in records %}
+<div class="evaluation-card">
+    <div class="student-info">
+        <div class="student-name">{{ row["Student Name"] }}</div>
+        <div class="score {{ row["Score"] | score_class }}">Score: {{ row["Score"] }}</div>
+    </div>
+    <div class="question">{{ row["Question"] }}</div>
+    <div class="section">
+        <div class="section-title">Student Answer:</div>
+        <p>{{ row["Student Answer"] }}</p>
+    </div>
+    <div class="section">
+        <div class="section-title">Feedback:</div>
+        <p>{{ row["Feedback"] }}</p>
+    </div>
+    <div class="section strengths">
+        <div class="section-title">Strengths:</div>
+        <p>{{ row["Strengths"] }}</p>
+    </div>
+    <div class="section improvements">
+        <div class="section-title">Areas for Improvement:</div>
+        <p>{{ row["Areas for Improvement"] }}</p>
+    </div>
+</div>
+{% endfor %}
+""")
+
+PAGE_TEMPLATE = _env.from_string("""<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{{ title }}</title>
+    <style>{{ css | safe }}</style>
+</head>
+<body>
+    <h1>{{ title }}</h1>
+{% if pager %}
+    <p class="pager">
+        Page {{ pager.page }} of {{ pager.pages }} ({{ pager.total }} students)
+        {% if pager.page > 1 %}<a href="?page={{ pager.page - 1 }}&per_page={{ pager.per_page }}">Previous</a>{% endif %}
+        {% if pager.page < pager.pages %}<a href="?page={{ pager.page + 1 }}&per_page={{ pager.per_page }}">Next</a>{% endif %}
+    </p>
+{% endif %}
+{{ content | safe }}
+</body>
+</html>
+""")
+
+INDEX_TEMPLATE = _env.from_string("""
+<table class="summary">
+    <thead>
+        <tr><th>Student</th><th>Questions</th><th>Graded</th><th>Average Score</th></tr>
+    </thead>
+    <tbody>
+{% for row in rows %}
+        <tr>
+            <td><a href="{{ base_url }}/{{ row.name | urlencode }}">{{ row.name }}</a></td>
+            <td>{{ row.questions }}</td>
+            <td>{{ row.graded }}</td>
+            <td class="score {{ row.average | score_class }}">{{ row.average if row.average is not none else "-" }}</td>
+        </tr>
+{% endfor %}
+    </tbody>
+</table>
+""")
+
+
+def clamp_page(page, per_page, total):
+    """Normalize pagination arguments and return (page, per_page, pages)"""
+    per_page = max(1, min(MAX_PAGE_SIZE, per_page or DEFAULT_PAGE_SIZE))
+    pages = max(1, math.ceil(total / per_page))
+    page = max(1, min(pages, page or 1))
+    return page, per_page, pages
+
+
+class ReportRenderer:
+    """Renders report pages from structured records with a per-student fragment cache"""
+
+    def __init__(self, records_file=RECORDS_FILE):
+        self.records_file = records_file
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._students = {}   # name -> {"records": [...], "digest": str}
+        self._fragments = {}  # name -> (digest, html)
+
+    def available(self):
+        return os.path.exists(self.records_file)
+
+    def _refresh(self):
+        """Reload records when the file changed and drop fragments of changed students"""
+        try:
+            mtime = os.stat(self.records_file).st_mtime_ns
+        except OSError:
+            self._mtime = None
+            self._students = {}
+            self._fragments = {}
+            return
+        if mtime == self._mtime:
+            return
+
+        grouped = {}
+        with open(self.records_file, "r", encoding="utf-8") as f:
+            for line in f:
+                # A line without its newline is still being written by the grader
+                if line.strip() and line.endswith("\n"):
+                    record = json.loads(line)
+                    # A regraded item replaces the earlier record for the same question
+                    by_question = grouped.setdefault(record.get("Student Name", "Unknown Student"), {})
+                    by_question[record.get("Question Number")] = record
+
+        students = {}
+        for name, by_question in grouped.items():
+            records = list(by_question.values())
+            digest = hashlib.md5(json.dumps(records, sort_keys=True).encode("utf-8")).hexdigest()
+            students[name] = {"records": records, "digest": digest}
+            cached = self._fragments.get(name)
+            if cached and cached[0] != digest:
+                del self._fragments[name]
+
+        for name in list(self._fragments):
+            if name not in students:
+                del self._fragments[name]
+
+        self._students = students
+        self._mtime = mtime
+
+    def _fragment(self, name):
+        student = self._students[name]
+        cached = self._fragments.get(name)
+        if cached and cached[0] == student["digest"]:
+            return cached[1]
+        html = STUDENT_TEMPLATE.render(records=student["records"])
+        self._fragments[name] = (student["digest"], html)
+        return html
+
+    def has_student(self, name):
+        with self._lock:
+            self._refresh()
+            return name in self._students
+
+    def record(self, name, question_number):
+        """Latest record of one student's answer to a question, or None"""
+        with self._lock:
+            self._refresh()
+            for record in self._students.get(name, {}).get("records", []):
+                if str(record.get("Question Number")) == str(question_number):
+                    return dict(record)
+        return None
+
+    def records(self):
+        """Latest record of every answer, grouped by student in grading order"""
+        with self._lock:
+            self._refresh()
+            return [record for student in self._students.values() for record in student["records"]]
+
+    def render_student(self, name):
+        """Render a full page for one student, or None if the student is unknown"""
+        with self._lock:
+            self._refresh()
+            if name not in self._students:
+                return None
+            content = self._fragment(name)
+        return PAGE_TEMPLATE.render(title=f"Evaluation Results: {name}", css=REPORT_CSS, content=content, pager=None)
+
+    def render_page(self, page=1, per_page=DEFAULT_PAGE_SIZE):
+        """Render one page of students' cards in grading order"""
+        with self._lock:
+            self._refresh()
+            names = list(self._students)
+            page, per_page, pages = clamp_page(page, per_page, len(names))
+            start = (page - 1) * per_page
+            content = "".join(self._fragment(name) for name in names[start:start + per_page])
+        pager = {"page": page, "pages": pages, "per_page": per_page, "total": len(names)}
+        return PAGE_TEMPLATE.render(title="Evaluation Results", css=REPORT_CSS, content=content, pager=pager)
+
+    def summary_rows(self):
+        """One summary row per student: question count, graded count and average score"""
+        with self._lock:
+            self._refresh()
+            rows = []
+            for name, student in self._students.items():
+                scores = [r["Score"] for r in student["records"] if isinstance(r.get("Score"), (int, float))]
+                rows.append({
+                    "name": name,
+                    "questions": len(student["records"]),
+                    "graded": len(scores),
+                    "average": round(sum(scores) / len(scores), 1) if scores else None
+                })
+            return rows
+
+    def render_index(self, page=1, per_page=DEFAULT_PAGE_SIZE, base_url="/results/students"):
+        """Render the summary index with one row per student"""
+        rows = self.summary_rows()
+        page, per_page, pages = clamp_page(page, per_page, len(rows))
+        start = (page - 1) * per_page
+        content = INDEX_TEMPLATE.render(rows=rows[start:start + per_page], base_url=base_url)
+        pager = {"page": page, "pages": pages, "per_page": per_page, "total": len(rows)}
+        return PAGE_TEMPLATE.render(title="Evaluation Summary", css=REPORT_CSS, content=content, pager=pager)
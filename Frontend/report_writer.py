@@ -0,0 +1,368 @@
+"""
+Streaming writer for the evaluation report files.
+
+Records are written as they are graded, in student order, through buffered file
+handles: the HTML report, the structured JSONL records used for paginated pages
+and analytics, and, optionally, a CSV export. Nothing is accumulated in memory,
+and every value is HTML-escaped before it reaches the report.
+
+The HTML and CSV files are written under a temporary name and renamed into place
+on close, so readers see either the previous report or the complete new one. The
+JSONL records are a live journal of the current run instead: each record is
+flushed as soon as it is graded so the app can follow a run while it progresses.
+Readers must ignore a final line that does not end in a newline yet. The journal
+can also be written on its own, in any order, for a run that grades question by
+question and writes the student-ordered report afterwards.
+
+Everything that appends to the journal holds a shared lock on a lock file next
+to it (journal_lock) for as long as it writes: a ReportWriter for its whole run,
+append_record for one line. Compaction (retention.py) replaces the journal, so it
+needs the lock exclusively and never runs while anyone is appending.
+"""
+import csv
+import html
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # No flock on Windows; the journal is then unlocked, as it was before
+    fcntl = None
+
+# Column order of the records, also used as the CSV header
+RECORD_FIELDS = [
+    "Student Name",
+    "Subject",
+    "Year",
+    "Semester",
+    "Question Number",
+    "Question",
+    "Answer Key",
+    "Student Answer",
+    "Score",
+    "Feedback",
+    "Strengths",
+    "Areas for Improvement",
+    "Model_Thoughts",
+    "Samples Used",
+    "Score Spread",
+    "Reused From",
+    "Similarity"
+]
+
+WRITE_BUFFER_SIZE = 1 << 16
+
+# Score of an item the grader skipped (model call failed, deadline, cancellation)
+UNGRADED_SCORE = "Not graded"
+# Exit status of a grader run that stopped early and marked the rest as ungraded
+PARTIAL_EXIT_CODE = 3
+
+REPORT_CSS = """
+        body {
+            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+            line-height: 1.6;
+            color: #333;
+            max-width: 1200px;
+            margin: 0 auto;
+            padding: 20px;
+        }
+        .evaluation-card {
+            background-color: #fff;
+            border-radius: 8px;
+            box-shadow: 0 4px 8px rgba(0,0,0,0.1);
+            margin-bottom: 24px;
+            padding: 20px;
+            border-left: 5px solid #4285f4;
+        }
+        .student-info {
+            display: flex;
+            justify-content: space-between;
+            border-bottom: 1px solid #eee;
+            padding-bottom: 10px;
+            margin-bottom: 15px;
+        }
+        .student-name {
+            font-size: 1.4rem;
+            font-weight: bold;
+            color: #4285f4;
+        }
+        .score {
+            font-size: 1.4rem;
+            font-weight: bold;
+        }
+        .score-high {
+            color: #0f9d58;
+        }
+        .score-medium {
+            color: #f4b400;
+        }
+        .score-low {
+            color: #db4437;
+        }
+        .question {
+            font-weight: bold;
+            margin-bottom: 10px;
+        }
+        .section {
+            margin-top: 15px;
+        }
+        .section-title {
+            font-weight: bold;
+            margin-bottom: 5px;
+        }
+        .strengths {
+            background-color: #e6f4ea;
+            border-radius: 4px;
+            padding: 10px;
+        }
+        .improvements {
+            background-color: #fce8e6;
+            border-radius: 4px;
+            padding: 10px;
+        }
+    """
+
+HTML_HEADER = """
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Evaluation Results</title>
+    <style>""" + REPORT_CSS + """</style>
+</head>
+<body>
+    <h1>Evaluation Results</h1>
+"""
+
+HTML_FOOTER = """
+</body>
+</html>
+"""
+
+CARD_TEMPLATE = """
+            <div class="evaluation-card">
+                <div class="student-info">
+                    <div class="student-name">{student_name}</div>
+                    <div class="score {score_class}">Score: {score}</div>
+                </div>
+                
+                <div class="question">{question}</div>
+                
+                <div class="section">
+                    <div class="section-title">Student Answer:</div>
+                    <p>{student_answer}</p>
+                </div>
+                
+                <div class="section">
+                    <div class="section-title">Feedback:</div>
+                    <p>{feedback}</p>
+                </div>
+                
+                <div class="section strengths">
+                    <div class="section-title">Strengths:</div>
+                    <p>{strengths}</p>
+                </div>
+                
+                <div class="section improvements">
+                    <div class="section-title">Areas for Improvement:</div>
+                    <p>{improvements}</p>
+                </div>
+            </div>
+            """
+
+
+def score_class(score):
+    """CSS class for a score: high from 80, medium from 60, low otherwise"""
+    if isinstance(score, (int, float)) and score >= 80:
+        return "score-high"
+    if isinstance(score, (int, float)) and score >= 60:
+        return "score-medium"
+    return "score-low"
+
+
+def render_card(record):
+    """Render one evaluation record as an escaped HTML card"""
+    def text(field):
+        return html.escape(str(record.get(field, "")))
+
+    return CARD_TEMPLATE.format(
+        student_name=text("Student Name"),
+        score_class=score_class(record.get("Score")),
+        score=text("Score"),
+        question=text("Question"),
+        student_answer=text("Student Answer"),
+        feedback=text("Feedback"),
+        strengths=text("Strengths"),
+        improvements=text("Areas for Improvement")
+    )
+
+
+class JournalLock:
+    """flock on the lock file of a journal; shared for appending, exclusive for replacing it"""
+
+    def __init__(self, records_file, exclusive=False, blocking=True):
+        self.path = records_file + ".lock"
+        self.exclusive = exclusive
+        self.blocking = blocking
+        self._fd = None
+
+    def acquire(self):
+        """Take the lock; returns False when it is held elsewhere and blocking is off"""
+        if fcntl is None:
+            return True
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        flags = (fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH) | (0 if self.blocking else fcntl.LOCK_NB)
+        try:
+            fcntl.flock(self._fd, flags)
+        except BlockingIOError:
+            self.release()
+            return False
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+@contextmanager
+def journal_lock(records_file, exclusive=False):
+    """Hold the journal's lock for a block, waiting for it"""
+    lock = JournalLock(records_file, exclusive)
+    lock.acquire()
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+def append_record(records_file, record):
+    """
+    Add one record to the end of a live journal, e.g. a regraded item that replaces an earlier one.
+
+    The line goes out in a single append-mode write, so it does not interleave with the lines of a
+    grader that is writing to the same journal, and under the journal's lock, so a compaction
+    cannot drop it.
+    """
+    line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+    with journal_lock(records_file):
+        fd = os.open(records_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+def write_report_file(html_file, records):
+    """Write the HTML report of the given records, grouped by student, and move it into place
+
+    Used to bring the report up to date with the journal after a regrade. The temporary file
+    has a name of its own, so this never mixes with a ReportWriter's run in progress.
+    """
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(html_file)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", buffering=WRITE_BUFFER_SIZE) as f:
+            f.write(HTML_HEADER)
+            for record in records:
+                f.write(render_card(record))
+            f.write(HTML_FOOTER)
+        os.replace(temporary, html_file)
+    except BaseException:
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+        raise
+
+
+class ReportWriter:
+    """Streams evaluation records to the HTML report, the JSONL records and an optional CSV"""
+
+    def __init__(self, html_file, records_file=None, csv_file=None, append=False):
+        self._targets = [path for path in (html_file, csv_file) if path]
+        self._html = self._open(html_file) if html_file else None
+        self._records = None
+        # Held until the run ends, so the journal is not compacted under it
+        self._lock = JournalLock(records_file) if records_file else None
+        if self._lock:
+            self._lock.acquire()
+        if records_file and append:
+            # Add to the current run's journal; readers keep tailing the same inode
+            self._records = open(records_file, "a", encoding="utf-8", buffering=WRITE_BUFFER_SIZE)
+        elif records_file:
+            # Swap in a fresh file at the start of the run; readers see the new inode and start over.
+            # Opened for appending so a regrade's append_record() is never overwritten.
+            self._open(records_file).close()
+            self._records = open(records_file + ".tmp", "a", encoding="utf-8", buffering=WRITE_BUFFER_SIZE)
+            os.replace(records_file + ".tmp", records_file)
+        self._csv_handle = self._open(csv_file, newline="") if csv_file else None
+        self._csv = None
+        if self._csv_handle:
+            self._csv = csv.DictWriter(self._csv_handle, fieldnames=RECORD_FIELDS, extrasaction="ignore")
+            self._csv.writeheader()
+        self.count = 0
+        if self._html:
+            self._html.write(HTML_HEADER)
+
+    @staticmethod
+    def _open(path, newline=None):
+        return open(path + ".tmp", "w", encoding="utf-8", newline=newline, buffering=WRITE_BUFFER_SIZE)
+
+    def _handles(self):
+        return [h for h in (self._html, self._records, self._csv_handle) if h]
+
+    def write(self, record):
+        """Append one graded item to every file; records must arrive grouped by student"""
+        self.write_journal(record)
+        self.write_report(record)
+
+    def write_journal(self, record):
+        """Append one graded item to the JSONL records only; any order is fine there"""
+        if self._records:
+            self._records.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._records.flush()
+
+    def write_report(self, record):
+        """Append one graded item to the HTML and CSV reports; records must arrive grouped by student"""
+        if self._html:
+            self._html.write(render_card(record))
+        if self._csv:
+            self._csv.writerow(record)
+        self.count += 1
+
+    def close(self):
+        """Finish the report and move every file into place"""
+        if self._html:
+            self._html.write(HTML_FOOTER)
+        for handle in self._handles():
+            handle.close()
+        if self._lock:
+            self._lock.release()
+        for path in self._targets:
+            os.replace(path + ".tmp", path)
+
+    def abort(self):
+        """Discard the partial report files; records graded so far stay in the journal"""
+        for handle in self._handles():
+            handle.close()
+        if self._lock:
+            self._lock.release()
+        for path in self._targets:
+            try:
+                os.remove(path + ".tmp")
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
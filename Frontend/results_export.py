@@ -0,0 +1,246 @@
+"""
+Columnar export of evaluation results for analysis in notebooks.
+
+The records journal repeats the question and answer key in every student's
+record. The export normalizes it into three tables joined by integer ids:
+
+    students   student_id, student_name, subject, year, semester
+    questions  question_id, subject, year, semester, question_number, question, answer_key
+    results    student_id, question_id, score, student_answer, feedback, strengths,
+               improvements, model_thoughts, samples_used, score_spread
+
+Tables are written as Parquet (compressed, with dictionary-encoded strings and
+per-row-group min/max statistics for predicate pushdown) or as uncompressed Arrow
+IPC files, which pyarrow can memory-map and read without copying. Exports are
+cached in EXPORT_FOLDER and only rebuilt when the journal changes.
+
+pyarrow is optional; without it the export is unavailable. It is imported on the
+first export so it does not slow down app startup.
+
+    python results_export.py --format arrow
+"""
+import argparse
+import json
+import os
+import threading
+import zipfile
+
+# Loaded by _import_pyarrow()
+pa = pa_ipc = pq = None
+
+# Structured results written by auto_checker_v3.py
+RECORDS_FILE = "evaluation_records.jsonl"
+EXPORT_FOLDER = "exports"
+
+TABLES = ("students", "questions", "results")
+FORMATS = {
+    "parquet": {"extension": "parquet", "mimetype": "application/vnd.apache.parquet"},
+    "arrow": {"extension": "arrow", "mimetype": "application/vnd.apache.arrow.file"}
+}
+# Rows per Parquet row group / Arrow record batch; each carries its own statistics
+ROW_GROUP_SIZE = 16384
+PARQUET_COMPRESSION = "zstd"
+
+
+class ExportError(RuntimeError):
+    """Raised when an export cannot be produced"""
+
+
+def _import_pyarrow():
+    """Import pyarrow on first use; returns False when it is not installed"""
+    global pa, pa_ipc, pq
+    if pa is None:
+        try:
+            import pyarrow
+            import pyarrow.ipc
+            import pyarrow.parquet
+        except ImportError:
+            return False
+        pa, pa_ipc, pq = pyarrow, pyarrow.ipc, pyarrow.parquet
+    return True
+
+
+def read_latest_records(records_file):
+    """Read the journal, keeping the latest record of each (student, question)"""
+    latest = {}
+    with open(records_file, "r", encoding="utf-8") as f:
+        for line in f:
+            # A line without its newline is still being written by the grader
+            if line.strip() and line.endswith("\n"):
+                record = json.loads(line)
+                latest[(record.get("Student Name"), record.get("Question Number"))] = record
+    return latest.values()
+
+
+def _dictionary(values):
+    return pa.array(values, type=pa.string()).dictionary_encode()
+
+
+def _int_or_none(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return int(round(value))
+
+
+def build_tables(records):
+    """Normalize evaluation records into the students, questions and results tables"""
+    students = {}
+    questions = {}
+    student_cols = {"student_name": [], "subject": [], "year": [], "semester": []}
+    question_cols = {"subject": [], "year": [], "semester": [], "question_number": [], "question": [], "answer_key": []}
+    result_cols = {
+        "student_id": [], "question_id": [], "score": [], "student_answer": [], "feedback": [],
+        "strengths": [], "improvements": [], "model_thoughts": [], "samples_used": [], "score_spread": []
+    }
+
+    for record in records:
+        exam = tuple(str(record.get(field, "Unknown")) for field in ("Subject", "Year", "Semester"))
+        name = record.get("Student Name", "Unknown Student")
+
+        student_id = students.get((name,) + exam)
+        if student_id is None:
+            student_id = students[(name,) + exam] = len(students)
+            student_cols["student_name"].append(name)
+            for field, value in zip(("subject", "year", "semester"), exam):
+                student_cols[field].append(value)
+
+        number = _int_or_none(record.get("Question Number"))
+        question_id = questions.get(exam + (number,))
+        if question_id is None:
+            question_id = questions[exam + (number,)] = len(questions)
+            for field, value in zip(("subject", "year", "semester"), exam):
+                question_cols[field].append(value)
+            question_cols["question_number"].append(number)
+            question_cols["question"].append(record.get("Question", ""))
+            question_cols["answer_key"].append(record.get("Answer Key", ""))
+
+        result_cols["student_id"].append(student_id)
+        result_cols["question_id"].append(question_id)
+        result_cols["score"].append(_int_or_none(record.get("Score")))
+        result_cols["student_answer"].append(record.get("Student Answer", ""))
+        result_cols["feedback"].append(record.get("Feedback", ""))
+        result_cols["strengths"].append(record.get("Strengths", ""))
+        result_cols["improvements"].append(record.get("Areas for Improvement", ""))
+        result_cols["model_thoughts"].append(record.get("Model_Thoughts", ""))
+        result_cols["samples_used"].append(_int_or_none(record.get("Samples Used")))
+        result_cols["score_spread"].append(_int_or_none(record.get("Score Spread")))
+
+    return {
+        "students": pa.table({
+            "student_id": pa.array(range(len(students)), type=pa.int32()),
+            "student_name": pa.array(student_cols["student_name"], type=pa.string()),
+            "subject": _dictionary(student_cols["subject"]),
+            "year": _dictionary(student_cols["year"]),
+            "semester": _dictionary(student_cols["semester"])
+        }),
+        "questions": pa.table({
+            "question_id": pa.array(range(len(questions)), type=pa.int32()),
+            "subject": _dictionary(question_cols["subject"]),
+            "year": _dictionary(question_cols["year"]),
+            "semester": _dictionary(question_cols["semester"]),
+            "question_number": pa.array(question_cols["question_number"], type=pa.int32()),
+            "question": pa.array(question_cols["question"], type=pa.string()),
+            "answer_key": pa.array(question_cols["answer_key"], type=pa.string())
+        }),
+        "results": pa.table({
+            "student_id": pa.array(result_cols["student_id"], type=pa.int32()),
+            "question_id": pa.array(result_cols["question_id"], type=pa.int32()),
+            "score": pa.array(result_cols["score"], type=pa.int16()),
+            "student_answer": pa.array(result_cols["student_answer"], type=pa.string()),
+            "feedback": pa.array(result_cols["feedback"], type=pa.string()),
+            "strengths": pa.array(result_cols["strengths"], type=pa.string()),
+            "improvements": pa.array(result_cols["improvements"], type=pa.string()),
+            "model_thoughts": pa.array(result_cols["model_thoughts"], type=pa.string()),
+            "samples_used": pa.array(result_cols["samples_used"], type=pa.int16()),
+            "score_spread": pa.array(result_cols["score_spread"], type=pa.int16())
+        })
+    }
+
+
+def write_table(table, path, fmt):
+    """Write one table atomically in the given format"""
+    tmp_path = path + ".tmp"
+    if fmt == "parquet":
+        pq.write_table(
+            table, tmp_path,
+            row_group_size=ROW_GROUP_SIZE,
+            compression=PARQUET_COMPRESSION,
+            use_dictionary=True,
+            write_statistics=True
+        )
+    else:
+        # Uncompressed so readers can memory-map the buffers directly
+        with pa_ipc.new_file(tmp_path, table.schema) as writer:
+            for batch in table.to_batches(max_chunksize=ROW_GROUP_SIZE):
+                writer.write_batch(batch)
+    os.replace(tmp_path, path)
+
+
+class ResultsExporter:
+    """Builds and caches columnar exports of the records journal"""
+
+    def __init__(self, records_file=RECORDS_FILE, export_folder=EXPORT_FOLDER):
+        self.records_file = records_file
+        # Absolute so Flask's send_file does not resolve it against the app root
+        self.export_folder = os.path.abspath(export_folder)
+        self._lock = threading.Lock()
+        self._built = {}  # format -> journal signature the files were built from
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.records_file)
+        except OSError:
+            raise ExportError("No evaluation records found. Run an evaluation first.")
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def path_for(self, table, fmt):
+        return os.path.join(self.export_folder, f"evaluation_{table}.{FORMATS[fmt]['extension']}")
+
+    def bundle_path(self, fmt):
+        return os.path.join(self.export_folder, f"evaluation_{fmt}.zip")
+
+    def export(self, fmt):
+        """Make sure the tables for fmt are current; returns their paths by table name"""
+        if not _import_pyarrow():
+            raise ExportError("Columnar export needs pyarrow; install it with 'pip install pyarrow'")
+        if fmt not in FORMATS:
+            raise ExportError(f"Unknown export format '{fmt}', expected one of {', '.join(FORMATS)}")
+
+        with self._lock:
+            signature = self._signature()
+            paths = {table: self.path_for(table, fmt) for table in TABLES}
+            if self._built.get(fmt) != signature or not all(os.path.exists(p) for p in paths.values()):
+                os.makedirs(self.export_folder, exist_ok=True)
+                tables = build_tables(read_latest_records(self.records_file))
+                for table, path in paths.items():
+                    write_table(tables[table], path, fmt)
+                self._write_bundle(fmt, paths)
+                self._built[fmt] = signature
+            return paths
+
+    def _write_bundle(self, fmt, paths):
+        # Stored, not deflated: Parquet is already compressed and Arrow files stay mappable
+        tmp_path = self.bundle_path(fmt) + ".tmp"
+        with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_STORED) as bundle:
+            for path in paths.values():
+                bundle.write(path, os.path.basename(path))
+        os.replace(tmp_path, self.bundle_path(fmt))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export evaluation results as columnar tables")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="parquet")
+    parser.add_argument("--records", default=RECORDS_FILE, help="Records journal to export")
+    parser.add_argument("--out", default=EXPORT_FOLDER, help="Folder for the exported files")
+    args = parser.parse_args()
+
+    try:
+        paths = ResultsExporter(args.records, args.out).export(args.format)
+    except ExportError as e:
+        parser.error(str(e))
+    for table, path in paths.items():
+        print(f"{table}: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""
+Retention for uploads and the records journal.
+
+Uploads are named subject_year_semester_timestamp.ext and stay in the upload
+folder forever, which every results request scans. Once a cohort (subject, year,
+semester) has had no upload for INACTIVE_DAYS, its files are compacted into one
+zip archive per cohort in ARCHIVE_FOLDER and removed from the upload folder, so
+only active cohorts are scanned. A zip's central directory indexes its members,
+so a single archived answer file is read on demand without unpacking the rest;
+UploadStore reads a file from the upload folder or, failing that, from the
+archives, and lists archived files when asked to.
+
+The records journal only ever grows: regrades and --append runs add records that
+supersede earlier ones. Compaction rewrites it with the latest record of each
+(subject, year, semester, student, question), in their original order, which is
+what every reader of the journal already uses.
+
+RetentionTask runs both in a background thread every INTERVAL_HOURS, skipping a
+round while an evaluation is running, since the grader keeps the journal open.
+Compaction also takes the journal's lock exclusively (report_writer.journal_lock)
+and is skipped while a grader or a regrade holds it, so no record is lost to the
+rewrite. The command refuses to run while an evaluation job or a grader is
+active. Uploads still waiting for the upload pipeline are never archived.
+
+    python retention.py                 # one round now
+    python retention.py --dry-run       # only list what would be archived
+
+Configuration (environment):
+    RETENTION                  set to 0 to turn the background task off
+    RETENTION_INACTIVE_DAYS    days without uploads after which a cohort is archived, default 30
+    RETENTION_INTERVAL_HOURS   hours between rounds, default 6
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import threading
+import time
+import zipfile
+
+from report_writer import JournalLock
+
+logger = logging.getLogger(__name__)
+
+RETENTION_CONFIG = {
+    "ENABLED": os.environ.get("RETENTION", "1") != "0",
+    "INACTIVE_DAYS": float(os.environ.get("RETENTION_INACTIVE_DAYS", "30")),
+    "INTERVAL_HOURS": float(os.environ.get("RETENTION_INTERVAL_HOURS", "6")),
+    "ARCHIVE_FOLDER": "upload_archive"
+}
+
+# Uploads saved by /api/upload; other files in the folder are never archived
+UPLOAD_PATTERN = re.compile(r"^(?P<subject>.+)_(?P<year>[^_]+)_(?P<semester>[^_]+)_\d+\.(?:txt|jsonl|csv)$")
+COHORT_FIELDS = ("Subject", "Year", "Semester")
+
+
+def upload_cohort(filename):
+    """(subject, year, semester) of an upload, or None for files not named like uploads"""
+    match = UPLOAD_PATTERN.match(filename)
+    return (match["subject"], match["year"], match["semester"]) if match else None
+
+
+class UploadStore:
+    """Upload files in the upload folder and in the per-cohort archives"""
+
+    def __init__(self, folder, archive_folder=None):
+        self.folder = folder
+        self.archive_folder = archive_folder or RETENTION_CONFIG["ARCHIVE_FOLDER"]
+        # archive path -> (mtime, member names), refreshed when an archive changes
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def archive_path(self, cohort):
+        return os.path.join(self.archive_folder, "_".join(cohort) + ".zip")
+
+    def _members(self, path):
+        """Member names of one archive, from its index"""
+        mtime = os.stat(path).st_mtime_ns
+        with self._lock:
+            cached = self._indexes.get(path)
+            if cached and cached[0] == mtime:
+                return cached[1]
+        with zipfile.ZipFile(path) as archive:
+            names = archive.namelist()
+        with self._lock:
+            self._indexes[path] = (mtime, names)
+        return names
+
+    def archived(self, cohort=None):
+        """{filename: archive path} of archived uploads, of one cohort or of all"""
+        if cohort is not None:
+            paths = [self.archive_path(cohort)]
+        else:
+            try:
+                paths = [os.path.join(self.archive_folder, name) for name in sorted(os.listdir(self.archive_folder))
+                         if name.endswith(".zip")]
+            except OSError:
+                return {}
+        found = {}
+        for path in paths:
+            try:
+                for name in self._members(path):
+                    found[name] = path
+            except (OSError, zipfile.BadZipFile):
+                continue
+        return found
+
+    def read(self, filename):
+        """Text of an upload, from the upload folder or else from its cohort's archive"""
+        path = os.path.join(self.folder, filename)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                return f.read()
+        cohort = upload_cohort(filename)
+        archive_path = self.archive_path(cohort) if cohort else None
+        if archive_path and os.path.exists(archive_path):
+            with zipfile.ZipFile(archive_path) as archive:
+                try:
+                    return archive.read(filename).decode("utf-8", "replace")
+                except KeyError:
+                    pass
+        raise FileNotFoundError(f"No upload {filename} in {self.folder} or its archive")
+
+    def inactive_cohorts(self, inactive_days, exclude=()):
+        """{cohort: [filenames]} of cohorts whose newest upload is older than inactive_days"""
+        cutoff = time.time() - inactive_days * 86400
+        cohorts = {}
+        newest = {}
+        for entry in os.scandir(self.folder):
+            cohort = upload_cohort(entry.name)
+            if cohort is None or not entry.is_file():
+                continue
+            cohorts.setdefault(cohort, []).append(entry.name)
+            newest[cohort] = max(newest.get(cohort, 0), entry.stat().st_mtime)
+            if entry.path in exclude or entry.name in exclude:
+                # Still waiting to be graded: the cohort is active
+                newest[cohort] = float("inf")
+        return {cohort: sorted(names) for cohort, names in cohorts.items() if newest[cohort] < cutoff}
+
+    def compact(self, cohort, filenames):
+        """Move uploads of a cohort into its archive; returns the number archived"""
+        os.makedirs(self.archive_folder, exist_ok=True)
+        path = self.archive_path(cohort)
+        temporary = path + ".tmp"
+        # Rewrite rather than append in place, so a crash never leaves a damaged archive
+        with zipfile.ZipFile(temporary, "w", zipfile.ZIP_DEFLATED, compresslevel=9) as target:
+            if os.path.exists(path):
+                with zipfile.ZipFile(path) as existing:
+                    for info in existing.infolist():
+                        if info.filename not in filenames:
+                            target.writestr(info, existing.read(info))
+            for name in filenames:
+                target.write(os.path.join(self.folder, name), arcname=name)
+        with zipfile.ZipFile(temporary) as written:
+            damaged = written.testzip()
+        if damaged:
+            os.remove(temporary)
+            raise OSError(f"Archive {temporary} failed its check at {damaged}")
+        os.replace(temporary, path)
+        for name in filenames:
+            os.remove(os.path.join(self.folder, name))
+        return len(filenames)
+
+
+def journal_in_use(records_file):
+    """Whether a grader or a regrade is appending to the journal right now"""
+    lock = JournalLock(records_file, exclusive=True, blocking=False)
+    if not lock.acquire():
+        return True
+    lock.release()
+    return False
+
+
+def compact_journal(records_file):
+    """Drop superseded records from the journal; returns (records kept, records dropped)
+
+    Returns None, leaving the journal alone, while anyone is appending to it.
+    """
+    if not os.path.exists(records_file):
+        return 0, 0
+    lock = JournalLock(records_file, exclusive=True, blocking=False)
+    if not lock.acquire():
+        return None
+    try:
+        return _compact_journal(records_file)
+    finally:
+        lock.release()
+
+
+def _compact_journal(records_file):
+    """compact_journal under the journal's exclusive lock"""
+    with open(records_file, "rb") as f:
+        lines = f.readlines()
+    # A last line without its newline was cut off mid-write; it is carried over below
+    if lines and not lines[-1].endswith(b"\n"):
+        lines.pop()
+    offset = sum(len(line) for line in lines)
+
+    # Latest line of each item
+    latest = {}
+    records = []
+    for number, line in enumerate(lines):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        key = tuple(str(record.get(field, "Unknown")) for field in COHORT_FIELDS) + (
+            record.get("Student Name"), record.get("Question Number")
+        )
+        latest[key] = number
+        records.append(number)
+    kept = sorted(latest.values())
+    if len(kept) == len(records):
+        return len(kept), 0
+
+    temporary = records_file + ".compact"
+    with open(temporary, "wb") as f:
+        f.writelines(lines[number] for number in kept)
+        # A partial line left by a writer that died mid-write is carried over
+        with open(records_file, "rb") as current:
+            current.seek(offset)
+            f.write(current.read())
+    os.replace(temporary, records_file)
+    return len(kept), len(records) - len(kept)
+
+
+class RetentionTask:
+    """Archives inactive cohorts and compacts the records journal, now or every interval"""
+
+    def __init__(self, store, records_file, is_busy=None, pending=None,
+                 inactive_days=None, interval_hours=None):
+        self.store = store
+        self.records_file = records_file
+        # Callables: whether an evaluation is running, and the uploads the pipeline still has to grade
+        self.is_busy = is_busy or (lambda: False)
+        self.pending = pending or (lambda: ())
+        self.inactive_days = RETENTION_CONFIG["INACTIVE_DAYS"] if inactive_days is None else inactive_days
+        self.interval = (RETENTION_CONFIG["INTERVAL_HOURS"] if interval_hours is None else interval_hours) * 3600
+        self.last_run = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def run_once(self, dry_run=False):
+        """One round; returns what was done, or None when an evaluation is running"""
+        if self.is_busy():
+            return None
+        cohorts = self.store.inactive_cohorts(self.inactive_days, exclude=set(self.pending()))
+        report = {
+            "cohorts": ["_".join(cohort) for cohort in cohorts],
+            "files": sum(len(names) for names in cohorts.values()),
+            "recordsKept": None,
+            "recordsDropped": None
+        }
+        if dry_run:
+            return report
+        for cohort, names in cohorts.items():
+            try:
+                self.store.compact(cohort, names)
+                logger.info(f"Archived {len(names)} upload(s) of {'/'.join(cohort)} to {self.store.archive_path(cohort)}")
+            except OSError as e:
+                logger.warning(f"Could not archive {'/'.join(cohort)}: {str(e)}")
+        # Checked again: a job may have started while the uploads were archived
+        if not self.is_busy():
+            compacted = compact_journal(self.records_file)
+            if compacted is not None:
+                report["recordsKept"], report["recordsDropped"] = compacted
+        self.last_run = dict(report, at=time.time())
+        return report
+
+    def start(self):
+        """Run a round every interval in a background thread"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, name="retention", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                report = self.run_once()
+                if report is None:
+                    logger.info("Retention round skipped while an evaluation is running")
+            except Exception as e:
+                logger.warning(f"Retention round failed: {str(e)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive inactive cohorts' uploads and compact the records journal")
+    parser.add_argument("--uploads", default="student_answers", help="Upload folder (default: %(default)s)")
+    parser.add_argument("--records", default="evaluation_records.jsonl", help="Records journal (default: %(default)s)")
+    parser.add_argument("--inactive-days", type=float, default=RETENTION_CONFIG["INACTIVE_DAYS"],
+                        help="Archive cohorts without uploads for this many days (default: %(default)s)")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the cohorts that would be archived")
+    args = parser.parse_args()
+
+    # Jobs are only visible from here through a shared state database
+    from job_store import create_job_store
+    job_store = create_job_store(os.environ.get("EVALUATION_STATE_DB"))
+
+    def is_busy():
+        return job_store.status()["running"] or journal_in_use(args.records)
+
+    task = RetentionTask(UploadStore(args.uploads), args.records, is_busy=is_busy, inactive_days=args.inactive_days)
+    report = task.run_once(dry_run=args.dry_run)
+    if report is None:
+        raise SystemExit("An evaluation is running; try again once it has finished")
+    print(f"{'Would archive' if args.dry_run else 'Archived'} {report['files']} upload(s) of "
+          f"{len(report['cohorts'])} cohort(s)" + "".join(f"\n  {cohort}" for cohort in report["cohorts"]))
+    if report["recordsDropped"] is not None:
+        print(f"Records journal: kept {report['recordsKept']}, dropped {report['recordsDropped']} superseded")
+
+
+if __name__ == "__main__":
+    main()
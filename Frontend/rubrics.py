@@ -0,0 +1,168 @@
+"""
+Rubric registry for multi-exam grading.
+
+A rubric is a question file plus an answer-key file. Rubrics for a particular exam
+live in RUBRICS_FOLDER under a folder named like the uploaded answer files,
+"<subject>_<year>_<semester>", e.g. rubrics/Physics_2024_1/questions.txt. The
+top-level questions.txt / answers.txt remain the default rubric.
+
+Rubrics are loaded and validated once, kept in memory with the static part of
+every prompt already built, and only reloaded when one of their files changes.
+"""
+import os
+import threading
+
+# File paths for the default questions and answer keys
+QUESTIONS_FILE = "questions.txt"
+ANSWERS_FILE = "answers.txt"
+# Folder containing one sub-folder per exam, e.g. "rubrics/Physics_2024_1"
+RUBRICS_FOLDER = "rubrics"
+
+# Form values that mean "not specified" when coming from the upload form
+UNSPECIFIED_VALUES = ("", "unknown")
+
+
+def load_text_file(file_path):
+    """Load a text file and return a list of non-empty, stripped lines."""
+    with open(file_path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def build_prompt_prefix(question, answer_key):
+    """Build the part of the evaluation prompt that is the same for every student."""
+    return (
+        f"Question: {question}\n"
+        f"Answer Key: {answer_key}\n"
+    )
+
+
+def rubric_key(subject=None, year=None, semester=None):
+    """Normalize exam identifiers to a registry key; None means the default rubric."""
+    parts = [str(p).strip() if p is not None else "" for p in (subject, year, semester)]
+    if all(p.lower() in UNSPECIFIED_VALUES for p in parts):
+        return None
+    return tuple(parts)
+
+
+class RubricError(ValueError):
+    """Raised when a rubric is missing or its files are inconsistent."""
+
+
+class Rubric:
+    """A validated question/answer-key set with precomputed prompt prefixes."""
+
+    def __init__(self, key, questions_file, answers_file):
+        self.key = key
+        self.questions_file = questions_file
+        self.answers_file = answers_file
+        self.mtimes = self._current_mtimes()
+
+        self.questions = load_text_file(questions_file)
+        self.answers = load_text_file(answers_file)
+
+        if not self.questions:
+            raise RubricError(f"No questions found in {questions_file}")
+        if len(self.questions) != len(self.answers):
+            raise RubricError(
+                f"The number of questions and answers do not match! "
+                f"({len(self.questions)} in {questions_file}, {len(self.answers)} in {answers_file})"
+            )
+
+        self.prompt_prefixes = [
+            build_prompt_prefix(question, answer_key)
+            for question, answer_key in zip(self.questions, self.answers)
+        ]
+
+    def _current_mtimes(self):
+        return tuple(os.stat(path).st_mtime_ns for path in (self.questions_file, self.answers_file))
+
+    def is_stale(self):
+        """Check whether either file changed (or vanished) since this rubric was loaded."""
+        try:
+            return self._current_mtimes() != self.mtimes
+        except OSError:
+            return True
+
+    def items(self):
+        """Yield (index, question, answer_key, prompt_prefix), numbered from 1."""
+        for i, item in enumerate(zip(self.questions, self.answers, self.prompt_prefixes), start=1):
+            yield (i,) + item
+
+    def __len__(self):
+        return len(self.questions)
+
+    def to_summary(self):
+        subject, year, semester = self.key or ("default", "", "")
+        return {
+            "subject": subject,
+            "year": year,
+            "semester": semester,
+            "questionCount": len(self.questions),
+            "questionsFile": self.questions_file,
+            "answersFile": self.answers_file
+        }
+
+
+class RubricRegistry:
+    """Thread-safe cache of rubrics keyed by (subject, year, semester)."""
+
+    def __init__(self, rubrics_folder=RUBRICS_FOLDER, questions_file=QUESTIONS_FILE, answers_file=ANSWERS_FILE):
+        self.rubrics_folder = rubrics_folder
+        self.questions_file = questions_file
+        self.answers_file = answers_file
+        self._rubrics = {}
+        self._lock = threading.Lock()
+
+    def paths_for(self, key):
+        """Return the (questions, answers) paths for a key, or None if it has no rubric."""
+        if key is None:
+            return self.questions_file, self.answers_file
+        # Exam identifiers come from requests: they name a folder in the rubrics folder and nothing else
+        name = "_".join(key)
+        if any(sep in name for sep in ("/", "\\", "\0")) or name in (".", ".."):
+            raise RubricError(f"Invalid exam identifiers: {name!r}")
+        folder = os.path.join(self.rubrics_folder, name)
+        root = os.path.abspath(self.rubrics_folder)
+        if os.path.dirname(os.path.abspath(folder)) != root:
+            raise RubricError(f"Invalid exam identifiers: {name!r}")
+        paths = (os.path.join(folder, QUESTIONS_FILE), os.path.join(folder, ANSWERS_FILE))
+        if all(os.path.exists(path) for path in paths):
+            return paths
+        return None
+
+    def get(self, subject=None, year=None, semester=None, fallback=True):
+        """Return the rubric for an exam, loading or reloading it if needed.
+
+        Exams without their own rubric use the default one unless fallback is False.
+        """
+        key = rubric_key(subject, year, semester)
+        paths = self.paths_for(key)
+        if paths is None:
+            if not fallback:
+                raise RubricError(f"No rubric registered for {'_'.join(key)}")
+            key = None
+            paths = self.paths_for(None)
+
+        with self._lock:
+            rubric = self._rubrics.get(key)
+            if rubric is None or rubric.is_stale():
+                try:
+                    rubric = Rubric(key, *paths)
+                except OSError as e:
+                    raise RubricError(f"Could not load rubric: {e}") from e
+                self._rubrics[key] = rubric
+            return rubric
+
+    def available(self):
+        """List the exam keys that have a rubric folder on disk."""
+        keys = []
+        if os.path.isdir(self.rubrics_folder):
+            for name in sorted(os.listdir(self.rubrics_folder)):
+                parts = name.split("_")
+                if len(parts) == 3 and self.paths_for(tuple(parts)):
+                    keys.append(tuple(parts))
+        return keys
+
+
+# Shared registry so concurrent jobs in one process reuse warm rubrics
+registry = RubricRegistry()
@@ -0,0 +1,303 @@
+"""
+Dry-run planner for grader runs.
+
+Before a large run, `auto_checker_v3.py --plan` (or GET /api/plan) builds every
+prompt the run would send, in the order it would send them, and estimates:
+
+- model calls, including long-answer chunks and the expected consistency samples
+- prompt tokens, and how many of them Ollama can serve from its prompt cache
+  because they repeat the previous prompt's prefix
+- completion tokens
+- wall time, from the prompt and completion speed measured on recent runs and
+  the concurrency of the run: chunk calls (--chunk-workers) and consistency
+  samples (--sample-workers) overlap, up to the calls the Ollama servers run at
+  once (the tuned profile's parallel calls on each endpoint)
+
+Items the run would take from the completion archive (--reuse-archive) or the
+semantic cache (--semantic-cache) are counted separately and cost nothing. Tokens are estimated from text length
+(see long_answers.estimate_tokens) since no tokenizer is installed. Speeds and
+completion lengths come from the timed items of the completion archive; without
+history, conservative CPU defaults are used and the plan says so.
+
+The plan has a per-student breakdown and flags outliers: answers over the
+long-answer token budget, answers far longer than the cohort's typical answer
+to the same question, and missing answers.
+"""
+import statistics
+
+from auto_checker_v3 import (
+    CHUNK_INSTRUCTIONS, EVALUATION_INSTRUCTIONS, OLLAMA_MODEL, REDUCE_INSTRUCTIONS, layout_prompt
+)
+from completion_archive import GRADING_SETTINGS, item_key
+from long_answers import estimate_tokens, split_into_chunks
+from ollama_client import load_profile, parse_endpoints
+from prompt_cache import PromptCacheStats
+from rubrics import build_prompt_prefix
+
+# Used when the completion archive has no timed items yet (CPU-bound Ollama host)
+DEFAULT_PROMPT_TOKENS_PER_SECOND = 40.0
+DEFAULT_COMPLETION_TOKENS_PER_SECOND = 6.0
+DEFAULT_COMPLETION_TOKENS = 600
+# Recent timed items the speed estimate is fitted on
+HISTORY_ITEMS = 500
+# Tokens of one chunk evaluation quoted in a reduce prompt
+CHUNK_SUMMARY_TOKENS = 150
+# An answer this many times longer than the median answer to its question is flagged
+OUTLIER_FACTOR = 3
+MISSING_ANSWER = "No answer provided."
+
+
+def item_prompts(args, question, answer_key, student_answer, prompt_prefix=None):
+    """Prompts one sample of an item sends, as the grader would build them.
+
+    A reduce prompt depends on the chunk evaluations, so it is approximated with
+    placeholder summaries of typical length.
+    """
+    if prompt_prefix is None:
+        prompt_prefix = build_prompt_prefix(question, answer_key)
+    static_first = args.schedule == "question"
+    if not args.long_answers or estimate_tokens(student_answer) <= args.long_answer_tokens:
+        return [layout_prompt(prompt_prefix, f"Student Answer: {student_answer}\n\n", EVALUATION_INSTRUCTIONS, static_first)]
+
+    chunks = split_into_chunks(student_answer, args.long_answer_tokens, args.chunk_overlap)
+    prompts = [
+        layout_prompt(
+            prompt_prefix,
+            f"Student Answer (part {part} of {len(chunks)}): {chunk}\n\n",
+            CHUNK_INSTRUCTIONS + EVALUATION_INSTRUCTIONS,
+            static_first
+        )
+        for part, chunk in enumerate(chunks, start=1)
+    ]
+    summary = "x" * (CHUNK_SUMMARY_TOKENS * 4)
+    prompts.append(layout_prompt(
+        prompt_prefix,
+        f"The student's answer was too long to evaluate at once, so it was evaluated in {len(chunks)} parts:\n\n"
+        + "".join(f"Part {part}:\n{summary}\n\n" for part in range(1, len(chunks) + 1)),
+        REDUCE_INSTRUCTIONS + EVALUATION_INSTRUCTIONS,
+        static_first
+    ))
+    return prompts
+
+
+def server_capacity(args):
+    """Model calls the Ollama servers run at once: the tuned profile's parallel calls on every endpoint"""
+    profile = load_profile(OLLAMA_MODEL)
+    per_endpoint = max(1, int(profile.get("parallel", 1))) if profile else 1
+    endpoints = len(parse_endpoints(args.endpoints)) if args.client == "native" else 1
+    return max(1, endpoints) * per_endpoint
+
+
+def item_concurrency(settings, calls, capacity):
+    """Calls of one item that ran at once with these grading settings, at most capacity"""
+    workers = settings.get("sample_workers", 1) if settings.get("consistency") else 1
+    if settings.get("long_answers"):
+        workers *= settings.get("chunk_workers", 1)
+    return max(1, min(capacity, workers or 1, calls))
+
+
+def measure_history(archive, limit=HISTORY_ITEMS, capacity=1):
+    """Model speed and completion length measured on recent timed items of the archive
+
+    Fits seconds = prompt tokens / prompt speed + completion tokens / completion speed by least
+    squares over the items. Prompt tokens are estimated from the record, one plain prompt per call.
+    An item's seconds are wall time, so they are scaled by the calls that overlapped to get the
+    time of its calls one after another.
+    """
+    rows = []
+    completion_lengths = []
+    samples = []
+    for record, settings, completions, seconds in (archive.recent(limit) if archive else ()):
+        if not completions:
+            continue
+        prompt = (EVALUATION_INSTRUCTIONS + build_prompt_prefix(record.get("Question", ""), record.get("Answer Key", ""))
+                  + str(record.get("Student Answer", "")))
+        completion_tokens = [estimate_tokens(text) for _, text in completions]
+        completion_lengths.extend(completion_tokens)
+        seconds *= item_concurrency(settings, len(completions), capacity)
+        rows.append((estimate_tokens(prompt) * len(completions), sum(completion_tokens), seconds))
+        if settings.get("consistency") and record.get("Samples Used"):
+            samples.append(record["Samples Used"])
+
+    history = {
+        "items": len(rows),
+        "measured": False,
+        "promptTokensPerSecond": DEFAULT_PROMPT_TOKENS_PER_SECOND,
+        "completionTokensPerSecond": DEFAULT_COMPLETION_TOKENS_PER_SECOND,
+        "completionTokensPerCall": statistics.mean(completion_lengths) if completion_lengths else DEFAULT_COMPLETION_TOKENS,
+        "samplesPerItem": statistics.mean(samples) if samples else None
+    }
+    if len(rows) < 2:
+        return history
+
+    # Normal equations of the two-variable least squares fit of 1/speed
+    spp = sum(p * p for p, _, _ in rows)
+    scc = sum(c * c for _, c, _ in rows)
+    spc = sum(p * c for p, c, _ in rows)
+    sps = sum(p * s for p, _, s in rows)
+    scs = sum(c * s for _, c, s in rows)
+    determinant = spp * scc - spc * spc
+    if determinant > 0:
+        prompt_cost = (sps * scc - scs * spc) / determinant
+        completion_cost = (scs * spp - sps * spc) / determinant
+        if prompt_cost > 0 and completion_cost > 0:
+            history.update(measured=True, promptTokensPerSecond=1 / prompt_cost,
+                           completionTokensPerSecond=1 / completion_cost)
+            return history
+    # Collinear or implausible fit: attribute all time to completion tokens
+    total_completion = sum(c for _, c, _ in rows)
+    total_seconds = sum(s for _, _, s in rows)
+    if total_completion and total_seconds:
+        history.update(measured=True, promptTokensPerSecond=None,
+                       completionTokensPerSecond=total_completion / total_seconds)
+    return history
+
+
+def _new_row(name):
+    return {"student": name, "items": 0, "cached": 0, "calls": 0.0, "promptTokens": 0.0,
+            "cachedPromptTokens": 0.0, "completionTokens": 0.0, "seconds": 0.0, "flags": []}
+
+
+def _sample_weights(samples):
+    """Weights of the sample passes of an item: 2.4 expected samples are passes of 1, 1 and 0.4"""
+    whole = int(samples)
+    return [1.0] * whole + ([samples - whole] if samples > whole else [])
+
+
+def plan_run(args, rubric, students, archive=None, semantic=None):
+    """
+    Estimate a run of rubric over students, an iterable of (student, {question number: answer}).
+
+    args are the grader's options (schedule, long-answer and consistency settings, reuse_archive);
+    semantic is the semantic cache the run would use, if any.
+    Returns the plan as a dict with totals, the per-student rows and the flagged outliers.
+    """
+    students = list(students)
+    capacity = server_capacity(args)
+    history = measure_history(archive, capacity=capacity)
+    settings = {name: getattr(args, name) for name in GRADING_SETTINGS}
+    samples = 1
+    if args.consistency:
+        samples = history["samplesPerItem"] or max(1, min(args.agreement, args.samples))
+        samples = min(samples, args.samples)
+
+    # Typical answer length per question, to flag outliers
+    medians = {}
+    for i, _, _, _ in rubric.items():
+        lengths = [estimate_tokens(answers[i]) for _, answers in students if answers.get(i)]
+        medians[i] = statistics.median(lengths) if lengths else 0
+
+    completion_per_call = history["completionTokensPerCall"]
+    # No prompt speed means prompt evaluation did not measurably add to the time
+    prompt_cost = 1 / history["promptTokensPerSecond"] if history["promptTokensPerSecond"] else 0.0
+    completion_seconds = completion_per_call / history["completionTokensPerSecond"]
+    sample_weights = _sample_weights(samples)
+    sample_concurrency = min(args.sample_workers, len(sample_weights)) if args.consistency else 1
+
+    rows = {name: _new_row(name) for name, _ in students}
+    cache = PromptCacheStats()
+    if args.schedule == "question":
+        order = [(name, answers, item) for item in rubric.items() for name, answers in students]
+    else:
+        order = [(name, answers, item) for name, answers in students for item in rubric.items()]
+
+    for name, answers, (i, question, answer_key, prompt_prefix) in order:
+        row = rows[name]
+        row["items"] += 1
+        answer = answers.get(i) or MISSING_ANSWER
+        answer_tokens = estimate_tokens(answer)
+        if answer == MISSING_ANSWER:
+            row["flags"].append(f"Question {i}: no answer")
+        elif not args.long_answers and answer_tokens > args.long_answer_tokens:
+            row["flags"].append(f"Question {i}: answer of ~{answer_tokens} tokens is over the "
+                                f"{args.long_answer_tokens}-token budget; consider --long-answers")
+        elif medians[i] and answer_tokens > OUTLIER_FACTOR * medians[i] and answer_tokens > 100:
+            row["flags"].append(f"Question {i}: answer of ~{answer_tokens} tokens is "
+                                f"{answer_tokens / medians[i]:.0f}x the typical answer")
+
+        if ((archive is not None and args.reuse_archive and archive.lookup(item_key(question, answer_key, answer, settings)))
+                or (semantic is not None and semantic.lookup(question, answer_key, answer, settings))):
+            row["cached"] += 1
+            continue
+
+        prompts = item_prompts(args, question, answer_key, answer, prompt_prefix)
+        # Chunk calls overlap within a sample and samples overlap with each other; a reduce call
+        # waits for its chunks
+        chunks = len(prompts) - 1 if len(prompts) > 1 else 0
+        chunk_concurrency = min(capacity, sample_concurrency * min(args.chunk_workers, chunks or 1))
+        other_concurrency = min(capacity, sample_concurrency)
+        for weight in sample_weights:
+            for number, prompt in enumerate(prompts):
+                before = cache.shared_tokens
+                cache.record(prompt)
+                tokens = estimate_tokens(prompt)
+                cached = cache.shared_tokens - before
+                row["calls"] += weight
+                row["promptTokens"] += weight * tokens
+                row["cachedPromptTokens"] += weight * cached
+                seconds = (tokens - cached) * prompt_cost + completion_seconds
+                row["seconds"] += weight * seconds / (chunk_concurrency if number < chunks else other_concurrency)
+
+    for row in rows.values():
+        row["completionTokens"] = int(row["calls"] * completion_per_call)
+        row["calls"] = int(round(row["calls"]))
+        row["promptTokens"] = int(round(row["promptTokens"]))
+        row["cachedPromptTokens"] = int(round(row["cachedPromptTokens"]))
+        row["seconds"] = round(row["seconds"], 1)
+
+    totals = {
+        field: sum(row[field] for row in rows.values())
+        for field in ("items", "cached", "calls", "promptTokens", "cachedPromptTokens", "completionTokens", "seconds")
+    }
+    totals["seconds"] = round(totals["seconds"], 1)
+    return {
+        "students": len(rows),
+        "questions": len(rubric),
+        "schedule": args.schedule,
+        "samplesPerItem": samples,
+        # Calls of one item that overlap at most
+        "concurrency": min(capacity, sample_concurrency * (args.chunk_workers if args.long_answers else 1)),
+        "history": history,
+        "totals": totals,
+        "perStudent": list(rows.values()),
+        "outliers": [f"{row['student']}: {flag}" for row in rows.values() for flag in row["flags"]]
+    }
+
+
+def format_duration(seconds):
+    hours, rest = divmod(int(seconds), 3600)
+    return f"{hours}h {rest // 60:02d}m" if hours else f"{rest // 60}m {rest % 60:02d}s"
+
+
+def format_plan(plan):
+    """Lines of a human-readable plan"""
+    totals = plan["totals"]
+    history = plan["history"]
+    lines = [
+        f"Plan: {plan['students']} students x {plan['questions']} questions = {totals['items']} items "
+        f"({plan['schedule']} schedule)",
+        f"  reused grades:           {totals['cached']} items",
+        f"  model calls:             {totals['calls']}"
+        + (f" ({plan['samplesPerItem']:.1f} samples per item)" if plan["samplesPerItem"] != 1 else ""),
+        f"  prompt tokens:           ~{totals['promptTokens']} (~{totals['cachedPromptTokens']} from the prompt cache)",
+        f"  completion tokens:       ~{totals['completionTokens']}",
+        f"  estimated wall time:     {format_duration(totals['seconds'])}"
+        + (f" (up to {plan['concurrency']} calls at once)" if plan["concurrency"] > 1 else ""),
+        "  speeds: " + (
+            (f"{history['promptTokensPerSecond']:.0f} prompt / " if history["promptTokensPerSecond"] else "")
+            + f"{history['completionTokensPerSecond']:.1f} completion tokens/s, measured on {history['items']} recent items"
+            if history["measured"] else
+            f"no timed items in the completion archive, assuming {DEFAULT_PROMPT_TOKENS_PER_SECOND:.0f} prompt / "
+            f"{DEFAULT_COMPLETION_TOKENS_PER_SECOND:.0f} completion tokens/s"
+        ),
+        "",
+        f"{'student':<30} {'items':>6} {'reused':>6} {'calls':>6} {'prompt tok':>11} {'compl. tok':>11} {'time':>9}"
+    ]
+    for row in plan["perStudent"]:
+        lines.append(
+            f"{row['student'][:30]:<30} {row['items']:>6} {row['cached']:>6} {row['calls']:>6} "
+            f"{row['promptTokens']:>11} {row['completionTokens']:>11} {format_duration(row['seconds']):>9}"
+        )
+    if plan["outliers"]:
+        lines += ["", f"Outliers ({len(plan['outliers'])}):"] + [f"  {flag}" for flag in plan["outliers"]]
+    return lines
@@ -0,0 +1,240 @@
+"""
+Semantic cache of graded answers, shared across runs.
+
+The same questions come back every semester and many answers are close
+paraphrases of answers graded before. With --semantic-cache the grader looks up
+every answer in a persistent similarity index over previously graded answers to
+the same question (same question, answer key and grading settings); when the
+closest one is at least THRESHOLD similar, its grade is reused and the model is
+not called. The reused record names the answer it came from and the similarity.
+
+Vectors are computed locally, without a model: each answer becomes a hashed
+bag of its words and character trigrams (log-scaled counts, L2-normalized), so
+the cosine similarity of two answers measures how much wording they share. The
+index keeps one NumPy matrix per question and searches it exactly with a single
+matrix-vector product, which is fast enough for tens of thousands of answers per
+question.
+
+Shared wording is not shared meaning: "TCP is a connection-oriented protocol"
+and "TCP is not a connection-oriented protocol" are over 0.98 similar. A grade is
+therefore only reused when the two answers also agree on the markers that flip
+or change a statement while barely moving the vector: the number of negations
+(NEGATIONS, with "n't" spelled out) and the numbers they mention ("5 ms" and
+"50 ms"). Everything else is left to the similarity threshold, so paraphrases
+that swap a word or two ("which" for "that", "uses" for "relies on") still reuse
+a grade.
+
+The index is a SQLite database in WAL mode, like the completion archive:
+
+    answers  question_key, answer_hash, vector, record, added_at
+
+Only items the model graded with a numeric score are indexed; reused ones are
+not, so a grade is never copied from a copy. To seed the index from the graded
+items already in the completion archive:
+
+    python semantic_cache.py --build-from-archive
+    python semantic_cache.py                  # size of the index
+"""
+import argparse
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import zlib
+from collections import Counter
+from datetime import datetime
+
+import numpy as np
+
+from completion_archive import ARCHIVE_FILE, CompletionArchive, item_key, pack, unpack
+
+SEMANTIC_CACHE_FILE = "semantic_cache.db"
+# Cosine similarity from which a historical grade is reused
+DEFAULT_THRESHOLD = 0.95
+# Length of the hashed vectors
+DIMENSIONS = 1024
+
+WORD_PATTERN = re.compile(r"\w+")
+NUMBER_PATTERN = re.compile(r"\d+(?:[.,]\d+)*")
+# Words that turn a statement into its opposite; two answers sharing a grade use as many of them
+NEGATIONS = frozenset("""
+not no never none nobody nothing neither nor nowhere without cannot
+""".split())
+
+
+def question_key(question, answer_key, settings):
+    """Hash of everything but the answer that determines an item's result"""
+    return item_key(question, answer_key, "", settings)
+
+
+def _answer_hash(answer):
+    return hashlib.sha1(" ".join(answer.split()).lower().encode("utf-8")).hexdigest()
+
+
+def vectorize(text):
+    """Unit-length hashed vector of the words and character trigrams of a text"""
+    counts = Counter()
+    for word in WORD_PATTERN.findall(text.lower()):
+        counts[word] += 1
+        padded = f" {word} "
+        for start in range(len(padded) - 2):
+            counts["#" + padded[start:start + 3]] += 1
+    vector = np.zeros(DIMENSIONS, dtype=np.float32)
+    for feature, count in counts.items():
+        # crc32 rather than hash(), which differs between processes
+        vector[zlib.crc32(feature.encode("utf-8")) % DIMENSIONS] += 1 + math.log(count)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def meaning_markers(text):
+    """(negations, numbers) of a text, which must match for a grade to carry over"""
+    text = re.sub(r"n't\b", " not", text.lower().replace("\u2019", "'"))
+    negations = sum(1 for word in WORD_PATTERN.findall(text) if word in NEGATIONS)
+    return negations, frozenset(NUMBER_PATTERN.findall(text))
+
+
+class SemanticCache:
+    """Similarity index of graded answers; use from one thread"""
+
+    def __init__(self, path=SEMANTIC_CACHE_FILE, threshold=None):
+        self.path = path
+        self.threshold = DEFAULT_THRESHOLD if threshold is None else threshold
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                question_key TEXT NOT NULL,
+                answer_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                record BLOB NOT NULL,
+                added_at REAL NOT NULL,
+                PRIMARY KEY (question_key, answer_hash)
+            )
+        """)
+        # question key -> (answer hashes, matrix of their vectors), loaded on first use
+        self._indexes = {}
+        self.lookups = 0
+        self.hits = 0
+
+    def _index(self, key):
+        if key not in self._indexes:
+            rows = self.conn.execute(
+                "SELECT answer_hash, vector FROM answers WHERE question_key = ?", (key,)
+            ).fetchall()
+            hashes = [answer_hash for answer_hash, _ in rows]
+            matrix = (np.frombuffer(b"".join(vector for _, vector in rows), dtype=np.float32).reshape(len(rows), DIMENSIONS)
+                      if rows else np.zeros((0, DIMENSIONS), dtype=np.float32))
+            self._indexes[key] = (hashes, matrix)
+        return self._indexes[key]
+
+    def lookup(self, question, answer_key, answer, settings):
+        """(historical record, similarity) of the closest graded answer at or over the threshold, or None"""
+        self.lookups += 1
+        key = question_key(question, answer_key, settings)
+        hashes, matrix = self._index(key)
+        if not hashes:
+            return None
+        similarities = matrix @ vectorize(answer)
+        markers = meaning_markers(answer)
+        # Best candidates first; the first one with the same negations and numbers wins
+        for position in np.argsort(similarities)[::-1]:
+            similarity = float(similarities[position])
+            if similarity < self.threshold:
+                return None
+            row = self.conn.execute(
+                "SELECT record FROM answers WHERE question_key = ? AND answer_hash = ?", (key, hashes[position])
+            ).fetchone()
+            if row is None:
+                continue
+            record = unpack(row[0])
+            if meaning_markers(str(record.get("Student Answer", ""))) == markers:
+                self.hits += 1
+                return record, min(1.0, similarity)
+        return None
+
+    def add(self, record, settings):
+        """Index a graded record; records without a numeric score are skipped"""
+        if not isinstance(record.get("Score"), (int, float)) or record.get("Reused From"):
+            return False
+        key = question_key(record["Question"], record["Answer Key"], settings)
+        answer = str(record.get("Student Answer", ""))
+        answer_hash = _answer_hash(answer)
+        vector = vectorize(answer)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?)",
+            (key, answer_hash, vector.tobytes(), pack(record), datetime.now().timestamp())
+        )
+        if key in self._indexes:
+            hashes, matrix = self._indexes[key]
+            if answer_hash in hashes:
+                matrix = matrix.copy()
+                matrix[hashes.index(answer_hash)] = vector
+            else:
+                hashes = hashes + [answer_hash]
+                matrix = np.vstack([matrix, vector])
+            self._indexes[key] = (hashes, matrix)
+        return True
+
+    def stats(self):
+        answers, questions = self.conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT question_key) FROM answers"
+        ).fetchone()
+        return {
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hitRate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            "answers": answers,
+            "questions": questions,
+            "threshold": self.threshold
+        }
+
+    def summary(self):
+        stats = self.stats()
+        return (
+            f"Semantic cache: {stats['hits']} of {stats['lookups']} answers reused ({stats['hitRate']:.0%}) "
+            f"at similarity >= {stats['threshold']}; index holds {stats['answers']} answers "
+            f"to {stats['questions']} questions"
+        )
+
+    def close(self):
+        self.conn.close()
+
+
+def build_from_archive(cache, archive):
+    """Index every graded item of the completion archive, oldest run first; returns the items indexed"""
+    indexed = 0
+    for run_id, _ in reversed(archive.runs()):
+        for record, settings, _ in archive.items(run_id):
+            indexed += cache.add(record, settings)
+    return indexed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the semantic cache of graded answers")
+    parser.add_argument("--cache", default=SEMANTIC_CACHE_FILE, help="Semantic cache (default: %(default)s)")
+    parser.add_argument("--archive", default=ARCHIVE_FILE, help="Completion archive (default: %(default)s)")
+    parser.add_argument("--build-from-archive", action="store_true",
+                        help="Index the graded items of every run in the completion archive")
+    args = parser.parse_args()
+
+    cache = SemanticCache(args.cache)
+    try:
+        if args.build_from_archive:
+            if not os.path.exists(args.archive):
+                parser.error(f"No completion archive at {args.archive}; it is written by auto_checker_v3.py")
+            archive = CompletionArchive(args.archive)
+            try:
+                print(f"Indexed {build_from_archive(cache, archive)} graded items from {args.archive}")
+            finally:
+                archive.close()
+        stats = cache.stats()
+        print(f"{args.cache}: {stats['answers']} answers to {stats['questions']} questions")
+    finally:
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+"""
+Fast JSON serialization shared by the API modules.
+
+orjson is optional; it serializes large result payloads several times faster than
+the standard json module, which is used as a fallback.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dump_json_bytes(data):
+    """Serialize data to UTF-8 JSON bytes, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(data, ensure_ascii=False).encode('utf-8')
@@ -12,7 +12,8 @@ export const ResultsProvider = ({ children }) => {
     complete: false,
     progress: 0,
     message: "",
-    error: null
+    error: null,
+    cancelled: false
   });
   const [resultsExist, setResultsExist] = useState(false);
 
@@ -45,6 +46,17 @@ export const ResultsProvider = ({ children }) => {
     }
   };
 
+  const cancelEvaluation = async () => {
+    try {
+      await api.cancelEvaluation();
+    } catch (error) {
+      setEvaluationStatus(prev => ({
+        ...prev,
+        error: 'Failed to cancel evaluation'
+      }));
+    }
+  };
+
   const pollStatus = async () => {
     try {
       const status = await api.checkStatus();
@@ -77,6 +89,7 @@ export const ResultsProvider = ({ children }) => {
       evaluationStatus,
       resultsExist,
       startEvaluation,
+      cancelEvaluation,
       downloadResults,
       checkResultsExist
     }}>
@@ -10,6 +10,7 @@ const EvaluationPage = () => {
     evaluationStatus, 
     resultsExist, 
     startEvaluation, 
+    cancelEvaluation,
     downloadResults 
   } = useResults();
 
@@ -32,6 +33,15 @@ const EvaluationPage = () => {
                 <p className="processing-message">
                   Our system is evaluating all student answers. This may take several minutes depending on the number of students and questions.
                 </p>
+                {evaluationStatus.running && (
+                  <button
+                    onClick={cancelEvaluation}
+                    disabled={evaluationStatus.cancelled}
+                    className="btn btn-secondary"
+                  >
+                    {evaluationStatus.cancelled ? 'Cancelling...' : 'Cancel Evaluation'}
+                  </button>
+                )}
               </div>
             ) : (
               <>
@@ -59,7 +69,7 @@ const EvaluationPage = () => {
 
                 {evaluationStatus.complete && (
                   <div className="success-message">
-                    Evaluation completed successfully!
+                    {evaluationStatus.message || 'Evaluation completed successfully!'}
                   </div>
                 )}
 
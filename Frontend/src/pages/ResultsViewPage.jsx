@@ -71,25 +71,28 @@ const ResultsViewPage = () => {
           throw new Error('No evaluation results available yet. Please run an evaluation first.');
         }
         
-        // Now fetch the JSON data
-        const data = await api.getStudentResults();
+        // Stream the JSON data so the first students render while the rest arrive
+        setStudents([]);
+        setCurrentStudentIndex(0);
+        
+        const count = await api.streamStudentResults((student, index) => {
+          // Ensure each student has the required properties
+          const validatedStudent = {
+            ...student,
+            id: student.id || `student-${index}`,
+            questionNumber: student.questionNumber || index + 1,
+            // Ensure other required properties have defaults if missing
+          };
+          
+          setStudents(prev => [...prev, validatedStudent]);
+          setLoading(false);
+        });
         
-        if (!data || !data.students || data.students.length === 0) {
+        if (count === 0) {
           throw new Error('No student results data received from server');
         }
         
-        console.log('Loaded student data:', data.students);
-        
-        // Ensure each student has the required properties
-        const validatedStudents = data.students.map((student, index) => ({
-          ...student,
-          id: student.id || `student-${index}`,
-          questionNumber: student.questionNumber || index + 1,
-          // Ensure other required properties have defaults if missing
-        }));
-        
-        setStudents(validatedStudents);
-        setCurrentStudentIndex(0);
+        console.log(`Loaded data for ${count} students`);
         setLoading(false);
       } catch (err) {
         console.error('Failed to load results:', err);
@@ -46,6 +46,50 @@ const getStudentResults = async () => {
   }
 };
 
+// Stream student results as NDJSON, calling onStudent as each one arrives
+const streamStudentResults = async (onStudent) => {
+  try {
+    const response = await fetch(`${API_URL}/api/students_results?format=ndjson`, {
+      headers: {
+        'Accept': 'application/x-ndjson',
+      },
+      mode: 'cors',
+      credentials: 'omit'
+    });
+    
+    if (!response.ok) {
+      const error = await response.json();
+      throw new Error(error.message || 'Failed to fetch student results');
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = '';
+    let count = 0;
+    
+    while (true) {
+      const { done, value } = await reader.read();
+      buffered += decoder.decode(value || new Uint8Array(), { stream: !done });
+      
+      // Every complete line is one student
+      const lines = buffered.split('\n');
+      buffered = done ? '' : lines.pop();
+      for (const line of lines) {
+        if (line.trim()) {
+          onStudent(JSON.parse(line), count++);
+        }
+      }
+      
+      if (done) break;
+    }
+    
+    return count;
+  } catch (error) {
+    console.error('API error in streamStudentResults:', error);
+    throw error;
+  }
+};
+
 export const api = {
   // Start the evaluation process
   startEvaluation: async () => {
@@ -71,6 +115,72 @@ export const api = {
     }
   },
 
+  // Cancel the running evaluation; results graded so far are kept
+  cancelEvaluation: async () => {
+    try {
+      const response = await fetch(`${API_URL}/cancel_evaluation`, {
+        method: 'POST',
+        mode: 'cors',
+        credentials: 'omit'
+      });
+      
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+      
+      return await response.json();
+    } catch (error) {
+      console.error('Error cancelling evaluation:', error);
+      throw error;
+    }
+  },
+
+  // Regrade one student's answer to one question ahead of any running evaluation
+  regradeAnswer: async (student, question, answer) => {
+    try {
+      const response = await fetch(`${API_URL}/api/regrade`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        mode: 'cors',
+        credentials: 'omit',
+        body: JSON.stringify(answer === undefined ? { student, question } : { student, question, answer })
+      });
+      
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+      
+      return await response.json();
+    } catch (error) {
+      console.error('Error regrading answer:', error);
+      throw error;
+    }
+  },
+
+  // Estimate calls, tokens and wall time of an evaluation of the uploaded answers
+  planEvaluation: async (exam = {}) => {
+    try {
+      const params = new URLSearchParams(
+        Object.entries(exam).filter(([, value]) => value !== undefined && value !== null && value !== '')
+      );
+      const response = await fetch(`${API_URL}/api/plan?${params}`, {
+        mode: 'cors',
+        credentials: 'omit'
+      });
+
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+
+      return await response.json();
+    } catch (error) {
+      console.error('Error planning evaluation:', error);
+      throw error;
+    }
+  },
+
   // Check evaluation status
   checkStatus: async () => {
     try {
@@ -118,5 +228,8 @@ export const api = {
   viewResults,
 
   // Get student results
-  getStudentResults
+  getStudentResults,
+
+  // Stream student results one at a time
+  streamStudentResults
 };
\ No newline at end of file
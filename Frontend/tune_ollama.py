@@ -0,0 +1,282 @@
+"""
+Tune Ollama's runtime options for grading throughput on this host.
+
+Ollama's defaults for num_thread, num_ctx, num_batch and num_predict, and the
+number of calls sent at once, are rarely the fastest on a CPU-only server. This
+command grades a representative sample of items under each candidate setting and
+measures model calls per second and how far the scores move from those of
+Ollama's defaults:
+
+    python tune_ollama.py                       # sample from the completion archive
+    python tune_ollama.py --items 8 --threads 4,8,16 --parallel 1,2
+
+Every setting grades each item --repeats times and is compared on the mean score
+per item, since a single pass at the model's sampling temperature cannot tell a
+drift from noise. The baseline's own repeats give the noise level, which the
+report states next to the tolerance.
+
+The options are swept one at a time (coordinate descent), with the items graded
+one call at a time as in a plain grader run: each option keeps the fastest value
+whose mean scores stay within --tolerance of the baseline on average and parse
+to a number at least as often, and the next option is swept with it. Every
+setting is warmed up with one untimed call first, since Ollama reloads the
+model when num_ctx changes.
+
+Parallelism is measured the way the grader uses it: the grader takes items one
+at a time, and only the consistency samples (--sample-workers) and long-answer
+chunks (--chunk-workers) of one item run concurrently. Each --parallel value
+therefore sends the repeats of one item that many at a time, items one after
+another. Parallel calls only help when the server runs with OLLAMA_NUM_PARALLEL
+of at least that many; plain runs make one call at a time whatever the profile
+says.
+
+The best setting is written to the profile (OLLAMA_PROFILE, default
+ollama_profile.json). The grader and the app load it automatically: its options
+go with every model call and warm-up, and its parallelism is the default for
+--chunk-workers and --sample-workers.
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from auto_checker_v3 import (
+    CHUNK_INSTRUCTIONS, EVALUATION_INSTRUCTIONS, OLLAMA_ENDPOINTS, OLLAMA_MODEL, STUDENT_ANSWERS_FOLDER, STUDENT_FILE_EXTENSIONS,
+    ModelCallFailed, OllamaLLM, RetryingLLM, evaluate_answer, layout_prompt
+)
+from cohort_input import iter_student_answers
+from completion_archive import ARCHIVE_FILE, CompletionArchive
+from consistency import DEFAULT_TOLERANCE
+from long_answers import DEFAULT_TOKEN_BUDGET, estimate_tokens
+from ollama_client import OLLAMA_CLIENT_CONFIG, OllamaPool
+from rubrics import build_prompt_prefix, registry
+
+# Options in the order they are swept; the first value of each list is tried first
+SWEPT_OPTIONS = ("num_thread", "num_batch", "num_ctx", "num_predict")
+DEFAULT_ITEMS = 6
+# Times each item is graded per setting
+DEFAULT_REPEATS = 3
+# Context sizes above the largest prompt and completion that are worth trying
+CONTEXT_SIZES = (2048, 4096, 8192)
+# Completion tokens left for the model's reasoning when num_predict is not limited
+COMPLETION_ALLOWANCE = 1024
+
+
+def _int_list(text):
+    return [int(value) for value in text.split(",") if value.strip()]
+
+
+def sample_items(archive_path, limit):
+    """(question, answer key, answer) of up to limit graded items, spread over the questions
+
+    Taken from the latest run of the completion archive, else from the student answers folder.
+    """
+    items = []
+    if os.path.exists(archive_path):
+        archive = CompletionArchive(archive_path)
+        try:
+            items = [
+                (record["Question"], record["Answer Key"], record["Student Answer"])
+                for record, _, completions in archive.items() if completions
+            ]
+        finally:
+            archive.close()
+    if not items:
+        rubric = registry.get()
+        files = sorted(
+            os.path.join(STUDENT_ANSWERS_FOLDER, f) for f in os.listdir(STUDENT_ANSWERS_FOLDER)
+            if f.endswith(STUDENT_FILE_EXTENSIONS)
+        )
+        items = [
+            (question, answer_key, answers[i])
+            for _, answers in iter_student_answers(files)
+            for i, question, answer_key, _ in rubric.items() if answers.get(i)
+        ]
+    # Every k-th item, so the sample covers the questions and answer lengths of the run
+    step = max(1, len(items) // limit)
+    return items[::step][:limit]
+
+
+def measure(pool, model, items, options, parallel, repeats, timeout):
+    """Grade every item repeats times with these options, parallel calls at a time within an item
+
+    Returns (model calls per second, [scores of each item]).
+    """
+    client = OllamaLLM(pool, model, timeout=timeout, options=options or None)
+    llm = RetryingLLM(client, retries=0)
+
+    def grade(item):
+        question, answer_key, answer = item
+        try:
+            return evaluate_answer(llm, question, answer_key, answer)[0]
+        except ModelCallFailed:
+            return None
+
+    # Untimed: loads the model with these options
+    grade(items[0])
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        scores = [list(executor.map(grade, [item] * repeats)) for item in items]
+    return len(items) * repeats / (time.perf_counter() - started), scores
+
+
+def _numeric(scores):
+    return [score for score in scores if isinstance(score, (int, float))]
+
+
+def score_drift(scores, baseline):
+    """Mean absolute difference of the items' mean scores from the baseline's, over items scored by both"""
+    pairs = [(_numeric(a), _numeric(b)) for a, b in zip(scores, baseline)]
+    differences = [abs(statistics.mean(a) - statistics.mean(b)) for a, b in pairs if a and b]
+    return statistics.mean(differences) if differences else float("inf")
+
+
+def score_noise(scores):
+    """Mean absolute deviation of the repeats of an item from their mean: how much sampling alone moves a score"""
+    deviations = [
+        statistics.mean(abs(score - statistics.mean(numeric)) for score in numeric)
+        for numeric in map(_numeric, scores) if len(numeric) > 1
+    ]
+    return statistics.mean(deviations) if deviations else 0.0
+
+
+def numeric_rate(scores):
+    calls = [score for item_scores in scores for score in item_scores]
+    return len(_numeric(calls)) / len(calls)
+
+
+def candidates(args, items):
+    """Values to try per option; None stands for Ollama's default
+
+    num_ctx must hold the largest prompt the grader sends for these questions, not just the
+    sampled ones: a whole sampled answer, or a long-answer chunk prompt with a full
+    --long-answer-tokens budget, plus room for the completion.
+    """
+    cpus = os.cpu_count() or 4
+    longest = 0
+    for q, k, a in items:
+        prefix = build_prompt_prefix(q, k)
+        longest = max(
+            longest,
+            estimate_tokens(layout_prompt(prefix, f"Student Answer: {a}\n\n", EVALUATION_INSTRUCTIONS)),
+            estimate_tokens(layout_prompt(
+                prefix, "Student Answer (part 1 of 1): \n\n", CHUNK_INSTRUCTIONS + EVALUATION_INSTRUCTIONS
+            )) + args.long_answer_tokens
+        )
+    predict = [n for n in args.predict if n > 0]
+    needed = longest + (max(predict) if predict else COMPLETION_ALLOWANCE)
+    return {
+        "num_thread": args.threads or sorted({max(1, cpus // 2), cpus}),
+        "num_batch": args.batch,
+        "num_ctx": args.ctx or [size for size in CONTEXT_SIZES if size >= needed] or [CONTEXT_SIZES[-1]],
+        "num_predict": args.predict
+    }
+
+
+def tune(pool, model, items, args, log=print):
+    """Sweep the options and parallelism; returns the profile"""
+    timeout = args.call_timeout
+    repeats = max(1, args.repeats)
+    baseline_rate, baseline = measure(pool, model, items, {}, 1, repeats, timeout)
+    baseline_numeric = numeric_rate(baseline)
+    noise = score_noise(baseline)
+    log(f"baseline (Ollama defaults): {baseline_rate:.3f} calls/s, {baseline_numeric:.0%} numeric scores, "
+        f"score noise {noise:.1f} over {repeats} repeats")
+    if noise > args.tolerance:
+        log(f"warning: scores move {noise:.1f} between repeats alone, more than the tolerance of {args.tolerance}; "
+            f"use more --repeats or --items for a reliable comparison")
+
+    best = {"options": {}, "parallel": 1, "callsPerSecond": baseline_rate, "drift": 0.0}
+    sweep = [{"options": {}, "parallel": 1, "callsPerSecond": round(baseline_rate, 4), "drift": 0.0,
+              "numericRate": baseline_numeric, "accepted": True}]
+
+    def trial(options, parallel):
+        rate, scores = measure(pool, model, items, options, parallel, max(repeats, parallel), timeout)
+        drift = score_drift(scores, baseline)
+        accepted = numeric_rate(scores) >= baseline_numeric and drift <= args.tolerance
+        sweep.append({"options": options, "parallel": parallel, "callsPerSecond": round(rate, 4),
+                      "drift": round(drift, 2), "numericRate": numeric_rate(scores), "accepted": accepted})
+        log(f"{options} x{parallel}: {rate:.3f} calls/s, score drift {drift:.1f}"
+            + ("" if accepted else " (rejected)"))
+        if accepted and rate > best["callsPerSecond"]:
+            best.update(options=options, parallel=parallel, callsPerSecond=rate, drift=drift)
+
+    for name, values in candidates(args, items).items():
+        for value in values:
+            trial(dict(best["options"], **{name: value}), best["parallel"])
+    for parallel in args.parallel:
+        if parallel != best["parallel"]:
+            trial(best["options"], parallel)
+
+    return {
+        "model": model,
+        "options": best["options"],
+        "parallel": best["parallel"],
+        "callsPerSecond": round(best["callsPerSecond"], 4),
+        "baselineCallsPerSecond": round(baseline_rate, 4),
+        "scoreDrift": round(best["drift"], 2),
+        "scoreNoise": round(noise, 2),
+        "items": len(items),
+        "repeats": repeats,
+        "cpus": os.cpu_count(),
+        "endpoints": [endpoint.url for endpoint in pool.endpoints],
+        "tunedAt": datetime.now().isoformat(),
+        "sweep": sweep
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune Ollama's runtime options for grading throughput")
+    parser.add_argument("--items", type=int, default=DEFAULT_ITEMS, help="Items graded per setting (default: %(default)s)")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS,
+                        help="Times each item is graded per setting (default: %(default)s)")
+    parser.add_argument("--archive", default=ARCHIVE_FILE, help="Completion archive to sample items from")
+    parser.add_argument("--endpoints", default=OLLAMA_ENDPOINTS, help="Ollama base URLs (default: %(default)s)")
+    parser.add_argument("--threads", type=_int_list, help="num_thread values (default: half and all CPUs)")
+    parser.add_argument("--batch", type=_int_list, default=[256, 512], help="num_batch values (default: 256,512)")
+    parser.add_argument("--ctx", type=_int_list, help="num_ctx values (default: those that fit the largest prompt)")
+    parser.add_argument("--long-answer-tokens", type=int, default=DEFAULT_TOKEN_BUDGET,
+                        help="The grader's --long-answer-tokens, which bounds its chunk prompts (default: %(default)s)")
+    parser.add_argument("--predict", type=_int_list, default=[1024, 2048],
+                        help="num_predict values (default: 1024,2048)")
+    parser.add_argument("--parallel", type=_int_list, default=[1, 2, 4],
+                        help="Concurrent calls within one item to try, as for --sample-workers and "
+                             "--chunk-workers (default: 1,2,4)")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Largest mean score drift from the baseline to accept (default: %(default)s)")
+    parser.add_argument("--call-timeout", type=int, default=600, help="Seconds per model call (default: %(default)s)")
+    parser.add_argument("--output", default=OLLAMA_CLIENT_CONFIG["PROFILE"] or "ollama_profile.json",
+                        help="Profile to write (default: %(default)s)")
+    parser.add_argument("--dry-run", action="store_true", help="Print the profile instead of writing it")
+    args = parser.parse_args()
+
+    items = sample_items(args.archive, args.items)
+    if not items:
+        parser.error("No graded items in the completion archive and no student answers to sample")
+    print(f"Tuning {OLLAMA_MODEL} on {len(items)} items, {max(1, args.repeats)} repeats each")
+
+    pool = OllamaPool(args.endpoints)
+    try:
+        profile = tune(pool, OLLAMA_MODEL, items, args)
+    finally:
+        pool.close()
+
+    speedup = profile["callsPerSecond"] / profile["baselineCallsPerSecond"] if profile["baselineCallsPerSecond"] else 1
+    print(f"Best: {profile['options']} with {profile['parallel']} concurrent call(s) per item, "
+          f"{profile['callsPerSecond']:.3f} calls/s ({speedup:.2f}x the defaults), score drift {profile['scoreDrift']} "
+          f"(noise {profile['scoreNoise']})")
+    if args.dry_run:
+        print(json.dumps(profile, indent=2))
+        return
+    temporary = args.output + ".tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=2)
+    os.replace(temporary, args.output)
+    print(f"Profile saved to {args.output}; the grader and the app load it on their next start")
+
+
+if __name__ == "__main__":
+    main()
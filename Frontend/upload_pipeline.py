@@ -0,0 +1,223 @@
+"""
+Upload-triggered evaluation pipeline.
+
+Instead of waiting for /start_evaluation to grade the whole student answers
+folder, every uploaded file (or a file dropped into the folder) is queued for
+grading as soon as it arrives. Files are graded in small batches by the usual
+job runner, appending to the current records journal, so each student's results
+appear in the report pages and analytics as soon as they are graded.
+
+A file is only queued once it has been quiet for the debounce delay, so a file
+still being written or uploaded several times in quick succession is graded once.
+A file that changes again after it was graded is graded again, replacing its
+earlier results.
+
+Whole-cohort .jsonl/.csv uploads are queued the same way and graded as a stream.
+
+The folder is watched with inotify when the optional inotify_simple package is
+installed, and polled otherwise. Enable with EVALUATION_PIPELINE=1.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from cohort_input import STUDENT_FILE_EXTENSIONS
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:  # Linux-only optional dependency; fall back to polling
+    INotify = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DEBOUNCE_SECONDS = 2.0
+DEFAULT_POLL_SECONDS = 1.0
+# Seconds to wait before retrying a batch while another evaluation job is active
+BUSY_RETRY_SECONDS = 5.0
+# Recently handed-over files listed by status()
+RECENT_LIMIT = 50
+
+
+def exam_from_filename(filename):
+    """Exam of an uploaded file named "<subject>_<year>_<semester>_<timestamp>.txt", or None"""
+    stem, _ = os.path.splitext(os.path.basename(filename))
+    parts = stem.split("_")
+    if len(parts) != 4:
+        return None
+    subject, year, semester, _ = parts
+    return {"subject": subject, "year": year, "semester": semester}
+
+
+def _signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class UploadPipeline:
+    """Watches the student answers folder and hands settled files to run_batch
+
+    run_batch(exam, filenames) starts or queues a job grading the files and returns
+    its id, or None when it could not (another job is active), in which case the
+    batch is retried later. job_status(job_id) returns the job's /status payload;
+    files stay "queued" in the recent list until it reports the job finished, and
+    only then get their "gradedAt" time.
+    """
+
+    def __init__(self, folder, run_batch, job_status=None, debounce=DEFAULT_DEBOUNCE_SECONDS,
+                 poll_interval=DEFAULT_POLL_SECONDS):
+        self.folder = folder
+        self.run_batch = run_batch
+        self.job_status = job_status
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.mode = "inotify" if INotify is not None else "polling"
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._pending = {}   # filename -> time of the last change
+        self._seen = {}      # filename -> signature when last queued
+        self._grading = []
+        self._recent = []
+        self._threads = []
+
+    def start(self):
+        """Start watching; files already in the folder are not queued"""
+        with self._lock:
+            if self._threads:
+                return
+            for name in self._list_files():
+                self._seen[name] = _signature(os.path.join(self.folder, name))
+            watch = self._watch_inotify if self.mode == "inotify" else self._watch_polling
+            self._threads = [
+                threading.Thread(target=watch, name="upload-watch", daemon=True),
+                threading.Thread(target=self._grade_loop, name="upload-grade", daemon=True)
+            ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Upload pipeline watching {self.folder} ({self.mode}, debounce {self.debounce}s)")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _list_files(self):
+        try:
+            return [name for name in os.listdir(self.folder) if name.endswith(STUDENT_FILE_EXTENSIONS)]
+        except OSError:
+            return []
+
+    def notify(self, path):
+        """Queue a new or changed file; repeated calls within the debounce delay coalesce"""
+        name = os.path.basename(path)
+        if not name.endswith(STUDENT_FILE_EXTENSIONS):
+            return
+        with self._lock:
+            self._pending[name] = time.monotonic()
+        self._wake.set()
+
+    def _watch_polling(self):
+        while not self._stop.wait(self.poll_interval):
+            for name in self._list_files():
+                signature = _signature(os.path.join(self.folder, name))
+                if signature is not None and self._seen.get(name) != signature:
+                    self._seen[name] = signature
+                    self.notify(name)
+
+    def _watch_inotify(self):
+        inotify = INotify()
+        inotify.add_watch(self.folder, inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO)
+        while not self._stop.is_set():
+            for event in inotify.read(timeout=int(self.poll_interval * 1000)):
+                self.notify(event.name)
+
+    def _take_batch(self):
+        """Remove and return (exam, filenames) of settled files for one exam, or None"""
+        now = time.monotonic()
+        with self._lock:
+            settled = sorted(name for name, changed in self._pending.items() if now - changed >= self.debounce)
+            if not settled:
+                return None
+            exam = exam_from_filename(settled[0])
+            batch = [name for name in settled if exam_from_filename(name) == exam]
+            for name in batch:
+                del self._pending[name]
+            self._grading = batch
+            return exam, batch
+
+    def _grade_loop(self):
+        while not self._stop.is_set():
+            self._update_recent()
+            taken = self._take_batch()
+            if taken is None:
+                # Sleep until the next file could settle or a new one arrives
+                self._wake.wait(self.debounce / 2)
+                self._wake.clear()
+                continue
+
+            exam, batch = taken
+            try:
+                job_id = self.run_batch(exam, batch)
+            except Exception as e:
+                # Not retried until the file changes again
+                logger.error(f"Upload pipeline batch failed: {str(e)}", exc_info=True)
+                entries = [{"file": name, "jobId": None, "state": "failed", "error": str(e)} for name in batch]
+                with self._lock:
+                    self._grading = []
+                    self._recent = (entries + self._recent)[:RECENT_LIMIT]
+                continue
+            with self._lock:
+                self._grading = []
+                if job_id is None:
+                    # Another evaluation is running; try again later unless the file changed meanwhile
+                    retry_at = time.monotonic() - self.debounce + BUSY_RETRY_SECONDS
+                    for name in batch:
+                        self._pending.setdefault(name, retry_at)
+                    continue
+                queued = datetime.now().isoformat()
+                entries = [{"file": name, "jobId": job_id, "state": "queued", "queuedAt": queued} for name in batch]
+                self._recent = (entries + self._recent)[:RECENT_LIMIT]
+            self._update_recent()
+
+    def _update_recent(self):
+        """Mark the queued files whose job has finished as graded, failed or cancelled"""
+        if self.job_status is None:
+            return
+        with self._lock:
+            job_ids = {entry["jobId"] for entry in self._recent if entry["state"] == "queued"}
+        outcomes = {}
+        for job_id in job_ids:
+            try:
+                status = self.job_status(job_id)
+            except Exception as e:
+                logger.warning(f"Could not read the status of job {job_id}: {str(e)}")
+                continue
+            if status["running"]:
+                continue
+            if status["error"]:
+                outcomes[job_id] = {"state": "failed", "error": status["error"]}
+            elif status["complete"]:
+                outcomes[job_id] = {"state": "graded", "gradedAt": datetime.now().isoformat(),
+                                    "message": status["message"]}
+            else:
+                outcomes[job_id] = {"state": "cancelled", "message": status["message"]}
+        if not outcomes:
+            return
+        with self._lock:
+            for entry in self._recent:
+                if entry["state"] == "queued" and entry["jobId"] in outcomes:
+                    entry.update(outcomes[entry["jobId"]])
+
+    def status(self):
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "debounceSeconds": self.debounce,
+                "pending": sorted(self._pending),
+                "grading": list(self._grading),
+                "recent": [dict(entry) for entry in self._recent]
+            }